@@ -1,19 +1,21 @@
+import asyncio
+import io
 from datetime import datetime
 from typing import Optional
 from bson import ObjectId
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, UploadFile
 from fastapi.security import OAuth2PasswordRequestForm
 import cloudinary.uploader
+from PIL import Image, ImageOps
 
 from ..core.config import settings
-from ..core.auth import create_access_token, get_current_user, hash_password, verify_password
-from ..db.mongodb import users_col, uploads_col, history_col
+from ..core.auth import (
+    PasswordQueueFull, create_access_token, get_current_user, invalidate_user, password_hasher
+)
+from ..db.mongodb import users_col
 from ..db.models import UserPublic, Token
+from ..rag_pipeline.account_deletion import account_deletions
 
-# Pinecone setup
-from pinecone import Pinecone
-pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-index = pc.Index(settings.PINECONE_INDEX)
 
 router = APIRouter(tags=["Auth"])
 
@@ -36,9 +38,55 @@ def map_user_public(doc: dict) -> UserPublic:
     )
 
 
+async def hash_or_503(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+def shrink_avatar(data: bytes) -> bytes:
+    """Downscale an avatar to fit AVATAR_MAX_PX square; PNG if it has transparency, else JPEG."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    image.thumbnail((settings.AVATAR_MAX_PX, settings.AVATAR_MAX_PX))
+    out = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(out, format="PNG", optimize=True)
+    else:
+        image.convert("RGB").save(out, format="JPEG", quality=85, optimize=True)
+    return out.getvalue()
+
+
+async def read_avatar(upload: UploadFile) -> bytes:
+    data = await upload.read()
+    try:
+        return await asyncio.to_thread(shrink_avatar, data)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Avatar is not a valid image.")
+
+
+async def upload_avatar(user_id: ObjectId, email: str, data: bytes, upload_id: ObjectId):
+    """
+    Background task: push the avatar to Cloudinary, then point the user at it.
+    Only applies if no newer avatar upload has started since (`avatar_upload_id`).
+    """
+    try:
+        up = await asyncio.to_thread(
+            cloudinary.uploader.upload, data, folder="pdfGpt/users", resource_type="image", unique_filename=True
+        )
+        await users_col().update_one(
+            {"_id": user_id, "avatar_upload_id": upload_id},
+            {"$set": {"avatar_url": up.get("secure_url")}, "$unset": {"avatar_upload_id": ""}},
+        )
+        invalidate_user(email)
+    except Exception as e:
+        print(f"Avatar upload failed for user {user_id}: {e}")
+
+
 # ---- Signup ----
 @router.post("/signup", response_model=UserPublic, status_code=201)
 async def signup(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
@@ -48,22 +96,24 @@ async def signup(
     if await col.find_one({"email": email.lower().strip()}):
         raise HTTPException(status_code=409, detail="Email already registered.")
 
-    avatar_url = None
-    if avatar:
-        up = cloudinary.uploader.upload(
-            avatar.file, folder="pdfGpt/users", resource_type="image", use_filename=True, unique_filename=True
-        )
-        avatar_url = up.get("secure_url")
+    avatar_data = await read_avatar(avatar) if avatar else None
 
     doc = {
         "name": name.strip(),
         "email": email.lower().strip(),
-        "password_hash": hash_password(password),
-        "avatar_url": avatar_url,
+        "password_hash": await hash_or_503(password),
+        "avatar_url": None,
         "created_at": datetime.utcnow(),
     }
+    if avatar_data:
+        # avatar_url is filled in once the background upload finishes
+        doc["avatar_upload_id"] = ObjectId()
     result = await col.insert_one(doc)
     doc["_id"] = result.inserted_id
+    invalidate_user(doc["email"])  # drop a cached "unknown user" entry
+
+    if avatar_data:
+        background_tasks.add_task(upload_avatar, doc["_id"], doc["email"], avatar_data, doc["avatar_upload_id"])
     return map_user_public(doc)
 
 
@@ -75,7 +125,11 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 
     col = users_col()
     user = await col.find_one({"email": email})
-    if not user or not verify_password(password, user["password_hash"]):
+    try:
+        valid = bool(user) and await password_hasher.verify(password, user["password_hash"])
+    except PasswordQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if not valid:
         raise HTTPException(status_code=400, detail="Invalid email or password.")
 
     token = create_access_token(sub=email)
@@ -91,6 +145,7 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 # ---- Update profile ----
 @router.put("/me", response_model=UserPublic)
 async def update_me(
+    background_tasks: BackgroundTasks,
     name: Optional[str] = Form(None),
     password: Optional[str] = Form(None),
     new_avatar: Optional[UploadFile] = File(None),
@@ -99,35 +154,35 @@ async def update_me(
     col = users_col()
     update = {}
 
+    avatar_data = await read_avatar(new_avatar) if new_avatar else None
     if name:
         update["name"] = name.strip()
     if password:
-        update["password_hash"] = hash_password(password)
-    if new_avatar:
-        up = cloudinary.uploader.upload(
-            new_avatar.file, folder="pdfGpt/users", resource_type="image", use_filename=True, unique_filename=True
-        )
-        update["avatar_url"] = up.get("secure_url")
+        update["password_hash"] = await hash_or_503(password)
+    if avatar_data:
+        # The current avatar stays until the background upload replaces it
+        update["avatar_upload_id"] = ObjectId()
 
     if update:
         await col.update_one({"_id": ObjectId(current_user["_id"])}, {"$set": update})
+        invalidate_user(current_user["email"])
         current_user.update(update)
 
+    if avatar_data:
+        background_tasks.add_task(
+            upload_avatar, ObjectId(current_user["_id"]), current_user["email"], avatar_data, update["avatar_upload_id"]
+        )
     return map_user_public(current_user)
 
 
 # ---- Delete account ----
-@router.delete("/me", status_code=204)
+@router.delete("/me", status_code=202)
 async def delete_me(current_user: dict = Depends(get_current_user)):
     """
-    Completely delete the current user's account and all associated data:
-    - Pinecone vectors
-    - Uploads collection entries
-    - Chat history
-    - User document
+    Delete the current user's account. The user document is removed right away.
+    Uploads, vectors and chat history are removed by a background job that
+    survives restarts (see rag_pipeline/account_deletion.py).
     """
-    from bson import ObjectId
-
     # Ensure user_id is ObjectId
     user_id = current_user.get("_id")
     if not isinstance(user_id, ObjectId):
@@ -136,35 +191,13 @@ async def delete_me(current_user: dict = Depends(get_current_user)):
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid user ID format.")
 
-    # --- Delete from Pinecone ---
-    try:
-        index.delete(delete_all=False, filter={"user_id": str(user_id)})
-        print(f"Pinecone vectors deleted for user {user_id}")
-    except Exception as e:
-        print(f"Pinecone delete warning for user {user_id}: {e}")
-
-    # --- Delete uploads ---
-    try:
-        up_col = uploads_col()
-        res_up = await up_col.delete_many({"user_id": user_id})
-        print(f"Deleted {res_up.deleted_count} uploads for user {user_id}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete uploads: {e}")
-
-    # --- Delete chat history ---
-    try:
-        hist_col = history_col()
-        res_hist = await hist_col.delete_many({"user_id": user_id})
-        print(f"Deleted {res_hist.deleted_count} history records for user {user_id}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete history: {e}")
-
-    # --- Delete user document ---
+    # Record the job before the user goes, so a crash in between loses nothing
     try:
-        usr_col = users_col()
-        res_user = await usr_col.delete_one({"_id": user_id})
+        await account_deletions.start(user_id, current_user["email"])
+        res_user = await users_col().delete_one({"_id": user_id})
         print(f"Deleted user document count: {res_user.deleted_count}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete user: {e}")
+    invalidate_user(current_user["email"])
 
-    return Response(status_code=204)
+    return {"status": "deleting", "message": "Account deleted; your data is being removed."}
@@ -1,18 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pymongo import MongoClient
+from fastapi import APIRouter, HTTPException, Depends, Response
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
 from pydantic import BaseModel, Field
 from ..core.config import settings
+from ..db.chat_history import delete_chat_buckets, read_messages
+from ..db.mongodb import history_col, uploads_col
+from ..rag_pipeline.dedup import release_upload
+from ..rag_pipeline.query_cache import invalidate_document
+from ..rag_pipeline.vector_cleanup import delete_document_vectors
+import asyncio
+import base64
+import json
 import traceback
-from pinecone import Pinecone
 
 router = APIRouter(prefix="/history", tags=["History"])
 
-# ---------- Pinecone Setup ----------
-pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-index = pc.Index(settings.PINECONE_INDEX)
 
 # ---------- Schemas ----------
 class Message(BaseModel):
@@ -27,68 +30,131 @@ class ChatHistory(BaseModel):
     document_id: Optional[str] = None
     messages: List[Message] = []
     created_at: str
+    # Window of `messages` within the whole conversation
+    message_count: Optional[int] = None
+    offset: Optional[int] = None
 
     class Config:
         allow_population_by_field_name = True
 
-# ---------- Mongo Client ----------
-_mongo_client_h = None
-def get_mongo_client():
-    global _mongo_client_h
-    if _mongo_client_h is None:
-        print("Initializing MongoDB client...")
-        _mongo_client_h = MongoClient(settings.MONGO_URI)
-    return _mongo_client_h
+class ChatSummary(BaseModel):
+    id: str = Field(..., alias="_id")
+    user_id: str
+    email: Optional[str] = None
+    pdf_name: Optional[str] = None
+    document_id: Optional[str] = None
+    created_at: str
+    message_count: int = 0
+    last_message: Optional[str] = None
+    # Only with summary=false
+    messages: Optional[List[Message]] = None
+
+    class Config:
+        allow_population_by_field_name = True
+
+
+# ---------- Pagination ----------
+MAX_PAGE_SIZE = 100
+SNIPPET_CHARS = 120
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps({"t": doc["created_at"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Keyset condition for chats strictly after the cursor in (created_at, _id) descending order."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at, last_id = datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}},
+    ]}
+
 
 # ---------- Routes ----------
-@router.get("/user/{user_id}", response_model=List[ChatHistory])
-async def get_user_chats(user_id: str, limit: int = 50):
+@router.get("/user/{user_id}", response_model=List[ChatSummary], response_model_exclude_unset=True)
+async def get_user_chats(response: Response, user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                         summary: bool = True):
+    """
+    Newest chats first, one page at a time. When more chats exist, the
+    X-Next-Cursor response header holds the `cursor` for the next page.
+    Summaries carry a message count and the last message snippet; full
+    messages come from GET /history/{chat_id} (or summary=false).
+    """
     try:
         if not ObjectId.is_valid(user_id):
             raise HTTPException(status_code=400, detail="Invalid user ID")
-
-        client = get_mongo_client()
-        db = client[settings.MONGO_DB_NAME]
-        history_col = db["history"]
-
-        docs = list(
-            history_col.find({"user_id": ObjectId(user_id)})
-            .sort("created_at", -1)
-            .limit(limit)
-        )
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        match = {"user_id": ObjectId(user_id)}
+        if cursor:
+            match.update(decode_cursor(cursor))
+
+        # Served by the (user_id, created_at, _id) index; one extra row tells whether a next page exists
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"created_at": -1, "_id": -1}},
+            {"$limit": limit + 1},
+        ]
+        if summary:
+            pipeline.append({"$project": {
+                "user_id": 1, "email": 1, "pdf_name": 1, "document_id": 1, "created_at": 1,
+                # Maintained on write; computed for chats saved before message buckets
+                "message_count": {"$ifNull": ["$message_count", {"$size": {"$ifNull": ["$messages", []]}}]},
+                "last_message": {"$ifNull": ["$last_message", {"$arrayElemAt": [{"$ifNull": ["$messages", []]}, -1]}]},
+            }})
+        docs = await history_col().aggregate(pipeline).to_list(length=limit + 1)
+
+        if len(docs) > limit:
+            docs = docs[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(docs[-1])
 
         # Normalize for frontend
         normalized = []
         for d in docs:
-            normalized.append({
+            item = {
                 "_id": str(d["_id"]),
                 "user_id": str(d["user_id"]),
                 "email": d.get("email", ""),
                 "pdf_name": d.get("pdf_name", ""),
                 "document_id": str(d.get("document_id")) if d.get("document_id") else None,  # <-- added
-                "messages": d.get("messages", []),
                 "created_at": d["created_at"].isoformat() if isinstance(d.get("created_at"), datetime) else str(d.get("created_at", ""))
-            })
-
-        print("Normalized docs before return:", normalized)
+            }
+            if summary:
+                last = d.get("last_message") or {}
+                item["message_count"] = d.get("message_count", 0)
+                item["last_message"] = (last.get("text") or "")[:SNIPPET_CHARS] or None
+            else:
+                item["messages"], _, item["message_count"] = await read_messages(d)
+            normalized.append(item)
+
+        print(f"Returning {len(normalized)} chats for user {user_id}")
         return normalized
 
+    except HTTPException:
+        raise
     except Exception:
         print("Exception in get_user_chats:", traceback.format_exc())
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
 @router.get("/{chat_id}", response_model=ChatHistory)
-async def get_chat(chat_id: str):
+async def get_chat(chat_id: str, before: Optional[int] = None, limit: Optional[int] = None):
+    """
+    A window of the conversation: the `limit` messages (default CHAT_WINDOW)
+    before position `before` (default: the end). `offset` is the position of
+    the first returned message; pass it as `before` to page backwards.
+    """
     try:
         if not ObjectId.is_valid(chat_id):
             raise HTTPException(status_code=400, detail="Invalid chat ID")
 
-        client = get_mongo_client()
-        db = client[settings.MONGO_DB_NAME]
-        history_col = db["history"]
-
-        doc = history_col.find_one({"_id": ObjectId(chat_id)})
+        doc = await history_col().find_one({"_id": ObjectId(chat_id)})
         if not doc:
             raise HTTPException(status_code=404, detail="Chat not found")
 
@@ -99,11 +165,14 @@ async def get_chat(chat_id: str):
             "email": doc.get("email", ""),
             "pdf_name": doc.get("pdf_name", ""),
             "document_id": str(doc.get("document_id")) if doc.get("document_id") else None,
-            "messages": doc.get("messages", []),
             "created_at": doc.get("created_at").isoformat() if isinstance(doc.get("created_at"), datetime) else str(doc.get("created_at", ""))
         }
+        limit = max(1, min(limit or settings.CHAT_WINDOW, settings.CHAT_WINDOW))
+        normalized["messages"], normalized["offset"], normalized["message_count"] = await read_messages(
+            doc, before=before, limit=limit
+        )
 
-        print("Normalized single chat:", normalized)
+        print(f"Returning chat {chat_id} with {len(normalized['messages'])} messages")
         return normalized
 
     except HTTPException:
@@ -119,37 +188,42 @@ async def delete_chat(chat_id: str):
     Delete a single chat and all associated records from:
     - history collection
     - uploads collection
-    - Pinecone index
+    - vector store
     """
     try:
         if not ObjectId.is_valid(chat_id):
             raise HTTPException(status_code=400, detail="Invalid chat ID")
 
-        client = get_mongo_client()
-        db = client[settings.MONGO_DB_NAME]
-        history_col = db["history"]
-        uploads_col = db["uploads"]
-
         # Find chat record
-        chat = history_col.find_one({"_id": ObjectId(chat_id)})
+        chat = await history_col().find_one({"_id": ObjectId(chat_id)})
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
 
         user_id = str(chat.get("user_id"))
         document_id = str(chat.get("document_id"))
 
-        # Delete from Pinecone
-        try:
-            index.delete(delete_all=False, filter={"user_id": user_id, "document_id": document_id})
-            print(f"Deleted Pinecone vectors for doc {document_id}")
-        except Exception as e:
-            print(f"Pinecone deletion failed: {e}")
+        # Delete vectors, unless other uploads still share these vectors
+        upload = await uploads_col().find_one({"_id": ObjectId(document_id)}) if ObjectId.is_valid(document_id) else None
+        release = await release_upload(upload) if upload else (user_id, document_id, None)
+        if release:
+            vector_document_id = release[1]
+            try:
+                deleted = await asyncio.to_thread(delete_document_vectors, *release)
+                print(f"Deleted {deleted} vectors for doc {vector_document_id}")
+            except Exception as e:
+                # The orphan sweep (vector_cleanup.py) removes them later
+                print(f"Vector deletion failed, left for the orphan sweep: {e}")
+        else:
+            print(f"Kept vectors for doc {document_id}: still referenced by other uploads")
+        invalidate_document(document_id, release[1] if release else None)
 
         # Delete from uploads collection
-        uploads_col.delete_one({"_id": ObjectId(document_id)})
+        if ObjectId.is_valid(document_id):
+            await uploads_col().delete_one({"_id": ObjectId(document_id)})
 
-        # Delete from history collection
-        history_col.delete_one({"_id": ObjectId(chat_id)})
+        # Delete from history collection, with the chat's message buckets
+        await history_col().delete_one({"_id": ObjectId(chat_id)})
+        await delete_chat_buckets(ObjectId(chat_id))
 
         print(f"Deleted chat {chat_id}, document {document_id}, user {user_id}")
         return {"message": "Chat deleted successfully"}
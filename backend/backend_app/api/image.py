@@ -1,26 +1,32 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-import os, shutil, uuid
-from ..core.config import settings
+import asyncio, os, shutil, uuid
 from ..core.auth import get_current_user
-from pymongo import MongoClient
-from datetime import datetime
-from bson import ObjectId
 from ..rag_pipeline.image_loader import extract_text_from_image_file, extract_text_from_pdf_bytes
-from ..rag_pipeline.prepare_dataset import process_and_store
+from ..rag_pipeline.dedup import hash_file
+from ..rag_pipeline.jobs import IngestJob, JobQueueFull, enqueue_ingest, register_extractor
 
 router = APIRouter(prefix="/image", tags=["Image"])
 
-_mongo_client = None
-def get_mongo_client():
-    global _mongo_client
-    if _mongo_client is None:
-        _mongo_client = MongoClient(settings.MONGO_URI)
-    return _mongo_client
-
 UPLOAD_DIR = "backend_app/rag_pipeline/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/upload/")
+
+def make_extract(file_path: str):
+    def extract(job: IngestJob) -> str:
+        if file_path.lower().endswith(".pdf"):
+            # PDF containing images
+            with open(file_path, "rb") as f:
+                pdf_bytes = f.read()
+            return extract_text_from_pdf_bytes(pdf_bytes, progress=job.report)
+        # Single image
+        return extract_text_from_image_file(file_path)
+
+    return extract
+
+
+register_extractor("image", lambda upload: make_extract(upload["stored_as"]))
+
+@router.post("/upload/", status_code=202)
 async def upload_file(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
@@ -28,6 +34,11 @@ async def upload_file(
     if not file:
         raise HTTPException(status_code=400, detail="No file provided")
 
+    # Determine file type
+    file_ext = file.filename.split('.')[-1].lower()
+    if file_ext not in ["png", "jpg", "jpeg", "pdf"]:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Upload image or PDF.")
+
     try:
         # Save uploaded file
         filename = f"{uuid.uuid4().hex}_{file.filename}"
@@ -35,48 +46,17 @@ async def upload_file(
         with open(file_path, "wb") as f:
             shutil.copyfileobj(file.file, f)
         source = file.filename
+        content_hash = await asyncio.to_thread(hash_file, file_path)
 
-        # Determine file type
-        file_ext = file.filename.split('.')[-1].lower()
-        if file_ext in ["png", "jpg", "jpeg"]:
-            # Single image
-            text = extract_text_from_image_file(file_path)
-        elif file_ext == "pdf":
-            # PDF containing images
-            with open(file_path, "rb") as f:
-                pdf_bytes = f.read()
-            text = extract_text_from_pdf_bytes(pdf_bytes)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Upload image or PDF.")
-
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from the provided file")
-
-        # Log upload to MongoDB
-        client = get_mongo_client()
-        db = client[settings.MONGO_DB_NAME]
-        uploads = db["uploads"]
-
-        result = uploads.insert_one({
-            "user_id": ObjectId(current_user["_id"]),
-            "email": current_user["email"],
-            "filename": source,
-            "stored_as": file_path,
-            "chunks_upserted": 0,
-            "created_at": datetime.utcnow()
-        })
-        document_id = str(result.inserted_id)
+        extract = make_extract(file_path)
 
-        # Process & store in Pinecone
-        chunk_count = process_and_store(
-            text,
-            user_id=str(current_user["_id"]),
-            document_id=document_id,
-            source=source
+        job = await enqueue_ingest(
+            current_user, filename=source, stored_as=file_path, kind="image", extract=extract, content_hash=content_hash
         )
-        uploads.update_one({"_id": result.inserted_id}, {"$set": {"chunks_upserted": chunk_count}})
 
-        return {"status": "success", "message": f"Processed {source}", "chunks": chunk_count, "document_id": document_id}
+        return {"status": "queued", "message": f"Processing {source}", "job_id": job.id, "document_id": job.document_id}
 
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Depends
+from ..core.auth import get_current_user
+from ..db.mongodb import uploads_col
+from ..rag_pipeline.jobs import JobQueueFull, job_manager
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def _upload_filter(job_id: str, current_user: dict) -> dict:
+    """The upload whose current job is `job_id`, or was resumed from it."""
+    return {"$or": [{"job.id": job_id}, {"resumed_jobs": job_id}], "user_id": current_user["_id"]}
+
+
+async def _load_job(job_id: str, current_user: dict) -> dict:
+    user_id = str(current_user["_id"])
+
+    job = job_manager.get(job_id)
+    if job:
+        if job.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job.to_public()
+
+    # Not in memory (finished long ago or the worker restarted): fall back to
+    # the state mirrored on the uploads document
+    doc = await uploads_col().find_one(_upload_filter(job_id, current_user))
+    if not doc:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    record = dict(doc["job"])
+    record["job_id"] = record.pop("id")
+    record["document_id"] = str(doc["_id"])
+    record["source"] = doc.get("filename")
+    record["chunks"] = doc.get("chunks_upserted", 0)
+    if record["status"] in ("queued", "running") and \
+            (record.get("heartbeat_at") or record.get("updated_at") or datetime.min) < job_manager.stale_before():
+        # The process that owned this job is gone; a live one on another worker keeps its status
+        record["status"] = "interrupted"
+    return record
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Status and per-stage progress (extract/chunk/embed/upsert) of an ingestion job."""
+    return await _load_job(job_id, current_user)
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Cancel a queued or running ingestion job."""
+    job = job_manager.get(job_id)
+    if not job or job.user_id != str(current_user["_id"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job_manager.cancel(job_id)
+    return job.to_public()
+
+
+@router.post("/{job_id}/retry", status_code=202)
+async def retry_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Resume a failed, cancelled or interrupted ingestion job. Batches that were
+    already stored are kept; work restarts at the first unconfirmed batch.
+    """
+    job = job_manager.get(job_id)
+    if job and job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Job is still active")
+
+    upload = await uploads_col().find_one(_upload_filter(job_id, current_user))
+    if not upload:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if upload["job"]["status"] == "succeeded":
+        raise HTTPException(status_code=409, detail="Job already succeeded")
+    record = upload["job"]
+    if record["status"] in ("queued", "running") and \
+            (record.get("heartbeat_at") or record.get("updated_at") or datetime.min) >= job_manager.stale_before():
+        raise HTTPException(status_code=409, detail="Job is still active on another worker")
+
+    try:
+        resumed = await job_manager.resume(upload)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    if resumed is None:
+        raise HTTPException(status_code=409, detail="Job cannot be resumed (already resumed or unsupported source)")
+    return resumed.to_public()
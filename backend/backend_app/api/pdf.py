@@ -1,26 +1,44 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-import os, shutil, uuid
-from ..rag_pipeline.pdf_loader import download_file_from_url, extract_text_from_url_maybe_html
-from ..rag_pipeline.prepare_dataset import process_and_store
-from ..core.config import settings
-from ..core.auth import get_current_user
-from pymongo import MongoClient
-from datetime import datetime
+import asyncio, os, shutil, uuid
 from bson import ObjectId
+from ..db.mongodb import uploads_col
+from ..rag_pipeline.pdf_loader import download_file_from_url, extract_text_from_url_maybe_html, is_pdf, iter_pdf_pages
+from ..rag_pipeline.dedup import hash_file
+from ..rag_pipeline.jobs import IngestJob, JobConflict, JobQueueFull, enqueue_ingest, enqueue_refresh, register_extractor
+from ..core.auth import get_current_user
 
 router = APIRouter(prefix="/pdf", tags=["PDF"])
 
-_mongo_client = None
-def get_mongo_client():
-    global _mongo_client
-    if _mongo_client is None:
-        _mongo_client = MongoClient(settings.MONGO_URI)
-    return _mongo_client
-
 UPLOAD_DIR = "backend_app/rag_pipeline/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/upload/")
+
+def make_extract(file_path: str, url: str = None):
+    def extract(job: IngestJob):
+        # Download (for URLs), then stream PDF pages or extract HTML text
+        if not url:
+            content_type, path = "application/pdf", file_path
+            if not job.content_hash:
+                job.content_hash = hash_file(path)
+        else:
+            content_type, path = download_file_from_url(url, file_path)
+            job.content_hash = hash_file(path)
+        if is_pdf(path, content_type):
+            return iter_pdf_pages(path)
+        return extract_text_from_url_maybe_html(path, content_type)
+
+    return extract
+
+
+# Resuming re-reads the stored file, or downloads the URL again
+def _resume_extract(upload: dict):
+    source = upload.get("filename") or ""
+    return make_extract(upload["stored_as"], url=source if source.startswith(("http://", "https://")) else None)
+
+
+register_extractor("pdf", _resume_extract)
+
+@router.post("/upload/", status_code=202)
 async def upload_pdf(
     file: UploadFile = File(None),
     url: str = Form(None),
@@ -36,45 +54,81 @@ async def upload_pdf(
             file_path = os.path.join(UPLOAD_DIR, filename)
             with open(file_path, "wb") as f:
                 shutil.copyfileobj(file.file, f)
-            content_type = "application/pdf"
             source = file.filename
+            content_hash = await asyncio.to_thread(hash_file, file_path)
         else:
             parsed_name = os.path.basename(url.split("?")[0]) or f"downloaded_{uuid.uuid4().hex}.pdf"
             filename = f"{uuid.uuid4().hex}_{parsed_name}"
             file_path = os.path.join(UPLOAD_DIR, filename)
-            content_type, file_path = download_file_from_url(url, file_path)
             source = url
+            # Downloaded content is hashed once it is on disk
+            content_hash = None
+
+        extract = make_extract(file_path, url=None if file else url)
 
-        # Extract text
-        text = extract_text_from_url_maybe_html(file_path, content_type)
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from the provided file/URL")
-
-        # Log upload to MongoDB
-        client = get_mongo_client()
-        db = client[settings.MONGO_DB_NAME]
-        uploads = db["uploads"]
-
-        result = uploads.insert_one({
-            "user_id": ObjectId(current_user["_id"]),
-            "email": current_user["email"],
-            "filename": source,
-            "stored_as": file_path,
-            "chunks_upserted": 0,
-            "created_at": datetime.utcnow()
-        })
-        document_id = str(result.inserted_id)
-
-        # Process & store in Pinecone
-        chunk_count = process_and_store(
-            text,
-            user_id=str(current_user["_id"]),
-            document_id=document_id,
-            source=source
+        job = await enqueue_ingest(
+            current_user, filename=source, stored_as=file_path, kind="pdf", extract=extract, content_hash=content_hash
         )
-        uploads.update_one({"_id": result.inserted_id}, {"$set": {"chunks_upserted": chunk_count}})
 
-        return {"status": "success", "message": f"Processed {source}", "chunks": chunk_count, "document_id": document_id}
+        return {"status": "queued", "message": f"Processing {source}", "job_id": job.id, "document_id": job.document_id}
+
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{document_id}/refresh", status_code=202)
+async def refresh_pdf(
+    document_id: str,
+    file: UploadFile = File(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Update an ingested PDF to a new revision: the uploaded `file`, or for URL
+    uploads a fresh download. Only chunks that changed are embedded again, and
+    chunks that disappeared are deleted. Poll GET /jobs/{job_id}; its `refresh`
+    field reports the fraction re-embedded.
+    """
+    upload = None
+    if ObjectId.is_valid(document_id):
+        upload = await uploads_col().find_one({"_id": ObjectId(document_id), "user_id": current_user["_id"]})
+    if not upload or (upload.get("job") or {}).get("kind") != "pdf":
+        raise HTTPException(status_code=404, detail="PDF document not found")
+
+    source = upload.get("filename") or ""
+    is_url = source.startswith(("http://", "https://"))
+    if not file and not is_url:
+        raise HTTPException(status_code=400, detail="Provide the new revision as file")
+
+    file_path, update, content_hash = upload["stored_as"], None, None
+
+    async def discard_new_file():
+        # Unless the claim already switched the upload over to it (a failure after the claim)
+        if file and os.path.exists(file_path):
+            current = await uploads_col().find_one({"_id": upload["_id"]}, {"stored_as": 1})
+            if (current or {}).get("stored_as") != file_path:
+                os.remove(file_path)
 
+    try:
+        if file:
+            file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{file.filename}")
+            with open(file_path, "wb") as f:
+                shutil.copyfileobj(file.file, f)
+            content_hash = await asyncio.to_thread(hash_file, file_path)
+            update = {"stored_as": file_path}
+
+        extract = make_extract(file_path, url=None if file else source)
+        job = await enqueue_refresh(upload, extract, content_hash=content_hash, update=update)
+    except (JobQueueFull, JobConflict) as e:
+        await discard_new_file()
+        raise HTTPException(status_code=429 if isinstance(e, JobQueueFull) else 409, detail=str(e))
     except Exception as e:
+        await discard_new_file()
         raise HTTPException(status_code=500, detail=str(e))
+
+    if file and os.path.exists(upload["stored_as"]):
+        # The claim switched the upload over to the new file
+        os.remove(upload["stored_as"])
+
+    return {"status": "queued", "message": f"Refreshing {source}", "job_id": job.id, "document_id": job.document_id}
@@ -1,34 +1,26 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from ..core.config import settings
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
-import torch
-import requests
+from ..core.ollama import OllamaUnavailable, ollama_client
+from ..rag_pipeline import bm25
+from ..rag_pipeline.context_builder import build_context, count_tokens
+from ..rag_pipeline.dedup import resolve_vector_document_id
+from ..rag_pipeline.query_batcher import encode_query
+from ..rag_pipeline.reranker import reranker
+from ..rag_pipeline.vector_store import vector_store
+from ..rag_pipeline.query_cache import (
+    match_cache, match_key, normalize_question, query_embedding_cache, vector_document_cache
+)
+import httpx
 import asyncio
-from typing import List
+import json
+import time
+from typing import AsyncIterator, Dict, List, Tuple
 
 router = APIRouter(prefix="/query", tags=["Query"])
 
 
-# Device Setup (MPS / CUDA / CPU)
-
-device = (
-    "mps" if torch.backends.mps.is_available()
-    else "cuda" if torch.cuda.is_available()
-    else "cpu"
-)
-
-EMBEDDER_MODEL = "intfloat/e5-large-v2"
-embedder = SentenceTransformer(EMBEDDER_MODEL, device=device)
-
-
-# Pinecone Setup
-
-pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-index = pc.Index(settings.PINECONE_INDEX)
-
-
 # Request / Response Models
 
 class QueryRequest(BaseModel):
@@ -42,86 +34,114 @@ class QueryResponse(BaseModel):
 
 
 
-# Ollama LLM Call
-
-def call_llm_chat(system_prompt: str, user_prompt: str) -> str:
-    try:
-        response = requests.post(
-            f"{settings.OLLAMA_BASE_URL}/api/chat",
-            json={
-                "model": settings.OLLAMA_MODEL,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "options": {
-                    "temperature": 0.0,
-                    "num_predict": 600,
-                    "num_ctx": 8192,
-                },
-                "stream": False,
-            },
-            timeout=180,
+# Retrieval (cached)
+
+async def get_vector_document_id(document_id: str) -> str:
+    # Deduplicated uploads share the vectors of the first identical upload
+    vector_document_id = vector_document_cache.get(document_id)
+    if vector_document_id is None:
+        vector_document_id = await resolve_vector_document_id(document_id)
+        vector_document_cache.set(document_id, vector_document_id)
+    return vector_document_id
+
+
+async def embed_question(question: str):
+    key = normalize_question(question)
+    q_vec = query_embedding_cache.get(key)
+    if q_vec is None:
+        # Batched with concurrent requests off the event loop; adds the E5 "query: " prefix
+        q_vec = await encode_query(question)
+        query_embedding_cache.set(key, q_vec)
+    return q_vec
+
+
+async def dense_search(vector_document_id: str, question: str, top_k: int) -> List[dict]:
+    q_vec = await embed_question(question)
+    return await asyncio.to_thread(
+        vector_store.query,
+        q_vec,
+        top_k,
+        {"document_id": {"$eq": vector_document_id}},
+    )
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int) -> Dict[str, float]:
+    # score(id) = sum over rankings of 1 / (k + rank); rank starts at 1
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, match_id in enumerate(ranking, start=1):
+            fused[match_id] = fused.get(match_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+async def hybrid_search(vector_document_id: str, question: str, top_k: int) -> List[dict]:
+    # Over-fetch from both retrievers in parallel, then fuse their rankings
+    candidates = max(top_k, settings.HYBRID_CANDIDATES)
+    dense, lexical = await asyncio.gather(
+        dense_search(vector_document_id, question, candidates),
+        asyncio.to_thread(bm25.search, vector_document_id, question, candidates),
+    )
+    if not lexical:
+        return dense[:top_k]
+
+    fused = reciprocal_rank_fusion([[m["id"] for m in dense], [i for i, _ in lexical]], settings.RRF_K)
+    best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+
+    # Lexical-only hits still need their chunk text
+    by_id = {m["id"]: m for m in dense}
+    missing = [i for i in best if i not in by_id]
+    if missing:
+        fetched = await asyncio.to_thread(
+            vector_store.fetch, missing, {"document_id": {"$eq": vector_document_id}}
         )
+        by_id.update((m["id"], m) for m in fetched)
 
-        response.raise_for_status()
-        data = response.json()
-
-        if "message" not in data or "content" not in data["message"]:
-            raise ValueError("Invalid response from Ollama")
-
-        return data["message"]["content"].strip()
-
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Ollama connection error: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ollama error: {str(e)}")
+    return [{**by_id[i], "score": fused[i]} for i in best if i in by_id]
 
 
+async def retrieve_matches(document_id: str, question: str, top_k: int) -> List[dict]:
+    vector_document_id = await get_vector_document_id(document_id)
+    key = match_key(vector_document_id, question, top_k)
+    matches = match_cache.get(key)
+    if matches is not None:
+        return matches
 
-# Main Query Endpoint
+    if settings.HYBRID_SEARCH:
+        matches = await hybrid_search(vector_document_id, question, top_k)
+    else:
+        matches = await dense_search(vector_document_id, question, top_k)
 
-@router.post("/", response_model=QueryResponse)
-async def query_pdf_endpoint(request: QueryRequest):
-    try:
-        if not request.question.strip():
-            raise HTTPException(status_code=400, detail="Question cannot be empty")
+    # Empty results are not cached: the document may still be ingesting
+    if matches:
+        match_cache.set(key, matches)
+    return matches
 
-        # IMPORTANT for E5 models
-        formatted_query = f"query: {request.question}"
 
-        # Run embedding in thread (prevents blocking)
-        q_vec = await asyncio.to_thread(
-            embedder.encode,
-            formatted_query,
-            convert_to_numpy=True,
-            normalize_embeddings=True
-        )
+async def retrieve_context(document_id: str, question: str, top_k: int) -> List[dict]:
+    """Chunks to put in the prompt: the top_k matches, or the reranked best of a larger pool."""
+    if not settings.RERANK_ENABLED:
+        return await retrieve_matches(document_id, question, top_k)
 
-        # Query Pinecone
-        query_resp = index.query(
-            vector=q_vec.tolist(),
-            top_k=request.top_k,
-            include_metadata=True,
-            filter={"document_id": {"$eq": request.document_id}},
-        )
+    candidates = await retrieve_matches(document_id, question, max(top_k, settings.RERANK_CANDIDATES))
+    if not candidates:
+        return candidates
+    selected, stats = await asyncio.to_thread(reranker.rerank, question, candidates, top_k)
+    print(f"Rerank: kept {stats['kept']}/{stats['candidates']} chunks in {stats['rerank_ms']} ms, "
+          f"prompt tokens {stats['prompt_tokens_baseline']} -> {stats['prompt_tokens']} "
+          f"(saved {stats['prompt_tokens_saved']})")
+    return selected
 
-        matches = query_resp.get("matches", [])
 
-        if not matches:
-            return {
-                "answer": "No relevant results found for this document."
-            }
+# Prompt Construction
 
-        # Collect matched context
-        contexts: List[str] = [
-            m["metadata"].get("content", "")
-            for m in matches if m.get("metadata")
-        ]
+LLM_OPTIONS = {
+    "temperature": 0.0,
+    "num_predict": 600,
+    "num_ctx": 8192,
+}
 
-        combined_context = "\n\n".join(contexts)
 
-        system_prompt = """
+SYSTEM_PROMPT = """
 You are a precise and grounded AI assistant.
 Answer ONLY using the provided context.
 
@@ -130,22 +150,83 @@ If the answer is not explicitly present, respond exactly:
 Do not explain further.
 """
 
-        user_prompt = f"""
+
+USER_PROMPT_TEMPLATE = """
 Context:
-{combined_context}
+{context}
 
 Question:
-{request.question}
+{question}
 
 Answer using only the context above.
 """
 
-        # Call Ollama safely
-        answer_text = await asyncio.to_thread(
-            call_llm_chat,
-            system_prompt,
-            user_prompt
-        )
+
+def context_token_budget(question: str) -> int:
+    # What's left of the context window after the reply, the system prompt and the question
+    overhead = count_tokens(SYSTEM_PROMPT + USER_PROMPT_TEMPLATE.format(context="", question=question))
+    available = LLM_OPTIONS["num_ctx"] - LLM_OPTIONS["num_predict"] - overhead
+    return max(0, min(settings.CONTEXT_TOKEN_BUDGET, available))
+
+
+def build_prompts(question: str, matches: List[dict]) -> Tuple[str, str]:
+    # Merge adjacent chunks, drop their overlap and fit the token budget
+    combined_context, stats = build_context(matches, context_token_budget(question))
+    print(f"Context: {stats['chunks']} chunks -> {stats['passages_sent']}/{stats['passages']} passages, "
+          f"{stats['raw_tokens']} -> {stats['context_tokens']} tokens (saved {stats['tokens_saved']})")
+
+    user_prompt = USER_PROMPT_TEMPLATE.format(context=combined_context, question=question)
+    return SYSTEM_PROMPT, user_prompt
+
+
+# Ollama LLM Call
+
+def chat_messages(system_prompt: str, user_prompt: str) -> List[dict]:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+async def call_llm_chat(system_prompt: str, user_prompt: str) -> str:
+    try:
+        answer = await ollama_client.chat(chat_messages(system_prompt, user_prompt), LLM_OPTIONS)
+        return answer.strip()
+
+    except OllamaUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Ollama did not answer in time")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Ollama connection error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ollama error: {str(e)}")
+
+
+def stream_llm_chat(system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+    return ollama_client.stream_chat(chat_messages(system_prompt, user_prompt), LLM_OPTIONS)
+
+
+
+# Main Query Endpoint
+
+@router.post("/", response_model=QueryResponse)
+async def query_pdf_endpoint(request: QueryRequest):
+    try:
+        if not request.question.strip():
+            raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+        matches = await retrieve_context(request.document_id, request.question, request.top_k)
+
+        if not matches:
+            return {
+                "answer": "No relevant results found for this document."
+            }
+
+        system_prompt, user_prompt = await asyncio.to_thread(build_prompts, request.question, matches)
+
+        # Call Ollama safely (pooled client, bounded concurrency)
+        answer_text = await call_llm_chat(system_prompt, user_prompt)
 
         print(f"Final Answer:")
         print(answer_text)
@@ -155,4 +236,84 @@ Answer using only the context above.
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+
+
+# Streaming Query Endpoint (Server-Sent Events)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def source_summary(match: dict) -> dict:
+    metadata = match.get("metadata") or {}
+    summary = {
+        "id": match["id"],
+        "score": match["score"],
+        "source": metadata.get("source"),
+        "chunk_id": metadata.get("chunk_id"),
+    }
+    if "rerank_score" in match:
+        summary["rerank_score"] = match["rerank_score"]
+    if "page_start" in metadata:
+        summary["page_start"] = metadata["page_start"]
+        summary["page_end"] = metadata.get("page_end")
+    return summary
+
+
+@router.post("/stream")
+async def query_stream_endpoint(request: QueryRequest, http_request: Request):
+    """
+    Same retrieval as POST /query/, but the answer is streamed as SSE:
+    `sources` (matched chunks) -> `token`* -> `done` (timings) or `error`.
+    """
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    started = time.perf_counter()
+    try:
+        matches = await retrieve_context(request.document_id, request.question, request.top_k)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+    retrieval_ms = (time.perf_counter() - started) * 1000
+
+    async def events():
+        yield sse_event("sources", [source_summary(m) for m in matches])
+
+        if not matches:
+            yield sse_event("token", {"text": "No relevant results found for this document."})
+            yield sse_event("done", {"retrieval_ms": round(retrieval_ms, 1), "ttft_ms": None})
+            return
+
+        system_prompt, user_prompt = await asyncio.to_thread(build_prompts, request.question, matches)
+        ttft_ms = None
+        n_tokens = 0
+        try:
+            async for token in stream_llm_chat(system_prompt, user_prompt):
+                if await http_request.is_disconnected():
+                    # Leaving the loop closes the Ollama stream and stops generation
+                    print(f"Client disconnected after {n_tokens} tokens; cancelled generation")
+                    return
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                n_tokens += 1
+                yield sse_event("token", {"text": token})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Ollama error: {str(e)}"})
+            return
+
+        total_ms = (time.perf_counter() - started) * 1000
+        print(f"Streamed {n_tokens} tokens: retrieval {retrieval_ms:.0f} ms, "
+              f"time to first token {ttft_ms or 0:.0f} ms, total {total_ms:.0f} ms")
+        yield sse_event("done", {
+            "retrieval_ms": round(retrieval_ms, 1),
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "total_ms": round(total_ms, 1),
+            "tokens": n_tokens,
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
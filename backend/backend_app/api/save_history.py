@@ -1,26 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from datetime import datetime
 from bson import ObjectId
-from pymongo import MongoClient
-from ..core.config import settings
 from ..core.auth import get_current_user
+from ..db.chat_history import append_messages, new_chat_document
+from ..db.mongodb import history_col
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-_mongo_client = None
-def get_mongo_client():
-    global _mongo_client
-    if _mongo_client is None:
-        _mongo_client = MongoClient(settings.MONGO_URI)
-    return _mongo_client
-
 # Request model
 class SaveHistoryRequest(BaseModel):
     pdf_name: str
     document_id: str
     messages: list
 
+class AppendMessagesRequest(BaseModel):
+    messages: list
+
 @router.post("/save/")
 async def save_chat_history(
     request: SaveHistoryRequest,
@@ -30,20 +25,15 @@ async def save_chat_history(
     Save chat messages to MongoDB, linking each chat to uploaded PDF by document_id.
     """
     try:
-        client = get_mongo_client()
-        db = client[settings.MONGO_DB_NAME]
-        history_col = db["history"]
-
-        history_doc = {
-            "user_id": ObjectId(current_user["_id"]),
-            "email": current_user["email"],
-            "pdf_name": request.pdf_name,
-            "document_id": ObjectId(request.document_id),
-            "messages": request.messages,
-            "created_at": datetime.utcnow()
-        }
+        user_id = ObjectId(current_user["_id"])
+        history_doc, overflow = new_chat_document(
+            user_id, current_user["email"], request.pdf_name, ObjectId(request.document_id), request.messages
+        )
 
-        result = history_col.insert_one(history_doc)
+        result = await history_col().insert_one(history_doc)
+        if overflow:
+            # Long conversations continue in message buckets
+            await append_messages(result.inserted_id, user_id, overflow)
 
         return {
             "status": "success",
@@ -54,3 +44,31 @@ async def save_chat_history(
     except Exception as e:
         print("Error:", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{chat_id}/messages")
+async def append_chat_messages(
+    chat_id: str,
+    request: AppendMessagesRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Append only the new messages to an existing chat, instead of saving the
+    whole conversation again.
+    """
+    if not ObjectId.is_valid(chat_id):
+        raise HTTPException(status_code=400, detail="Invalid chat ID")
+    try:
+        count = await append_messages(ObjectId(chat_id), ObjectId(current_user["_id"]), request.messages)
+    except Exception as e:
+        print("Error:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if count is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    return {
+        "status": "success",
+        "message": f"Appended {len(request.messages)} messages",
+        "chat_id": chat_id,
+        "message_count": count
+    }
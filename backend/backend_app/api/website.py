@@ -1,37 +1,76 @@
 from fastapi import APIRouter, HTTPException, Depends, Form
-from datetime import datetime
+from typing import Optional
 from bson import ObjectId
-from pymongo import MongoClient
-from ..core.config import settings
 from ..core.auth import get_current_user
-from ..rag_pipeline.website_loader import extract_text_from_website
-from ..rag_pipeline.prepare_dataset import process_and_store
+from ..db.mongodb import uploads_col
+from ..rag_pipeline.website_loader import crawl_limits, extract_text_from_website
+from ..rag_pipeline.jobs import IngestJob, JobConflict, JobQueueFull, enqueue_ingest, enqueue_refresh, register_extractor
+import asyncio
 import uuid
 import os
 
 router = APIRouter(prefix="/website", tags=["Website"])
 
-_mongo_client = None
 
+UPLOAD_DIR = "backend_app/rag_pipeline/uploads"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def get_mongo_client():
-    global _mongo_client
-    if _mongo_client is None:
-        _mongo_client = MongoClient(settings.MONGO_URI)
-    return _mongo_client
 
+def make_extract(url: str, file_path: str, max_depth: int, max_pages: int):
+    # The crawl runs on the app's event loop, sharing its connection pool
+    loop = asyncio.get_running_loop()
 
-UPLOAD_DIR = "backend_app/rag_pipeline/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+    def extract(job: IngestJob) -> str:
+        # Crawl the site; the job then hashes the normalized text for dedup
+        # and embeds & stores it if it is new
+        text = extract_text_from_website(url, max_depth=max_depth, max_pages=max_pages, loop=loop,
+                                         progress=lambda done, total: job.report("extract", done, total))
+        if not text.strip():
+            raise ValueError("No readable text found at the given URL.")
+        print(f"[DEBUG] Successfully extracted {len(text)} characters")
+
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return text
+
+    return extract
+
+
+def _recrawl(upload: dict):
+    options = upload.get("options") or {}
+    return make_extract(upload["filename"], upload["stored_as"],
+                        *crawl_limits(options.get("max_depth"), options.get("max_pages")))
+
+
+def _resume_extract(upload: dict):
+    file_path = upload["stored_as"]
+    # A refresh wants the live site, not the text saved last time
+    if not os.path.exists(file_path) or (upload.get("job") or {}).get("refresh") is not None:
+        return _recrawl(upload)
+
+    def extract(job: IngestJob) -> str:
+        # The text saved by the first attempt; the checkpoint manifest matches it
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    return extract
 
 
-@router.post("/upload/")
+register_extractor("website", _resume_extract)
+
+
+@router.post("/upload/", status_code=202)
 async def upload_website(
     url: str = Form(...),
+    max_depth: Optional[int] = Form(None),
+    max_pages: Optional[int] = Form(None),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Upload a website URL, extract text, process & store embeddings in Pinecone.
+    Queue a website URL for ingestion: crawl the site (up to `max_depth` links
+    from `url`, at most `max_pages` pages; defaults from CRAWL_MAX_DEPTH /
+    CRAWL_MAX_PAGES), process & store embeddings in the vector store.
+    Poll GET /jobs/{job_id} for progress.
     """
     if not url:
         raise HTTPException(status_code=400, detail="No URL provided")
@@ -39,63 +78,58 @@ async def upload_website(
     try:
         print(f"[DEBUG] Starting website upload for user {current_user['_id']} and URL: {url}")
 
-        # Step 1: Extract text from website
-        text = extract_text_from_website(url)
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="No readable text found at the given URL.")
-        print(f"[DEBUG] Successfully extracted {len(text)} characters")
-
-        # Step 2: Save a placeholder "stored_as" file for consistency
+        # Placeholder "stored_as" file for consistency
         # (so both PDF and website uploads have a local stored file)
         filename = f"{uuid.uuid4().hex}_website.txt"
         file_path = os.path.join(UPLOAD_DIR, filename)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(text)
 
-        # Step 3: Mongo setup
-        client = get_mongo_client()
-        db = client[settings.MONGO_DB_NAME]
-        uploads = db["uploads"]
-
-        # Step 4: Insert metadata
-        result = uploads.insert_one({
-            "user_id": ObjectId(current_user["_id"]),
-            "email": current_user["email"],
-            "filename": url,
-            "stored_as": file_path,
-            "chunks_upserted": 0,
-            "created_at": datetime.utcnow()
-        })
-        document_id = str(result.inserted_id)
-        print(f"[DEBUG] Created document with ID: {document_id}")
-
-        # Step 5: Embed & store
-        chunk_count = process_and_store(
-            text,
-            user_id=str(current_user["_id"]),
-            document_id=document_id,
-            source=url
-        )
-        print(f"[DEBUG] Successfully processed {chunk_count} chunks")
-
-        # Step 6: Update metadata
-        uploads.update_one(
-            {"_id": result.inserted_id},
-            {"$set": {"chunks_upserted": chunk_count}}
-        )
-
-        print(f"[DEBUG] Website upload completed successfully")
+        max_depth, max_pages = crawl_limits(max_depth, max_pages)
+        extract = make_extract(url, file_path, max_depth, max_pages)
+
+        job = await enqueue_ingest(current_user, filename=url, stored_as=file_path, kind="website", extract=extract,
+                                   options={"max_depth": max_depth, "max_pages": max_pages})
+        print(f"[DEBUG] Queued job {job.id} for document {job.document_id}")
+
         return {
-            "status": "success",
-            "message": f"Processed text from {url}",
-            "chunks": chunk_count,
-            "document_id": document_id
+            "status": "queued",
+            "message": f"Crawling up to {max_pages} pages from {url}",
+            "job_id": job.id,
+            "document_id": job.document_id
         }
 
-    except HTTPException:
-        raise
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         print(f"[ERROR] Website upload failed: {str(e)}")
         import traceback
         print(f"[ERROR] Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Website upload failed: {str(e)}")
+
+
+@router.post("/{document_id}/refresh", status_code=202)
+async def refresh_website(document_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Re-crawl an ingested website and update its vectors in place: only chunks
+    that changed are embedded, and chunks that disappeared are deleted. Pages
+    that did not change come back from the crawl cache as 304s. Poll
+    GET /jobs/{job_id}; its `refresh` field reports the fraction re-embedded.
+    """
+    upload = None
+    if ObjectId.is_valid(document_id):
+        upload = await uploads_col().find_one({"_id": ObjectId(document_id), "user_id": current_user["_id"]})
+    if not upload or (upload.get("job") or {}).get("kind") != "website":
+        raise HTTPException(status_code=404, detail="Website document not found")
+
+    try:
+        job = await enqueue_refresh(upload, _recrawl(upload))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {
+        "status": "queued",
+        "message": f"Refreshing {upload['filename']}",
+        "job_id": job.id,
+        "document_id": job.document_id
+    }
@@ -1,5 +1,8 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -7,17 +10,106 @@ from jose import jwt, JWTError
 from passlib.context import CryptContext
 
 from ..db.mongodb import users_col
+from ..core.cache import TTLCache
 from ..core.config import settings
 
 pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# Token subject (email) -> user document, or _UNKNOWN_USER for a recent miss.
+# Each worker process has its own cache, so a change made through another
+# worker is visible here after at most USER_CACHE_TTL seconds.
+user_cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL, name="users")
+_UNKNOWN_USER = object()
+user_db_lookups = 0
+
 def hash_password(password: str) -> str:
     return pwd_ctx.hash(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
     return pwd_ctx.verify(plain, hashed)
 
+
+class PasswordQueueFull(Exception):
+    pass
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a dedicated thread pool.
+
+    Each call takes a few hundred ms of CPU. Running them inline would block
+    the event loop for every other request. Running them on the default
+    executor would crowd out other to_thread work. At most `workers` run at
+    once, and at most `max_queued` more wait. Beyond that, calls fail fast
+    with PasswordQueueFull so a login burst can't build an unbounded backlog.
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0  # submitted and not finished: running + queued
+        self.peak_queued = 0
+        self.calls = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    async def _submit(self, fn: Callable, *args):
+        if self.queue_depth >= self.max_queued:
+            self.rejected += 1
+            raise PasswordQueueFull(f"Password hashing queue is full ({self.max_queued} waiting)")
+        self.pending += 1
+        self.peak_queued = max(self.peak_queued, self.queue_depth)
+        submitted = time.perf_counter()
+        started = None
+
+        def timed():
+            nonlocal started
+            started = time.perf_counter()
+            return fn(*args)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            finished = time.perf_counter()
+            self.pending -= 1
+            self.calls += 1
+            if started is not None:
+                self.wait_seconds += started - submitted
+                self.run_seconds += finished - started
+
+    @property
+    def queue_depth(self) -> int:
+        # The pool runs min(pending, workers) calls; the rest wait
+        return max(0, self.pending - self.workers)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._submit(verify_password, plain, hashed)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "running": min(self.pending, self.workers),
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queued,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "mean_wait_ms": round(self.wait_seconds * 1000 / self.calls, 1) if self.calls else None,
+            "mean_hash_ms": round(self.run_seconds * 1000 / self.calls, 1) if self.calls else None,
+        }
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_QUEUE)
+
 def create_access_token(sub: str, expires_minutes: int | None = None) -> str:
     expire = datetime.utcnow() + timedelta(
         minutes=expires_minutes or settings.JWT_EXPIRES_MINUTES
@@ -39,8 +131,35 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     except JWTError:
         raise credentials_exception
 
-    user = await users_col().find_one({"email": email})
-    if not user:
+    user = await load_user(email)
+    if user is None:
         raise credentials_exception
-    user["id"] = str(user["_id"])
     return user
+
+
+async def load_user(email: str) -> Optional[dict]:
+    """User document for a token subject, served from `user_cache` when fresh."""
+    global user_db_lookups
+    cached = user_cache.get(email)
+    if cached is _UNKNOWN_USER:
+        return None
+    if cached is None:
+        user_db_lookups += 1
+        cached = await users_col().find_one({"email": email})
+        if cached is None:
+            if settings.USER_NEGATIVE_CACHE_TTL > 0:
+                user_cache.set(email, _UNKNOWN_USER, ttl=settings.USER_NEGATIVE_CACHE_TTL)
+            return None
+        cached["id"] = str(cached["_id"])
+        user_cache.set(email, cached)
+    # Handlers may modify the user they're given; keep the cached one intact
+    return dict(cached)
+
+
+def invalidate_user(email: str):
+    """Call after changing or deleting a user document, or creating one."""
+    user_cache.pop(email)
+
+
+def user_cache_stats() -> dict:
+    return {**user_cache.stats(), "db_lookups": user_db_lookups}
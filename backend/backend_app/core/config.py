@@ -13,12 +13,36 @@ class Settings:
         self.MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "pdfGpt")
         if not self.MONGO_URI:
             raise Exception("MONGO_URI not set in .env!")
+        self.MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+        self.MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+        self.MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "60000"))
+        self.MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+        # Chat history: messages per storage bucket, and per GET /history/{chat_id} page
+        self.CHAT_BUCKET_SIZE = int(os.getenv("CHAT_BUCKET_SIZE", "100"))
+        self.CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", "100"))
 
         # JWT
         self.JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
         self.JWT_ALG = os.getenv("JWT_ALG", "HS256")
         self.JWT_EXPIRES_MINUTES = int(os.getenv("JWT_EXPIRES_MINUTES", "1440"))
 
+        # Per-process cache of user documents looked up by get_current_user.
+        # Unknown subjects are remembered for USER_NEGATIVE_CACHE_TTL seconds (0 disables)
+        self.USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self.USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+        self.USER_NEGATIVE_CACHE_TTL = float(os.getenv("USER_NEGATIVE_CACHE_TTL", "5"))
+
+        # bcrypt runs on its own pool; requests beyond PASSWORD_HASH_MAX_QUEUE waiting get a 503
+        self.PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+        # Comma-separated emails of the users allowed to read /metrics (empty: nobody)
+        self.METRICS_ADMINS = {e.strip().lower() for e in os.getenv("METRICS_ADMINS", "").split(",") if e.strip()}
+
+        # Avatars are downscaled to fit AVATAR_MAX_PX x AVATAR_MAX_PX before upload
+        self.AVATAR_MAX_PX = int(os.getenv("AVATAR_MAX_PX", "256"))
+
         # Cloudinary
         self.CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
         self.CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
@@ -32,6 +56,15 @@ class Settings:
         self.PINECONE_ENV = os.getenv("PINECONE_ENV", "us-east-1")
         self.PINECONE_INDEX = os.getenv("PINECONE_INDEX", "pdfgpt")
 
+        # Vector store: "pinecone" or "local" (on-disk, per-document, for air-gapped runs)
+        self.VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+        self.VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "backend_app/rag_pipeline/vector_store")
+        # Documents with at least this many vectors use HNSW if hnswlib is installed (0 = always flat)
+        self.VECTOR_STORE_HNSW_MIN_VECTORS = int(os.getenv("VECTOR_STORE_HNSW_MIN_VECTORS", "5000"))
+        self.VECTOR_STORE_HNSW_M = int(os.getenv("VECTOR_STORE_HNSW_M", "16"))
+        self.VECTOR_STORE_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_STORE_HNSW_EF_CONSTRUCTION", "200"))
+        self.VECTOR_STORE_HNSW_EF_SEARCH = int(os.getenv("VECTOR_STORE_HNSW_EF_SEARCH", "64"))
+
         # Ollama (Local LLM)
         self.OLLAMA_BASE_URL = os.getenv(
             "OLLAMA_BASE_URL",
@@ -41,6 +74,105 @@ class Settings:
             "OLLAMA_MODEL",
             "mistral:7b-instruct"
         )
+        # Comma-separated list of Ollama servers; requests go to the least loaded one
+        self.OLLAMA_BASE_URLS = [
+            url.strip()
+            for url in os.getenv("OLLAMA_BASE_URLS", self.OLLAMA_BASE_URL).split(",")
+            if url.strip()
+        ]
+        self.OLLAMA_MAX_IN_FLIGHT = int(os.getenv("OLLAMA_MAX_IN_FLIGHT", "2"))  # per server
+        self.OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "180"))
+        self.OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "60"))
+
+        # Background ingestion
+        self.INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+        self.INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "50"))
+        # Running jobs are marked alive every INGEST_HEARTBEAT_SECONDS; a job
+        # whose heartbeat is 4x older lost its worker and is resumed from its checkpoint
+        self.INGEST_HEARTBEAT_SECONDS = float(os.getenv("INGEST_HEARTBEAT_SECONDS", "30"))
+
+        # OCR for scanned PDFs
+        self.OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+        self.OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+        self.OCR_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", "4"))
+
+        # Embedding model (shared by ingestion and /query)
+        self.EMBEDDER_MODEL = os.getenv("EMBEDDER_MODEL", "intfloat/e5-large-v2")
+        self.EMBEDDER_WARMUP = os.getenv("EMBEDDER_WARMUP", "false").lower() == "true"
+
+        # Passage embedding cache
+        self.EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+        self.EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "backend_app/rag_pipeline/embedding_cache")
+        self.EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "20000"))
+        self.EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float16")
+
+        # /query caches (seconds / entries)
+        self.QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "5000"))
+        self.QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "3600"))
+        self.MATCH_CACHE_SIZE = int(os.getenv("MATCH_CACHE_SIZE", "5000"))
+        self.MATCH_CACHE_TTL = float(os.getenv("MATCH_CACHE_TTL", "600"))
+
+        # Micro-batching of concurrent /query embeddings
+        self.QUERY_BATCHING = os.getenv("QUERY_BATCHING", "true").lower() == "true"
+        self.QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+        self.QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "5"))
+
+        # Website crawler: depth/page budget (defaults and caps for /website/upload),
+        # concurrency overall and per host, and the conditional-GET cache
+        self.CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+        self.CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+        self.CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+        self.CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "4"))
+        self.CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "30"))
+        self.CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "3"))
+        self.CRAWL_ROBOTS_TTL = float(os.getenv("CRAWL_ROBOTS_TTL", "3600"))
+        self.CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "Mozilla/5.0 (compatible; FilesGPTBot/1.0)")
+        self.CRAWL_CACHE_DIR = os.getenv("CRAWL_CACHE_DIR", "backend_app/rag_pipeline/crawl_cache")
+
+        # Hybrid retrieval: BM25 per document fused with dense search (reciprocal rank fusion)
+        self.HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+        self.BM25_DIR = os.getenv("BM25_DIR", "backend_app/rag_pipeline/bm25_index")
+        self.HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # per retriever
+        self.RRF_K = int(os.getenv("RRF_K", "60"))
+
+        # Optional cross-encoder rerank before the LLM prompt
+        self.RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+        self.RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+        self.RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+        self.RERANK_TOKEN_BUDGET = int(os.getenv("RERANK_TOKEN_BUDGET", "1500"))
+        self.RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+        self.RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", "3600"))
+
+        # Prompt context assembly. Tokens are estimated (~4 characters each) unless
+        # LLM_TOKENIZER names a Hugging Face tokenizer matching OLLAMA_MODEL. The
+        # mistralai repos are gated: accept their terms and set HF_TOKEN first, e.g.
+        # LLM_TOKENIZER=mistralai/Mistral-7B-Instruct-v0.2 for mistral:7b-instruct
+        self.LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "")
+        self.CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+        # Overlap encoding with vector upserts
+        self.UPSERT_PIPELINED = os.getenv("UPSERT_PIPELINED", "true").lower() == "true"
+        self.UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+        # Chunk boundaries: "tokens" or "content" (content-defined, so an edit only
+        # changes the chunks around it and a refresh re-embeds little; sized in
+        # embedder tokens or in characters) or "recursive" (fixed-size characters)
+        self.CHUNKER = os.getenv("CHUNKER", "tokens").lower()
+        # Token budget per chunk for CHUNKER=tokens; 0 fills the embedder's window
+        # (512 for E5, less the passage prefix), so no chunk gets truncated
+        self.CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "0"))
+        self.CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+
+        # Vector deletes go by id (ids are deterministic), DELETE_BATCH_SIZE per call
+        self.DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "1000"))
+        self.DELETE_CONCURRENCY = int(os.getenv("DELETE_CONCURRENCY", "4"))
+        self.DELETE_RETRIES = int(os.getenv("DELETE_RETRIES", "3"))
+        # Account deletion runs in the background and is retried up to this many times
+        self.ACCOUNT_DELETE_MAX_ATTEMPTS = int(os.getenv("ACCOUNT_DELETE_MAX_ATTEMPTS", "5"))
+        # Hours between orphaned-vector sweeps (0 disables), and how old an
+        # unreferenced document must be before the sweep deletes it
+        self.ORPHAN_SWEEP_INTERVAL_HOURS = float(os.getenv("ORPHAN_SWEEP_INTERVAL_HOURS", "0"))
+        self.ORPHAN_GRACE_HOURS = float(os.getenv("ORPHAN_GRACE_HOURS", "6"))
 
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from .config import settings
+
+
+class OllamaUnavailable(Exception):
+    """No backend slot became free within OLLAMA_QUEUE_TIMEOUT."""
+
+
+class OllamaBackend:
+    def __init__(self, base_url: str, max_in_flight: int):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.served = 0
+        self.failures = 0
+
+    @property
+    def load(self) -> float:
+        return (self.in_flight + self.waiting) / self.max_in_flight
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "served": self.served,
+            "failures": self.failures,
+        }
+
+
+class OllamaClient:
+    """
+    Long-lived async client for one or more Ollama servers.
+
+    One keep-alive httpx pool is shared by all requests. Each backend admits at
+    most `max_in_flight` generations; further calls queue on the least-loaded
+    backend (in flight + waiting, relative to its limit) and give up after
+    `queue_timeout`. Every call has an overall `deadline` in seconds.
+    """
+
+    def __init__(self, base_urls: List[str], max_in_flight: int, deadline: float, queue_timeout: float):
+        self.backends = [OllamaBackend(url, max_in_flight) for url in base_urls]
+        self.deadline = deadline
+        self.queue_timeout = queue_timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self.timeouts = 0
+        self.rejected = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None:
+            total = sum(b.max_in_flight for b in self.backends)
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.deadline, connect=10),
+                limits=httpx.Limits(max_connections=total, max_keepalive_connections=total),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def _slot(self):
+        backend = min(self.backends, key=lambda b: b.load)
+        backend.waiting += 1
+        try:
+            await asyncio.wait_for(backend.slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OllamaUnavailable(f"All Ollama backends busy for {self.queue_timeout:.0f}s")
+        finally:
+            backend.waiting -= 1
+
+        backend.in_flight += 1
+        try:
+            yield backend
+            backend.served += 1
+        except Exception:
+            backend.failures += 1
+            raise
+        finally:
+            backend.in_flight -= 1
+            backend.slots.release()
+
+    @staticmethod
+    def _payload(messages: List[Dict], options: Dict, stream: bool) -> Dict:
+        return {"model": settings.OLLAMA_MODEL, "messages": messages, "options": options, "stream": stream}
+
+    async def chat(self, messages: List[Dict], options: Dict) -> str:
+        """Non-streaming /api/chat; returns the message content."""
+        async with self._slot() as backend:
+            try:
+                response = await asyncio.wait_for(
+                    self.client.post(f"{backend.base_url}/api/chat", json=self._payload(messages, options, False)),
+                    timeout=self.deadline,
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            response.raise_for_status()
+            data = response.json()
+
+        if "message" not in data or "content" not in data["message"]:
+            raise ValueError("Invalid response from Ollama")
+        return data["message"]["content"]
+
+    async def stream_chat(self, messages: List[Dict], options: Dict) -> AsyncIterator[str]:
+        """
+        Streaming /api/chat; yields content tokens. Closing the generator closes
+        the upstream connection, which makes Ollama stop generating.
+        """
+        started = time.monotonic()
+        async with self._slot() as backend:
+            async with self.client.stream(
+                "POST", f"{backend.base_url}/api/chat", json=self._payload(messages, options, True)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if time.monotonic() - started > self.deadline:
+                        self.timeouts += 1
+                        raise asyncio.TimeoutError(f"Ollama generation exceeded {self.deadline:.0f}s")
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        raise ValueError(data["error"])
+                    token = data.get("message", {}).get("content", "")
+                    if token:
+                        yield token
+                    if data.get("done"):
+                        break
+
+    def stats(self) -> dict:
+        return {
+            "deadline_seconds": self.deadline,
+            "queue_timeout_seconds": self.queue_timeout,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "backends": [b.stats() for b in self.backends],
+        }
+
+
+ollama_client = OllamaClient(
+    settings.OLLAMA_BASE_URLS,
+    max_in_flight=settings.OLLAMA_MAX_IN_FLIGHT,
+    deadline=settings.OLLAMA_TIMEOUT,
+    queue_timeout=settings.OLLAMA_QUEUE_TIMEOUT,
+)
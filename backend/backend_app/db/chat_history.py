@@ -0,0 +1,168 @@
+"""
+Bucketed chat message storage.
+
+A chat's `history` document holds its metadata, the running `message_count`,
+`last_message`, and the first CHAT_BUCKET_SIZE messages inline in `messages`.
+This keeps the original document shape. Later messages go to `history_buckets`
+documents ({chat_id, user_id, bucket, count, messages}) of at most
+CHAT_BUCKET_SIZE messages each. `bucket_count` on the chat names the bucket
+being filled; 0 means the inline one.
+
+Appends only $push the new messages, so a write costs the same however long the
+conversation is, and no document approaches Mongo's 16 MB limit.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ..core.config import settings
+from .mongodb import history_buckets_col, history_col
+
+
+def new_chat_document(user_id: ObjectId, email: str, pdf_name: str, document_id: ObjectId,
+                      messages: List[dict]) -> Tuple[dict, List[dict]]:
+    """History document for a new chat, plus the messages that don't fit inline."""
+    size = settings.CHAT_BUCKET_SIZE
+    now = datetime.utcnow()
+    doc = {
+        "user_id": user_id,
+        "email": email,
+        "pdf_name": pdf_name,
+        "document_id": document_id,
+        "messages": messages[:size],
+        "message_count": len(messages[:size]),
+        "last_message": messages[:size][-1] if messages else None,
+        "bucket_count": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    return doc, messages[size:]
+
+
+async def append_messages(chat_id: ObjectId, user_id: ObjectId, messages: List[dict]) -> Optional[int]:
+    """
+    $push messages onto a chat, rolling over into a new bucket when the current
+    one is full. Returns the new message count, or None if the chat doesn't
+    exist for this user.
+
+    `message_count` moves with the messages: an inline append is one update
+    ($push + $inc). A bucket lives in another document, so the chat's count is
+    bumped right after the bucket write; a crash in between leaves the count
+    short, never ahead of the stored messages.
+    """
+    size = settings.CHAT_BUCKET_SIZE
+    chat = await history_col().find_one({"_id": chat_id, "user_id": user_id}, {"message_count": 1})
+    if chat is None:
+        return None
+    if not messages:
+        return chat.get("message_count", 0)
+    if chat.get("message_count") is None:
+        # Legacy chats without message_count start from their inline length
+        await history_col().update_one(
+            {"_id": chat_id, "message_count": {"$exists": False}},
+            [{"$set": {"message_count": {"$size": {"$ifNull": ["$messages", []]}}}}],
+        )
+
+    def counted(part: List[dict]) -> dict:
+        update = {"$inc": {"message_count": len(part)}, "$set": {"updated_at": datetime.utcnow()}}
+        if len(part) == len(remaining):
+            update["$set"]["last_message"] = part[-1]
+        return update
+
+    count = None
+    remaining = list(messages)
+    while remaining:
+        head = await history_col().aggregate([
+            {"$match": {"_id": chat_id}},
+            {"$project": {"bucket_count": 1, "inline": {"$size": {"$ifNull": ["$messages", []]}}}},
+        ]).to_list(length=1)
+        if not head:
+            return None  # deleted meanwhile
+        current = head[0].get("bucket_count") or 0
+
+        if current == 0:
+            # Legacy chats can hold more than `size` inline; those go straight to buckets
+            part = remaining[:max(0, size - head[0]["inline"])]
+            if part:
+                # Only succeeds while the inline bucket still has room for the whole part
+                chat = await history_col().find_one_and_update(
+                    {"_id": chat_id, "bucket_count": {"$in": [0, None]}, f"messages.{size - len(part)}": {"$exists": False}},
+                    {"$push": {"messages": {"$each": part}}, **counted(part)},
+                    projection={"message_count": 1},
+                    return_document=ReturnDocument.AFTER,
+                )
+                if chat is not None:
+                    count = chat["message_count"]
+                    remaining = remaining[len(part):]
+                continue
+        else:
+            bucket = await history_buckets_col().find_one({"chat_id": chat_id, "bucket": current}, {"count": 1})
+            part = remaining[:size - (bucket["count"] if bucket else 0)]
+            if part:
+                try:
+                    res = await history_buckets_col().update_one(
+                        {"chat_id": chat_id, "bucket": current, "count": {"$lte": size - len(part)}},
+                        {"$push": {"messages": {"$each": part}}, "$inc": {"count": len(part)},
+                         "$setOnInsert": {"user_id": user_id}},
+                        upsert=True,
+                    )
+                    if res.modified_count or res.upserted_id is not None:
+                        chat = await history_col().find_one_and_update(
+                            {"_id": chat_id}, counted(part),
+                            projection={"message_count": 1},
+                            return_document=ReturnDocument.AFTER,
+                        )
+                        if chat is None:
+                            return None  # deleted meanwhile
+                        count = chat["message_count"]
+                        remaining = remaining[len(part):]
+                except DuplicateKeyError:
+                    pass  # a concurrent append filled the bucket; look again
+                continue
+
+        # Current bucket is full: move on to the next one
+        await history_col().update_one(
+            {"_id": chat_id, "bucket_count": {"$in": [current, None] if current == 0 else [current]}},
+            {"$set": {"bucket_count": current + 1}},
+        )
+
+    return count
+
+
+async def read_messages(chat: dict, before: Optional[int] = None,
+                        limit: Optional[int] = None) -> Tuple[List[dict], int, int]:
+    """
+    Messages [start, end) of a chat, where end = `before` (default: all) and
+    start = end - limit. Only the buckets overlapping the window are fetched.
+    Returns (messages, start, total).
+    """
+    inline = chat.get("messages", [])
+    buckets = []
+    if chat.get("bucket_count"):
+        buckets = await history_buckets_col().find(
+            {"chat_id": chat["_id"]}, {"bucket": 1, "count": 1}
+        ).sort("bucket", 1).to_list(length=None)
+
+    total = len(inline) + sum(b.get("count", 0) for b in buckets)
+    end = total if before is None else max(0, min(before, total))
+    start = 0 if limit is None else max(0, end - limit)
+
+    window = inline[start:end]
+    offset = len(inline)
+    for bucket in buckets:
+        count = bucket.get("count", 0)
+        lo, hi = max(start, offset), min(end, offset + count)
+        if lo < hi:
+            part = await history_buckets_col().find_one(
+                {"_id": bucket["_id"]}, {"messages": {"$slice": [lo - offset, hi - lo]}}
+            )
+            window.extend(part.get("messages", []) if part else [])
+        offset += count
+    return window, start, total
+
+
+async def delete_chat_buckets(chat_id: ObjectId):
+    await history_buckets_col().delete_many({"chat_id": chat_id})
@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
 from ..core.config import settings
 
 _client = None
@@ -8,7 +9,14 @@ def get_client():
     if _client is None:
         if not settings.MONGO_URI:
             raise Exception("MONGO_URI is empty! Check your .env")
-        _client = AsyncIOMotorClient(settings.MONGO_URI)
+        # One pool per worker process, shared by every router and background job
+        _client = AsyncIOMotorClient(
+            settings.MONGO_URI,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGO_MAX_IDLE_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        )
     return _client
 
 def get_db():
@@ -22,3 +30,32 @@ def history_col():
 
 def uploads_col():
     return get_db()["uploads"]
+
+def history_buckets_col():
+    return get_db()["history_buckets"]
+
+def chunk_sets_col():
+    return get_db()["chunk_sets"]
+
+def account_deletions_col():
+    return get_db()["account_deletions"]
+
+
+async def ensure_indexes():
+    """Create the indexes the app's queries rely on; a no-op when they already exist."""
+    # History sidebar: newest chats of a user, keyset-paginated on (created_at, _id)
+    await history_col().create_index(
+        [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_created"
+    )
+    await history_col().create_index("document_id", name="document")
+    await history_buckets_col().create_index(
+        [("chat_id", ASCENDING), ("bucket", ASCENDING)], name="chat_bucket", unique=True
+    )
+    await history_buckets_col().create_index("user_id", name="user")
+    await uploads_col().create_index("user_id", name="user")
+    await uploads_col().create_index("job.id", name="job", sparse=True)
+    await uploads_col().create_index("resumed_jobs", name="resumed_jobs", sparse=True)
+    await uploads_col().create_index("job.status", name="job_status", sparse=True)
+    await uploads_col().create_index("vector_document_id", name="vector_document", sparse=True)
+    await chunk_sets_col().create_index("vector_user_id", name="vector_user")
+    await users_col().create_index("email", name="email")
@@ -1,7 +1,11 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
+from .core.auth import get_current_user, password_hasher, user_cache_stats
 from .core.config import settings
+from .core.ollama import ollama_client
+from .db.mongodb import ensure_indexes
 from .api.auth import router as auth_router
 from .api.pdf import router as pdf_router
 from .api.query import router as query_router
@@ -9,6 +13,16 @@ from .api.history import router as history_router
 from .api.save_history import router as save_history_router
 from .api.image import router as image_router
 from .api.website import router as website_router
+from .api.jobs import router as jobs_router
+from .rag_pipeline.jobs import job_manager
+from .rag_pipeline.embedding_service import embedding_service
+from .rag_pipeline import query_cache
+from .rag_pipeline.query_batcher import query_batcher
+from .rag_pipeline.reranker import reranker
+from .rag_pipeline import vector_cleanup
+from .rag_pipeline.crawler import crawler
+from .rag_pipeline.account_deletion import account_deletions
+from .rag_pipeline.image_loader import shutdown_ocr_pool
 
 # Initialize FastAPI app
 app = FastAPI(title=settings.PROJECT_NAME)
@@ -24,6 +38,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],          # allow GET, POST, PUT, DELETE etc.
     allow_headers=["*"],          # allow all headers (Authorization, Content-Type)
+    expose_headers=["X-Next-Cursor"],  # history pagination
 )
 
 
@@ -35,8 +50,57 @@ app.include_router(history_router)         # GET /history endpoints
 app.include_router(save_history_router)    # POST /chat/save/ endpoint
 app.include_router(image_router)
 app.include_router(website_router)
+app.include_router(jobs_router)            # GET/DELETE /jobs/{job_id}
+
+
+@app.on_event("startup")
+async def startup():
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        print(f"Index creation failed: {e}")
+    try:
+        await account_deletions.resume_pending()
+    except Exception as e:
+        print(f"Could not resume account deletions: {e}")
+    # Heartbeats for this worker's ingest jobs; resumes jobs whose worker died
+    job_manager.start_maintenance()
+    if settings.ORPHAN_SWEEP_INTERVAL_HOURS > 0:
+        asyncio.create_task(vector_cleanup.run_orphan_sweeps())
+    if settings.EMBEDDER_WARMUP:
+        await asyncio.to_thread(embedding_service.warmup)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    job_manager.shutdown()
+    password_hasher.shutdown()
+    account_deletions.shutdown()
+    shutdown_ocr_pool()
+    await ollama_client.aclose()
+    await crawler.aclose()
+
 
 # Health check endpoint
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+# Cache / pool counters for sizing; they expose per-user and ingest internals
+@app.get("/metrics")
+async def metrics(current_user: dict = Depends(get_current_user)):
+    if (current_user.get("email") or "").lower() not in settings.METRICS_ADMINS:
+        raise HTTPException(status_code=403, detail="Metrics are restricted to METRICS_ADMINS")
+    return {
+        "embedding_service": embedding_service.stats(),
+        "query_cache": query_cache.stats(),
+        "query_batcher": query_batcher.stats(),
+        "reranker": reranker.stats(),
+        "ollama": ollama_client.stats(),
+        "user_cache": user_cache_stats(),
+        "password_hasher": password_hasher.stats(),
+        "account_deletions": account_deletions.stats(),
+        "orphan_sweep": vector_cleanup.last_sweep,
+        "crawler": crawler.stats(),
+    }
@@ -0,0 +1,190 @@
+"""
+Account deletion as a resumable background job.
+
+DELETE /auth/me records a job in `account_deletions`, removes the user document
+and returns. The job then deletes the user's uploads with their vectors, and
+the user's chat history. Every step can be repeated safely. A failed attempt
+is retried with backoff up to ACCOUNT_DELETE_MAX_ATTEMPTS times. A job holds a
+lease while it runs, renewed as it goes, so several worker processes never
+work on the same account at once. Unfinished jobs resume at startup, and a
+periodic sweep picks up jobs whose worker died: they are retried once their
+lease runs out.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from ..core.config import settings
+from ..db.mongodb import account_deletions_col, history_buckets_col, history_col, uploads_col, users_col
+from .dedup import release_upload
+from .query_cache import invalidate_document
+from .vector_cleanup import delete_document_vectors
+
+LEASE = timedelta(minutes=15)
+# Renew the lease, and sweep for abandoned jobs, this often
+LEASE_RENEW_SECONDS = LEASE.total_seconds() / 3
+MAX_BACKOFF_SECONDS = 300
+
+
+class AccountDeletionManager:
+    def __init__(self, max_attempts: int):
+        self.max_attempts = max_attempts
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        # Identifies this process's leases
+        self._owner = uuid.uuid4().hex
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    async def start(self, user_id: ObjectId, email: str):
+        now = datetime.utcnow()
+        await account_deletions_col().update_one(
+            {"_id": user_id},
+            {"$setOnInsert": {"email": email, "status": "pending", "attempts": 0, "created_at": now}},
+            upsert=True,
+        )
+        self._spawn(user_id)
+
+    async def resume_pending(self):
+        """Pick up jobs interrupted by a restart; failed ones get a fresh round of attempts."""
+        await account_deletions_col().update_many({"status": "failed"}, {"$set": {"attempts": 0}})
+        async for job in account_deletions_col().find({}, {"_id": 1}):
+            self._spawn(job["_id"])
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep())
+
+    async def _sweep(self):
+        """Take over unfinished jobs of other workers (e.g. ones that crashed)."""
+        while True:
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+            try:
+                async for job in account_deletions_col().find({"status": {"$ne": "failed"}}, {"_id": 1}):
+                    self._spawn(job["_id"])
+            except Exception as e:
+                print(f"[WARN] Account deletion sweep failed: {e}")
+
+    def shutdown(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+
+    def _spawn(self, user_id: ObjectId):
+        key = str(user_id)
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            self._tasks[key] = asyncio.get_running_loop().create_task(self._run(user_id))
+
+    async def _claim(self, user_id: ObjectId):
+        now = datetime.utcnow()
+        return await account_deletions_col().find_one_and_update(
+            {"_id": user_id, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"status": "running", "lease_until": now + LEASE, "lease_owner": self._owner,
+                      "updated_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _wait_for_lease(self, user_id: ObjectId) -> bool:
+        """Sleep until another worker's lease on the job runs out; False once the job is gone."""
+        job = await account_deletions_col().find_one({"_id": user_id}, {"lease_until": 1})
+        if job is None:
+            return False
+        if job.get("lease_until"):
+            await asyncio.sleep(max(1.0, (job["lease_until"] - datetime.utcnow()).total_seconds() + 1))
+        return True
+
+    async def _renew_lease(self, user_id: ObjectId):
+        while True:
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+            now = datetime.utcnow()
+            res = await account_deletions_col().update_one(
+                {"_id": user_id, "lease_owner": self._owner},
+                {"$set": {"lease_until": now + LEASE, "updated_at": now}},
+            )
+            if not res.matched_count:
+                print(f"[WARN] Lost the lease on account deletion for user {user_id}")
+                return
+
+    async def _run(self, user_id: ObjectId):
+        try:
+            while True:
+                job = await self._claim(user_id)
+                if job is None:
+                    # Finished, or leased by another worker that may have died: retry at expiry
+                    if await self._wait_for_lease(user_id):
+                        continue
+                    return
+                renewer = asyncio.get_running_loop().create_task(self._renew_lease(user_id))
+                try:
+                    await self._delete_account_data(user_id)
+                except Exception as e:
+                    renewer.cancel()
+                    attempts = job.get("attempts", 0) + 1
+                    now = datetime.utcnow()
+                    if attempts >= self.max_attempts:
+                        self.failed += 1
+                        print(f"Account deletion for user {user_id} failed after {attempts} attempts: {e}")
+                        await account_deletions_col().update_one(
+                            {"_id": user_id},
+                            {"$set": {"status": "failed", "attempts": attempts, "error": str(e),
+                                      "lease_until": None, "updated_at": now}},
+                        )
+                        return
+                    self.retries += 1
+                    backoff = min(MAX_BACKOFF_SECONDS, 5 * 2 ** (attempts - 1))
+                    print(f"Account deletion for user {user_id} failed ({e}); retrying in {backoff}s")
+                    # Keep the lease through the backoff so no other worker starts meanwhile
+                    await account_deletions_col().update_one(
+                        {"_id": user_id},
+                        {"$set": {"status": "retrying", "attempts": attempts, "error": str(e),
+                                  "lease_until": now + timedelta(seconds=backoff), "updated_at": now}},
+                    )
+                    await asyncio.sleep(backoff)
+                    continue
+
+                renewer.cancel()
+                await account_deletions_col().delete_one({"_id": user_id})
+                self.completed += 1
+                print(f"Account deletion for user {user_id} finished")
+                return
+        finally:
+            self._tasks.pop(str(user_id), None)
+
+    async def _delete_account_data(self, user_id: ObjectId):
+        # The user document normally goes in the request already; repeat in case it didn't
+        await users_col().delete_one({"_id": user_id})
+
+        # Uploads one by one, so an interrupted job resumes with the ones left
+        uploads, vectors = 0, 0
+        async for upload in uploads_col().find({"user_id": user_id}):
+            if "released" in upload:
+                release = upload["released"]
+            else:
+                # Record the outcome: releasing twice would drop a chunk set reference twice
+                release = await release_upload(upload)
+                await uploads_col().update_one(
+                    {"_id": upload["_id"]}, {"$set": {"released": list(release) if release else None}}
+                )
+            if release:
+                vectors += await asyncio.to_thread(delete_document_vectors, *release)
+            invalidate_document(str(upload["_id"]), release[1] if release else None)
+            await uploads_col().delete_one({"_id": upload["_id"]})
+            uploads += 1
+
+        res_hist = await history_col().delete_many({"user_id": user_id})
+        await history_buckets_col().delete_many({"user_id": user_id})
+        print(f"Deleted {uploads} uploads ({vectors} vectors) and {res_hist.deleted_count} chats of user {user_id}")
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._tasks),
+            "completed": self.completed,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+
+account_deletions = AccountDeletionManager(settings.ACCOUNT_DELETE_MAX_ATTEMPTS)
@@ -0,0 +1,167 @@
+"""
+Per-document BM25 index for the lexical half of hybrid retrieval.
+
+Built during ingestion from the same chunk stream that gets embedded, then
+frozen into flat numpy arrays (CSR-style postings) under BM25_DIR/<document_id>/:
+
+    terms.npy     sorted vocabulary
+    offsets.npy   postings of terms[i] are [offsets[i], offsets[i + 1])
+    chunks.npy    chunk number of each posting (int32)
+    tfs.npy       term frequency of each posting (uint16)
+    lengths.npy   token count of each chunk (int32)
+    meta.json     vector id prefix, chunk count, average length
+
+Arrays are memory-mapped on load, so an index costs little until queried.
+"""
+import json
+import math
+import os
+import re
+import shutil
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.cache import TTLCache
+from ..core.config import settings
+
+K1 = 1.2
+B = 0.75
+
+# Words and identifiers such as "err-404", "v2.3.1", "ab_12/x"
+_TOKEN_RE = re.compile(r"\w+(?:[-./:]\w+)*")
+_PART_RE = re.compile(r"[-./:_]")
+
+_loaded = TTLCache(maxsize=256, ttl=3600, name="bm25_indexes")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        # Compound identifiers also match on their parts
+        parts = _PART_RE.split(token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def _index_path(document_id: str) -> str:
+    return os.path.join(settings.BM25_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", str(document_id)))
+
+
+class BM25Builder:
+    """Collects chunks in ingestion order; save() writes the frozen index."""
+
+    def __init__(self, id_prefix: str):
+        self.id_prefix = id_prefix
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+
+    def add(self, chunk_id: int, text: str):
+        # chunk_id is the vector id suffix; after a refresh these can have gaps
+        tokens = tokenize(text)
+        while len(self._lengths) <= chunk_id:
+            self._lengths.append(0)
+        self._lengths[chunk_id] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            self._postings[term].append((chunk_id, tf))
+
+    def save(self, document_id: str):
+        if not self._lengths:
+            return
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self._postings[t]) for t in terms])
+        chunks = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            postings = self._postings[term]
+            chunks[offsets[i]:offsets[i + 1]] = [c for c, _ in postings]
+            tfs[offsets[i]:offsets[i + 1]] = [min(tf, 65535) for _, tf in postings]
+        lengths = np.asarray(self._lengths, dtype=np.int32)
+
+        # Write next to the final location, then swap it in
+        path = _index_path(document_id)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, "terms.npy"), np.asarray(terms, dtype=str))
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp, "chunks.npy"), chunks)
+        np.save(os.path.join(tmp, "tfs.npy"), tfs)
+        np.save(os.path.join(tmp, "lengths.npy"), lengths)
+        filled = lengths[lengths > 0]
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"id_prefix": self.id_prefix, "chunks": len(lengths),
+                       "avg_length": float(filled.mean()) if len(filled) else 0.0}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        _loaded.pop(document_id)
+        print(f"BM25 index for {document_id}: {len(terms)} terms, {len(chunks)} postings, {len(lengths)} chunks")
+
+
+class BM25Index:
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.id_prefix = meta["id_prefix"]
+        self.avg_length = meta["avg_length"] or 1.0
+        self.terms = np.load(os.path.join(path, "terms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.chunks = np.load(os.path.join(path, "chunks.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "lengths.npy"), mmap_mode="r")
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Best chunks as (vector id, BM25 score)."""
+        n = len(self.lengths)
+        scores = np.zeros(n, dtype=np.float32)
+        norm = K1 * (1 - B + B * np.asarray(self.lengths, dtype=np.float32) / self.avg_length)
+        for term in set(tokenize(query)):
+            i = int(np.searchsorted(self.terms, term))
+            if i >= len(self.terms) or self.terms[i] != term:
+                continue
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            chunks = np.asarray(self.chunks[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[chunks] += idf * tfs * (K1 + 1) / (tfs + norm[chunks])
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(top_k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(f"{self.id_prefix}{int(c)}", float(scores[c])) for c in top]
+
+
+def load_index(document_id: str) -> Optional[BM25Index]:
+    index = _loaded.get(document_id)
+    if index is None:
+        path = _index_path(document_id)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None  # ingested before hybrid retrieval existed
+        index = BM25Index(path)
+        _loaded.set(document_id, index)
+    return index
+
+
+def search(document_id: str, query: str, top_k: int) -> List[Tuple[str, float]]:
+    index = load_index(document_id)
+    return index.search(query, top_k) if index else []
+
+
+def list_indexes() -> List[str]:
+    if not os.path.isdir(settings.BM25_DIR):
+        return []
+    # Skips half-written indexes (see BM25Builder.save)
+    return [name for name in os.listdir(settings.BM25_DIR) if not name.endswith(".tmp")]
+
+
+def delete_index(document_id: str):
+    _loaded.pop(document_id)
+    shutil.rmtree(_index_path(document_id), ignore_errors=True)
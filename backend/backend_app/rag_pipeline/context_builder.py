@@ -0,0 +1,126 @@
+"""
+Turns retrieved matches into the context block of the LLM prompt.
+
+Chunks overlap by up to CHUNK_OVERLAP characters (CHUNK_OVERLAP_TOKENS tokens
+with the token chunker), so neighbouring chunk ids of one document are merged
+into a single passage without the repeated span.
+Passages are kept in document order. If they don't fit the token budget, the
+least relevant passages are dropped first. Tokens are counted with the LLM's
+tokenizer when it can be loaded, otherwise estimated.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from .prepare_dataset import CHUNK_OVERLAP
+
+# Shorter suffix/prefix matches are treated as coincidence, not chunk overlap
+MIN_OVERLAP = 8
+# Longest overlap looked for, in characters (a token is rarely over 8)
+MAX_OVERLAP = max(2 * CHUNK_OVERLAP, 8 * settings.CHUNK_OVERLAP_TOKENS)
+
+_tokenizer = None
+_tokenizer_failed = False
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_failed
+    if _tokenizer is None and not _tokenizer_failed and settings.LLM_TOKENIZER:
+        with _tokenizer_lock:
+            if _tokenizer is None and not _tokenizer_failed:
+                try:
+                    from transformers import AutoTokenizer
+
+                    _tokenizer = AutoTokenizer.from_pretrained(settings.LLM_TOKENIZER)
+                except Exception as e:
+                    _tokenizer_failed = True
+                    print(f"LLM tokenizer {settings.LLM_TOKENIZER} unavailable ({e}); estimating token counts")
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    # ~4 characters per token for English prose
+    return max(1, len(text) // 4)
+
+
+def _relevance(match: Dict) -> float:
+    return match.get("rerank_score", match.get("score", 0.0))
+
+
+def _overlap(prev: str, nxt: str) -> int:
+    """Length of the longest suffix of `prev` that is also a prefix of `nxt`."""
+    for k in range(min(len(prev), len(nxt), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if prev.endswith(nxt[:k]):
+            return k
+    return 0
+
+
+def merge_passages(matches: List[Dict]) -> List[Dict]:
+    """
+    Group matches into passages of consecutive chunk ids per document.
+    Each passage has: document_id, first/last chunk id, text, relevance.
+    """
+    by_document: Dict[str, List[Dict]] = {}
+    for m in matches:
+        metadata = m.get("metadata") or {}
+        if metadata.get("content"):
+            by_document.setdefault(metadata.get("document_id"), []).append(m)
+
+    passages = []
+    for document_id, doc_matches in by_document.items():
+        doc_matches.sort(key=lambda m: m["metadata"].get("chunk_id", 0))
+        current: Optional[Dict] = None
+        for m in doc_matches:
+            chunk_id = m["metadata"].get("chunk_id")
+            content = m["metadata"]["content"]
+            if current is not None and chunk_id is not None and chunk_id == current["last"] + 1:
+                cut = _overlap(current["text"], content)
+                current["text"] += content[cut:] if cut else "\n" + content
+                current["last"] = chunk_id
+                current["relevance"] = max(current["relevance"], _relevance(m))
+                current["chunks"] += 1
+                continue
+            current = {"document_id": document_id, "first": chunk_id, "last": chunk_id, "text": content,
+                       "relevance": _relevance(m), "chunks": 1}
+            passages.append(current)
+    return passages
+
+
+def _truncate(text: str, budget: int) -> str:
+    # Shrink proportionally until the tokenizer agrees
+    while text and count_tokens(text) > budget:
+        text = text[:int(len(text) * 0.9)]
+    return text
+
+
+def build_context(matches: List[Dict], token_budget: int) -> Tuple[str, Dict]:
+    passages = merge_passages(matches)
+    raw_tokens = sum(count_tokens(m["metadata"]["content"]) for m in matches if (m.get("metadata") or {}).get("content"))
+
+    kept, used = [], 0
+    for passage in sorted(passages, key=lambda p: p["relevance"], reverse=True):
+        tokens = count_tokens(passage["text"])
+        if used + tokens > token_budget:
+            if kept:
+                continue
+            # The most relevant passage alone is too long: send what fits
+            passage = {**passage, "text": _truncate(passage["text"], token_budget)}
+            tokens = count_tokens(passage["text"])
+        kept.append(passage)
+        used += tokens
+
+    # Position order reads more naturally than relevance order
+    kept.sort(key=lambda p: (str(p["document_id"]), p["first"] if p["first"] is not None else 0))
+    context = "\n\n".join(p["text"] for p in kept)
+    return context, {
+        "chunks": len(matches),
+        "passages": len(passages),
+        "passages_sent": len(kept),
+        "raw_tokens": raw_tokens,
+        "context_tokens": used,
+        "tokens_saved": raw_tokens - used,
+    }
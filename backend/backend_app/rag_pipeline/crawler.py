@@ -0,0 +1,295 @@
+"""
+Asynchronous same-site crawler behind /website/upload.
+
+Breadth-first from the start URL, up to `max_depth` links away and
+`max_pages` pages in total. It stays on the start URL's host (a leading "www."
+is ignored), obeys robots.txt (including Crawl-delay), and fetches at most
+CRAWL_CONCURRENCY pages at once, CRAWL_PER_HOST of them from one host. All
+requests share one pooled httpx client.
+
+Every fetched page's ETag / Last-Modified and parsed result are kept in an on-disk
+cache (CRAWL_CACHE_DIR). A re-crawl sends conditional requests, so unchanged
+pages come back as 304s and are not downloaded or parsed again.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urldefrag, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from ..core.config import settings
+from .website_loader import parse_page
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_CRAWL_DELAY = 5.0
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+
+# progress(pages_done, page_budget)
+CrawlProgress = Callable[[int, int], None]
+
+
+def site_of(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def normalize_url(url: str) -> str:
+    url = urldefrag(url.strip())[0]
+    parts = urlsplit(url)
+    # "https://host" and "https://host/" are the same page
+    return url + "/" if not parts.path and not parts.query else url
+
+
+class CrawlCache:
+    """url -> {etag, last_modified, text, links}, one JSON file per URL."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url: str) -> Optional[Dict]:
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry if entry.get("url") == url else None
+        except (OSError, ValueError):
+            return None
+
+    def set(self, url: str, entry: Dict):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(url)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**entry, "url": url}, f)
+        os.replace(tmp, path)
+
+
+class WebsiteCrawler:
+    def __init__(self, cache_dir: str):
+        self.cache = CrawlCache(cache_dir)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._robots: Dict[str, Tuple[Optional[RobotFileParser], float]] = {}
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._host_next_at: Dict[str, float] = {}
+        self.pages = 0
+        self.not_modified = 0
+        self.failed = 0
+        self.robots_blocked = 0
+        self.bytes = 0
+        self.fetch_seconds = 0.0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # One client per event loop; ingest workers without the app's loop get their own
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers={
+                    "User-Agent": settings.CRAWL_USER_AGENT,
+                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                    "Accept-Language": "en-US,en;q=0.5",
+                },
+                timeout=httpx.Timeout(settings.CRAWL_TIMEOUT),
+                limits=httpx.Limits(max_connections=settings.CRAWL_CONCURRENCY,
+                                    max_keepalive_connections=settings.CRAWL_CONCURRENCY),
+                follow_redirects=True,
+            )
+            self._client_loop = loop
+            self._host_slots.clear()
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _slot(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(settings.CRAWL_PER_HOST)
+        return self._host_slots[host]
+
+    async def _robots_for(self, url: str) -> Optional[RobotFileParser]:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        cached = self._robots.get(origin)
+        if cached and time.monotonic() - cached[1] < settings.CRAWL_ROBOTS_TTL:
+            return cached[0]
+
+        parser: Optional[RobotFileParser] = None
+        try:
+            resp = await self.client.get(origin + "/robots.txt")
+            if resp.status_code == 200:
+                parser = RobotFileParser()
+                parser.parse(resp.text.splitlines())
+            # No robots.txt (4xx) or an unreachable one: nothing is disallowed
+        except httpx.HTTPError as e:
+            print(f"Could not read {origin}/robots.txt: {e}")
+        self._robots[origin] = (parser, time.monotonic())
+        return parser
+
+    async def _polite_wait(self, host: str, robots: Optional[RobotFileParser]):
+        delay = robots.crawl_delay(settings.CRAWL_USER_AGENT) if robots else None
+        if not delay:
+            return
+        delay = min(float(delay), MAX_CRAWL_DELAY)
+        now = time.monotonic()
+        start = max(now, self._host_next_at.get(host, now))
+        self._host_next_at[host] = start + delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def fetch(self, url: str) -> Optional[Tuple[str, str, List[str]]]:
+        """(final url, text, links) of an HTML page, or None if it isn't one or robots.txt forbids it."""
+        robots = await self._robots_for(url)
+        if robots and not robots.can_fetch(settings.CRAWL_USER_AGENT, url):
+            self.robots_blocked += 1
+            return None
+
+        cached = await asyncio.to_thread(self.cache.get, url)
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        host = urlsplit(url).hostname or ""
+        attempts = max(1, settings.CRAWL_RETRIES)  # CRAWL_RETRIES=0 still fetches once
+        for attempt in range(attempts):
+            try:
+                async with self._slot(host):
+                    await self._polite_wait(host, robots)
+                    started = time.perf_counter()
+                    resp = await self.client.get(url, headers=headers)
+                    self.fetch_seconds += time.perf_counter() - started
+            except httpx.TransportError as e:
+                if attempt == attempts - 1:
+                    raise
+                print(f"Fetching {url} failed ({e}); retrying")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+                continue
+
+            if resp.status_code == 304 and cached:
+                self.not_modified += 1
+                return cached.get("final_url", url), cached["text"], cached["links"]
+            if resp.status_code in RETRY_STATUSES and attempt < attempts - 1:
+                retry_after = resp.headers.get("Retry-After", "")
+                await asyncio.sleep(min(float(retry_after), MAX_CRAWL_DELAY) if retry_after.isdigit()
+                                    else 0.5 * 2 ** attempt)
+                continue
+            resp.raise_for_status()
+            break
+
+        self.pages += 1
+        self.bytes += len(resp.content)
+        if not resp.headers.get("content-type", "text/html").lower().startswith(HTML_TYPES):
+            return None
+        final_url = str(resp.url)
+        text, links = await asyncio.to_thread(parse_page, resp.text, final_url)
+        if resp.headers.get("etag") or resp.headers.get("last-modified"):
+            await asyncio.to_thread(self.cache.set, url, {
+                "etag": resp.headers.get("etag"),
+                "last_modified": resp.headers.get("last-modified"),
+                "final_url": final_url,
+                "text": text,
+                "links": links,
+            })
+        return final_url, text, links
+
+    async def crawl(self, start_url: str, max_depth: int = 0, max_pages: int = 1,
+                    progress: Optional[CrawlProgress] = None) -> List[Tuple[str, str]]:
+        """
+        [(url, text)] of the pages reached, ordered by depth then URL. Fails if
+        the start page can't be fetched; other failing pages are skipped.
+        """
+        start_url = normalize_url(start_url)
+        site = site_of(start_url)
+        seen = {start_url}
+        queue: asyncio.Queue = asyncio.Queue()
+        queue.put_nowait((start_url, 0))
+        pages: Dict[str, Tuple[int, str]] = {}
+        errors: Dict[str, Exception] = {}
+        done = 0
+
+        async def worker():
+            nonlocal done
+            while True:
+                url, depth = await queue.get()
+                try:
+                    result = await self.fetch(url)
+                    if result is not None:
+                        final_url, text, links = result
+                        if site_of(final_url) == site and text:
+                            pages.setdefault(final_url, (depth, text))
+                        if depth < max_depth:
+                            for link in links:
+                                link = normalize_url(link)
+                                if (len(seen) < max_pages and link not in seen
+                                        and urlsplit(link).scheme in ("http", "https") and site_of(link) == site):
+                                    seen.add(link)
+                                    queue.put_nowait((link, depth + 1))
+                except Exception as e:
+                    self.failed += 1
+                    errors[url] = e
+                    print(f"Skipping {url}: {e}")
+                finally:
+                    done += 1
+                    queue.task_done()
+                if progress:
+                    progress(done, len(seen))
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, settings.CRAWL_CONCURRENCY))]
+        join = asyncio.create_task(queue.join())
+        try:
+            # A worker only returns early by raising (e.g. the job was cancelled from `progress`)
+            await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (join, *workers):
+                task.cancel()
+            outcomes = await asyncio.gather(*workers, return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+
+        if start_url in errors:
+            raise _describe(errors[start_url])
+        if not pages:
+            raise RuntimeError("Failed to extract website text: No text content found on the page")
+        return [(url, text) for url, (depth, text) in sorted(pages.items(), key=lambda p: (p[1][0], p[0]))]
+
+    def stats(self) -> dict:
+        fetched = self.pages + self.not_modified
+        return {
+            "pages_downloaded": self.pages,
+            "not_modified": self.not_modified,
+            "not_modified_rate": round(self.not_modified / fetched, 4) if fetched else 0.0,
+            "failed": self.failed,
+            "robots_blocked": self.robots_blocked,
+            "bytes": self.bytes,
+            "mean_fetch_ms": round(self.fetch_seconds * 1000 / fetched, 1) if fetched else None,
+        }
+
+
+def _describe(error: Exception) -> RuntimeError:
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status == 403:
+            return RuntimeError("Failed to extract website text: Access denied (403) - "
+                                "The website may be blocking automated requests")
+        if status == 404:
+            return RuntimeError("Failed to extract website text: Page not found (404)")
+        return RuntimeError(f"Failed to extract website text: HTTP {status} - {error}")
+    if isinstance(error, httpx.TimeoutException):
+        return RuntimeError("Failed to extract website text: Request timed out")
+    return RuntimeError(f"Failed to extract website text: {error}")
+
+
+crawler = WebsiteCrawler(settings.CRAWL_CACHE_DIR)
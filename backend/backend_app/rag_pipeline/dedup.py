@@ -0,0 +1,136 @@
+"""
+Content-addressed upload deduplication.
+
+Every upload is hashed (raw bytes for files, normalized text for websites). The
+first upload of some content owns a "chunk set": its vectors, stored under its
+own document_id, plus a reference count in the `chunk_sets` collection. A later
+upload with the same hash just points its `vector_document_id` at that chunk set
+instead of re-embedding. Vectors are deleted once the last reference goes away.
+"""
+import hashlib
+import re
+from datetime import datetime
+from typing import Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ..db.mongodb import chunk_sets_col, uploads_col
+
+_HASH_CHUNK = 1 << 20
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def chunk_set_key(model_name: str, kind: str, content_hash: str) -> str:
+    # Vectors are only reusable if the same extractor (text vs OCR) and the
+    # same embedding model produced them
+    return f"{model_name}:{kind}:{content_hash}"
+
+
+async def claim_chunk_set(document_id: str, key: str, content_hash: str) -> Optional[dict]:
+    """
+    If a chunk set for `key` exists, take a reference to it and point the upload
+    `document_id` at its vectors. Returns the chunk set, or None on a miss.
+    """
+    chunk_set = await chunk_sets_col().find_one_and_update(
+        {"_id": key, "ref_count": {"$gt": 0}},
+        {"$inc": {"ref_count": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not chunk_set:
+        return None
+
+    await uploads_col().update_one(
+        {"_id": ObjectId(document_id)},
+        {"$set": {
+            "content_hash": content_hash,
+            "chunk_set": key,
+            "vector_document_id": chunk_set["vector_document_id"],
+            "vector_user_id": chunk_set["vector_user_id"],
+            "chunks_upserted": chunk_set["chunk_count"],
+            "deduplicated": True,
+        }},
+    )
+    print(f"Dedup hit: document {document_id} reuses vectors of {chunk_set['vector_document_id']}")
+    return chunk_set
+
+
+async def register_chunk_set(document_id: str, user_id: str, key: str, content_hash: str, chunk_count: int):
+    """Record a freshly ingested upload as the owner of a new chunk set."""
+    update = {
+        "content_hash": content_hash,
+        "vector_document_id": document_id,
+        "vector_user_id": user_id,
+    }
+    try:
+        await chunk_sets_col().insert_one({
+            "_id": key,
+            "vector_document_id": document_id,
+            "vector_user_id": user_id,
+            "chunk_count": chunk_count,
+            "ref_count": 1,
+            "created_at": datetime.utcnow(),
+        })
+        update["chunk_set"] = key
+    except DuplicateKeyError:
+        # The same content finished ingesting concurrently; keep this copy standalone
+        pass
+
+    await uploads_col().update_one({"_id": ObjectId(document_id)}, {"$set": update})
+
+
+async def release_upload(upload: dict) -> Optional[Tuple[str, str, Optional[int]]]:
+    """
+    Drop the upload's reference to its vectors.
+
+    Returns (vector_user_id, vector_document_id, chunk_count) when the vectors
+    are no longer referenced and must be deleted, or None when other uploads
+    still use them. chunk_count is None when it isn't known (e.g. the ingest
+    failed part-way).
+    """
+    document_id = str(upload["_id"])
+    key = upload.get("chunk_set")
+    # Refreshed documents keep unchanged chunks in place, so their ids can run past the chunk count
+    chunk_count = upload.get("vector_slots") or upload.get("chunks_upserted") or None
+    if not key:
+        # Legacy or standalone upload: it owns its own vectors
+        return str(upload.get("user_id")), upload.get("vector_document_id", document_id), chunk_count
+
+    chunk_set = await chunk_sets_col().find_one_and_update(
+        {"_id": key},
+        {"$inc": {"ref_count": -1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if chunk_set is None:
+        return upload.get("vector_user_id"), upload.get("vector_document_id", document_id), chunk_count
+    if chunk_set["ref_count"] > 0:
+        return None
+
+    await chunk_sets_col().delete_one({"_id": key, "ref_count": {"$lte": 0}})
+    return chunk_set["vector_user_id"], chunk_set["vector_document_id"], chunk_set.get("chunk_count")
+
+
+async def resolve_vector_document_id(document_id: str) -> str:
+    """document_id under which the upload's vectors are stored (differs for dedup hits)."""
+    if not ObjectId.is_valid(document_id):
+        return document_id
+    upload = await uploads_col().find_one({"_id": ObjectId(document_id)}, {"vector_document_id": 1})
+    if upload and upload.get("vector_document_id"):
+        return upload["vector_document_id"]
+    return document_id
@@ -0,0 +1,230 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; keep to one worker process there
+    fcntl = None
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of passage embeddings keyed by (model name, chunk-text hash).
+
+    - Memory tier: LRU of the most recently used vectors.
+    - Disk tier: a memory-mapped array of vectors (float16 or float32) plus an
+      append-only key index, one key per line, where line N is row N of the array.
+      A row is written and flushed before its key is appended, so a crash never
+      leaves a key pointing at a missing vector.
+
+    Several worker processes can share the disk tier. Appends hold an exclusive
+    lock on `keys.<dtype>.lock` and first read the keys other processes added,
+    so each row number is taken from the keys file itself.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        dim: int,
+        cache_dir: str,
+        memory_items: int = 20000,
+        dtype: str = "float16",
+        grow_rows: int = 4096,
+    ):
+        self.model_name = model_name
+        self.dim = dim
+        self.memory_items = memory_items
+        self.dtype = np.dtype(dtype)
+        self.grow_rows = grow_rows
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        model_dir = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        os.makedirs(model_dir, exist_ok=True)
+        self._vectors_path = os.path.join(model_dir, f"vectors.{self.dtype.name}.bin")
+        self._keys_path = os.path.join(model_dir, f"keys.{self.dtype.name}.txt")
+        self._lock_path = os.path.join(model_dir, f"keys.{self.dtype.name}.lock")
+
+        self._rows: Dict[str, int] = {}
+        self._keys_offset = 0  # bytes of the keys file read so far
+        self._key_count = 0  # lines read so far: the next row
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._load_index()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._encode_seconds = 0.0
+        self._encoded_texts = 0
+
+    # ---------- Keys ----------
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    # ---------- Disk tier ----------
+
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _vector_rows(self) -> int:
+        return os.path.getsize(self._vectors_path) // self._row_bytes() if os.path.exists(self._vectors_path) else 0
+
+    def _load_index(self):
+        self._read_new_keys()
+        self._open(max(self._vector_rows(), self.grow_rows))
+
+    def _read_new_keys(self):
+        """Index the complete key lines appended since the last read, by this or another process."""
+        if not os.path.exists(self._keys_path):
+            return
+        vector_rows = self._vector_rows()
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith(b"\n") or self._key_count >= vector_rows:
+                    break  # torn by a crashed writer
+                key = line.strip().decode("ascii", "replace")
+                if len(key) == 64:
+                    self._rows[key] = self._key_count
+                self._keys_offset += len(line)
+                self._key_count += 1
+        if self._vectors is not None and self._key_count > self._capacity:
+            self._open(vector_rows)  # rows past our mapping, grown by another worker
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _open(self, capacity: int):
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < capacity * self._row_bytes():
+                f.truncate(capacity * self._row_bytes())
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        with self._file_lock():
+            # Rows other workers appended since we last looked come first
+            self._read_new_keys()
+            fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+            if not fresh:
+                return
+            keys, vectors = [keys[i] for i in fresh], vectors[fresh]
+
+            start = self._key_count
+            if start + len(keys) > self._capacity:
+                # Another worker may already have grown the file past what we have mapped
+                needed = start + len(keys) - self._capacity
+                self._open(max(self._vector_rows(), self._capacity + max(self.grow_rows, needed)))
+
+            self._vectors[start:start + len(keys)] = vectors.astype(self.dtype, copy=False)
+            self._vectors.flush()
+            data = "".join(f"{k}\n" for k in keys).encode("ascii")
+            with open(self._keys_path, "ab") as f:
+                f.truncate(self._keys_offset)  # drop a line torn by a crashed writer
+                f.write(data)
+            self._keys_offset += len(data)
+            self._key_count += len(keys)
+            for offset, k in enumerate(keys):
+                self._rows[k] = start + offset
+
+    # ---------- Memory tier ----------
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # ---------- Public API ----------
+
+    def encode(self, texts: Sequence[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Return float32 embeddings for `texts`, calling `encode_fn` once with
+        only the texts that are in neither tier.
+        """
+        keys = [self.key(t) for t in texts]
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, k in enumerate(keys):
+                vector = self._memory.get(k)
+                if vector is not None:
+                    self._memory.move_to_end(k)
+                    self.memory_hits += 1
+                    out[i] = vector
+                    continue
+                row = self._rows.get(k)
+                if row is not None:
+                    vector = np.asarray(self._vectors[row], dtype=np.float32)
+                    self._remember(k, vector)
+                    self.disk_hits += 1
+                    out[i] = vector
+                    continue
+                # Repeated texts within one call are encoded once
+                missing.setdefault(k, []).append(i)
+            self.misses += len(missing)
+
+        if not missing:
+            return out
+
+        miss_keys = list(missing)
+        started = time.perf_counter()
+        encoded = np.asarray(encode_fn([texts[missing[k][0]] for k in miss_keys]), dtype=np.float32)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._encode_seconds += elapsed
+            self._encoded_texts += len(miss_keys)
+            new_keys, new_rows = [], []
+            for k, vector in zip(miss_keys, encoded):
+                for i in missing[k]:
+                    out[i] = vector
+                self._remember(k, vector)
+                if k not in self._rows:
+                    new_keys.append(k)
+                    new_rows.append(vector)
+            if new_keys:
+                self._append(new_keys, np.stack(new_rows))
+
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            per_text = self._encode_seconds / self._encoded_texts if self._encoded_texts else 0.0
+            return {
+                "model": self.model_name,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(self._rows),
+                "encode_seconds": round(self._encode_seconds, 3),
+                "encode_seconds_saved": round(hits * per_text, 3),
+            }
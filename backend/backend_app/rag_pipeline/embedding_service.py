@@ -0,0 +1,126 @@
+import copy
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .embedding_cache import EmbeddingCache
+
+
+def _pick_device() -> str:
+    import torch
+
+    # Device Setup (MPS / CUDA / CPU)
+    if torch.backends.mps.is_available():
+        return "mps"
+    if torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
+class EmbeddingService:
+    """
+    The one SentenceTransformer (E5) instance of the process, shared by ingestion
+    and /query. The model is loaded on first use, or up front via warmup().
+
+    E5 models expect "query: " / "passage: " prefixes; callers pass raw text and
+    use encode_queries or encode_passages. Vectors are L2-normalized.
+    """
+
+    QUERY_PREFIX = "query: "
+    PASSAGE_PREFIX = "passage: "
+
+    def __init__(self, model_name: str, device: Optional[str] = None):
+        self.model_name = model_name
+        # Identifies the vector space: model plus the prefixing scheme
+        self.namespace = f"{model_name}|e5-prefixed"
+        self._device = device
+        self._model = None
+        self._cache: Optional[EmbeddingCache] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load()
+        return self._model
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        started = time.perf_counter()
+        device = self._device or _pick_device()
+        model = SentenceTransformer(self.model_name, device=device)
+        self.load_seconds = time.perf_counter() - started
+        print(f"Loaded embedding model {self.model_name} on {device} in {self.load_seconds:.1f}s")
+
+        if settings.EMBED_CACHE_ENABLED:
+            # Boilerplate chunks (footers, disclaimers, OCR headers) repeat across documents
+            self._cache = EmbeddingCache(
+                self.namespace,
+                model.get_sentence_embedding_dimension(),
+                cache_dir=settings.EMBED_CACHE_DIR,
+                memory_items=settings.EMBED_CACHE_MEMORY_ITEMS,
+                dtype=settings.EMBED_CACHE_DTYPE,
+            )
+        self._model = model
+
+    def warmup(self):
+        self.model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def passage_tokenizer(self) -> Tuple[Optional[object], int]:
+        """
+        (tokenizer, tokens of passage text the model reads without truncating):
+        the model's window less the passage prefix and special tokens. The
+        tokenizer is None when it can't report character offsets (not a "fast" one).
+        """
+        tokenizer = getattr(self._local, "tokenizer", None)
+        if tokenizer is None:
+            # A copy per thread: the shared one is reconfigured by every encode() call,
+            # and a Rust tokenizer borrowed by two threads at once raises
+            tokenizer = self._local.tokenizer = copy.deepcopy(self.model.tokenizer)
+        if not getattr(tokenizer, "is_fast", False):
+            return None, 0
+        reserved = len(tokenizer(self.PASSAGE_PREFIX)["input_ids"])
+        return tokenizer, self.model.max_seq_length - reserved
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+        )
+
+    def encode_queries(self, texts: Sequence[str]) -> np.ndarray:
+        return self._encode([self.QUERY_PREFIX + t for t in texts])
+
+    def encode_passages(self, texts: Sequence[str]) -> np.ndarray:
+        prefixed = [self.PASSAGE_PREFIX + t for t in texts]
+        self.model  # loads the model and creates the cache
+        if self._cache is None:
+            return self._encode(prefixed)
+        # Only cache misses reach the model
+        return self._cache.encode(prefixed, self._encode)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "loaded": self.loaded,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "cache": self._cache.stats() if self._cache else None,
+        }
+
+
+embedding_service = EmbeddingService(settings.EMBEDDER_MODEL)
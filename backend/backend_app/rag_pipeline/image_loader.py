@@ -1,8 +1,18 @@
+import io
+import multiprocessing
 import os
 import platform
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
 from PIL import Image
 import pytesseract
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+
+from ..core.config import settings
 
 # ---------- OS-Specific Setup ----------
 system_name = platform.system()
@@ -40,24 +50,126 @@ def extract_text_from_image_file(file_path: str) -> str:
     return text
 
 
-def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
-    """Extract text from PDF bytes by converting pages to images first."""
-    text = ""
-
+def _poppler_kwargs() -> dict:
     # Pass poppler_path only if set
-    pages = (
-        convert_from_bytes(pdf_bytes, poppler_path=POPPLER_PATH)
-        if POPPLER_PATH
-        else convert_from_bytes(pdf_bytes)
+    return {"poppler_path": POPPLER_PATH} if POPPLER_PATH else {}
+
+
+def _ocr_image_in_memory(image: Image.Image) -> str:
+    """
+    OCR a PIL image by piping it to Tesseract's stdin as an uncompressed PPM,
+    avoiding the temp-file round trip pytesseract does internally.
+    """
+    buf = io.BytesIO()
+    image.convert("RGB").save(buf, format="PPM")
+    proc = subprocess.run(
+        [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout"],
+        input=buf.getvalue(),
+        capture_output=True,
+        check=True,
+        # Parallelism comes from the process pool; keep each Tesseract single-threaded
+        env={**os.environ, "OMP_THREAD_LIMIT": "1"},
     )
+    return proc.stdout.decode("utf-8", errors="ignore").strip()
 
-    for page_num, page in enumerate(pages, start=1):
-        temp_path = os.path.join(UPLOAD_DIR, f"temp_page_{page_num}.png")
-        page.save(temp_path, "PNG")
-        text += extract_text_from_image_file(temp_path) + "\n"
-        os.remove(temp_path)
 
-    text = text.strip()
+def _ocr_page_window(pdf_bytes: bytes, first_page: int, last_page: int, dpi: int) -> List[str]:
+    """
+    Rasterize pages [first_page, last_page] and OCR them in memory.
+    Runs inside a worker process; only this window's images are ever alive.
+    """
+    pages = convert_from_bytes(
+        pdf_bytes, dpi=dpi, first_page=first_page, last_page=last_page, **_poppler_kwargs()
+    )
+    texts = []
+    for page in pages:
+        texts.append(_ocr_image_in_memory(page))
+        page.close()
+    return texts
+
+
+# One OCR pool per process, shared by every ingest job: OCR_WORKERS processes in
+# total however many jobs run, and the spawn start-up is paid once
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _ocr_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that already holds torch/BLAS threads is unsafe
+            _pool = ProcessPoolExecutor(max_workers=max(1, settings.OCR_WORKERS),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _page_windows(page_count: int, window: int) -> List[Tuple[int, int]]:
+    return [
+        (first, min(first + window - 1, page_count))
+        for first in range(1, page_count + 1, window)
+    ]
+
+
+def extract_text_from_pdf_bytes(
+    pdf_bytes: bytes,
+    workers: Optional[int] = None,
+    dpi: Optional[int] = None,
+    window: Optional[int] = None,
+    progress: Optional[Callable[[str, int, Optional[int]], None]] = None,
+) -> str:
+    """
+    Extract text from PDF bytes by rasterizing pages and OCR-ing them.
+
+    Pages are rasterized in bounded windows (first_page/last_page) and the
+    windows are OCR-ed on the shared process pool, at most `workers` at a time
+    for this call, so memory stays bounded and all cores are used. Page order
+    is preserved. `progress("extract", windows_done, windows)` is called after
+    each window; a job's report() raises there once it is cancelled.
+    """
+    workers = workers or settings.OCR_WORKERS
+    dpi = dpi or settings.OCR_DPI
+    window = window or settings.OCR_PAGE_WINDOW
+
+    page_count = pdfinfo_from_bytes(pdf_bytes, **_poppler_kwargs())["Pages"]
+    windows = _page_windows(page_count, window)
+    print(f"OCR: {page_count} pages in {len(windows)} windows, {workers} workers, {dpi} dpi")
+
+    results = []
+    if workers <= 1 or len(windows) == 1:
+        for first, last in windows:
+            results.append(_ocr_page_window(pdf_bytes, first, last, dpi))
+            if progress:
+                progress("extract", len(results), len(windows))
+    else:
+        pool = _ocr_pool()
+        pending = deque()
+        todo = deque(windows)
+        try:
+            # Keep `workers` windows in flight; collecting in submission order keeps pages in order
+            while todo or pending:
+                while todo and len(pending) < workers:
+                    first, last = todo.popleft()
+                    pending.append(pool.submit(_ocr_page_window, pdf_bytes, first, last, dpi))
+                results.append(pending.popleft().result())
+                if progress:
+                    progress("extract", len(results), len(windows))
+        except BrokenProcessPool:
+            shutdown_ocr_pool()  # a worker died; the next call starts a fresh pool
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    text = "\n".join(page_text for window_texts in results for page_text in window_texts).strip()
 
     print("\n=== Extracted Text ===\n")
     print(text)
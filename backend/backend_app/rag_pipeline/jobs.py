@@ -0,0 +1,619 @@
+import asyncio
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from bson import ObjectId
+
+from ..core.config import settings
+from ..db.mongodb import chunk_sets_col, uploads_col
+from .dedup import chunk_set_key, claim_chunk_set, hash_text, register_chunk_set, release_upload
+from .embedding_service import embedding_service
+from .prepare_dataset import Page, process_pages_and_store
+from .query_cache import invalidate_document
+from .reindex import refresh_document, stored_manifest
+from .reranker import reranker
+from .vector_cleanup import delete_document_vectors, delete_vector_ids, stale_vector_ids, vector_id_prefix
+
+# Ordered ingestion stages reported by every job
+STAGES = ("extract", "chunk", "embed", "upsert")
+ACTIVE_STATES = ("queued", "running")
+
+# What an extractor returns: the full text, or a lazy stream of pages
+Extracted = Union[str, Iterable[Page]]
+
+# Minimum seconds between progress writes to the uploads document
+PERSIST_INTERVAL = 1.0
+
+# kind -> factory(uploads document) -> extract function. Lets an interrupted or
+# failed upload be resumed without the request that created it.
+ExtractorFactory = Callable[[dict], Callable[["IngestJob"], Extracted]]
+_extractors: Dict[str, ExtractorFactory] = {}
+
+
+def register_extractor(kind: str, factory: ExtractorFactory):
+    _extractors[kind] = factory
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class JobQueueFull(Exception):
+    """Raised when too many ingestion jobs are already queued or running."""
+
+
+class JobConflict(Exception):
+    """Raised when a document can't be refreshed in its current state."""
+
+
+class IngestJob:
+    def __init__(self, user_id: str, source: str, kind: str, content_hash: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.source = source
+        self.kind = kind
+        self.document_id: Optional[str] = None
+        # Known up front for file uploads (hash of the bytes); websites hash their text
+        self.content_hash = content_hash
+        self.deduplicated = False
+        # {"committed", "manifest"} of an earlier attempt when resuming
+        self.checkpoint: Optional[dict] = None
+        # Set for refreshes of an ingested document (see reindex.py); their outcome once done
+        self.refresh: Optional[dict] = None
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.progress = {stage: {"done": 0, "total": None} for stage in STAGES}
+        self.chunks = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[datetime] = None
+
+        self._cancel = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._on_progress: Optional[Callable[["IngestJob"], None]] = None
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def report(self, stage: str, done: int, total: Optional[int] = None):
+        """
+        Progress callback handed to the pipeline. Called from the worker thread,
+        it is also the cancellation point: a cancelled job stops at the next report.
+        """
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+        self.stage = stage
+        entry = self.progress[stage]
+        entry["done"] = done
+        if total is not None:
+            entry["total"] = total
+        self.updated_at = datetime.utcnow()
+
+        if self._on_progress:
+            self._on_progress(self)
+
+    def to_record(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {stage: dict(entry) for stage, entry in self.progress.items()},
+            "error": self.error,
+            "deduplicated": self.deduplicated,
+            "resumed_from": (self.checkpoint or {}).get("committed", 0),
+            "refresh": self.refresh,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "finished_at": self.finished_at,
+        }
+
+    def to_public(self) -> dict:
+        record = self.to_record()
+        record["job_id"] = record.pop("id")
+        record["document_id"] = self.document_id
+        record["source"] = self.source
+        record["chunks"] = self.chunks
+        return record
+
+
+class IngestJobManager:
+    """
+    Runs upload ingestion (extract -> chunk -> embed -> upsert) off the event loop.
+
+    At most `max_workers` jobs run at once on a dedicated thread pool; the rest
+    wait in the "queued" state. Job state lives in memory and is mirrored into
+    the `job` field of the matching `uploads` document.
+
+    Content already ingested by an earlier upload is not embedded again: the job
+    points the new document at the existing chunk set (see dedup.py).
+
+    Every stored batch is checkpointed on the uploads document (`checkpoint`:
+    chunks committed so far plus a per-chunk digest manifest). A job that
+    failed, or whose worker died (its heartbeat went stale), resumes from the
+    first unconfirmed batch instead of starting over.
+
+    A refresh job re-extracts an ingested document and diffs its chunks
+    against that manifest, embedding only the ones that changed.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, history_limit: int = 500):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history_limit = history_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._jobs: Dict[str, IngestJob] = {}
+        # Ids of jobs that were resumed -> the job that now carries on their work
+        self._resumed_as: Dict[str, str] = {}
+        self._maintenance: Optional[asyncio.Task] = None
+        self.resumed = 0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    def active_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status in ACTIVE_STATES)
+
+    def ensure_capacity(self):
+        if self.active_count() >= self.max_pending:
+            raise JobQueueFull(f"Ingestion queue is full ({self.max_pending} jobs pending)")
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        """The job, or the one it was resumed as."""
+        return self._jobs.get(self._resumed_as.get(job_id, job_id))
+
+    def submit(self, job: IngestJob, extract: Callable[[IngestJob], Extracted]) -> IngestJob:
+        self.ensure_capacity()
+        loop = asyncio.get_running_loop()
+        self._jobs[job.id] = job
+        job._on_progress = self._progress_persister(loop)
+        job._task = loop.create_task(self._run(job, extract))
+        return job
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        job = self.get(job_id)
+        if not job or job.status not in ACTIVE_STATES:
+            return job
+
+        job._cancel.set()
+        # A queued job has not reached the thread pool yet, so it can be dropped
+        # right away. A running one stops at its next progress report.
+        if job.status == "queued" and job._task:
+            job._task.cancel()
+        return job
+
+    async def resume(self, upload: dict) -> Optional[IngestJob]:
+        """
+        Requeue an upload from its checkpoint. Returns None when its kind can't
+        be resumed or another worker claimed it first.
+        """
+        old = upload.get("job") or {}
+        factory = _extractors.get(old.get("kind"))
+        if factory is None:
+            return None
+        self.ensure_capacity()
+
+        refresh = old.get("refresh") is not None
+        # A refresh hashes the new content itself
+        job = IngestJob(user_id=str(upload["user_id"]), source=upload.get("filename"), kind=old["kind"],
+                        content_hash=None if refresh else upload.get("content_hash"))
+        job.document_id = str(upload["_id"])
+        if refresh:
+            # A refresh starts over; its diff skips whatever is already stored
+            job.refresh = {}
+        else:
+            job.checkpoint = upload.get("checkpoint")
+        # Swapping in the new job id is the claim: only one worker matches the old one.
+        # The old id stays resolvable through resumed_jobs for clients still polling it.
+        claimed = await uploads_col().find_one_and_update(
+            {"_id": upload["_id"], "job.id": old.get("id")},
+            {"$set": {"job": job.to_record()}, "$addToSet": {"resumed_jobs": old.get("id")}},
+        )
+        if claimed is None:
+            return None
+        for alias in [old.get("id")] + list(claimed.get("resumed_jobs") or []):
+            self._resumed_as[alias] = job.id
+        self.resumed += 1
+        print(f"Resuming upload {job.document_id} as job {job.id} "
+              f"({(job.checkpoint or {}).get('committed', 0)} chunks already stored)")
+        return self.submit(job, factory(upload))
+
+    def stale_before(self) -> datetime:
+        """Active jobs not heard from since then have lost their worker."""
+        return datetime.utcnow() - timedelta(seconds=4 * settings.INGEST_HEARTBEAT_SECONDS)
+
+    def start_maintenance(self):
+        if self._maintenance is None:
+            self._maintenance = asyncio.get_running_loop().create_task(self._maintain())
+
+    async def _maintain(self):
+        """Heartbeat this worker's active jobs and resume jobs whose worker went away."""
+        interval = settings.INGEST_HEARTBEAT_SECONDS
+        while True:
+            try:
+                now = datetime.utcnow()
+                active = [job.id for job in self._jobs.values() if job.status in ACTIVE_STATES]
+                if active:
+                    await uploads_col().update_many({"job.id": {"$in": active}}, {"$set": {"job.heartbeat_at": now}})
+
+                stale = self.stale_before()
+                async for upload in uploads_col().find({
+                    "job.status": {"$in": list(ACTIVE_STATES)},
+                    "job.id": {"$nin": active},
+                    "$or": [{"job.heartbeat_at": {"$lt": stale}},
+                            {"job.heartbeat_at": None, "job.updated_at": {"$lt": stale}}],
+                }):
+                    try:
+                        await self.resume(upload)
+                    except JobQueueFull:
+                        break
+            except Exception as e:
+                print(f"[WARN] Ingest maintenance failed: {e}")
+            await asyncio.sleep(interval)
+
+    def shutdown(self):
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+        for job in self._jobs.values():
+            if job.status in ACTIVE_STATES:
+                job._cancel.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, job: IngestJob, extract: Callable[[IngestJob], Extracted]):
+        try:
+            async with self._get_slots():
+                if job.cancel_requested:
+                    raise JobCancelled(f"Job {job.id} was cancelled")
+                job.status = "running"
+                await self._persist(job)
+
+                await self._ingest(job, extract)
+                job.status = "succeeded"
+                # Anything cached for this document predates the new vectors
+                invalidate_document(job.document_id)
+                reranker.invalidate_document(job.document_id)
+        except (JobCancelled, asyncio.CancelledError):
+            job.status = "cancelled"
+        except Exception as e:
+            print(f"[ERROR] Ingest job {job.id} failed: {e}")
+            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = job.updated_at = datetime.utcnow()
+            await self._persist(job)
+            self._prune()
+
+    async def _ingest(self, job: IngestJob, extract: Callable[[IngestJob], Extracted]):
+        if job.refresh is not None:
+            return await self._refresh(job, extract)
+        loop = asyncio.get_running_loop()
+
+        # A resumed upload already has vectors of its own; keep building on them
+        resuming = bool((job.checkpoint or {}).get("committed"))
+        if job.content_hash and not resuming and await self._reuse_chunk_set(job):
+            return
+        hash_checked = job.content_hash is not None or resuming
+
+        job.report("extract", 0, 1)
+        extracted = await loop.run_in_executor(self._executor, extract, job)
+        if isinstance(extracted, str):
+            if not extracted.strip():
+                raise ValueError("No text could be extracted from the provided source")
+            if not job.content_hash:
+                job.content_hash = hash_text(extracted)
+            pages = [(None, extracted)]
+        else:
+            # Streamed pages are read lazily by the chunker below
+            pages = extracted
+        job.report("extract", 1, 1)
+
+        # The extractor may only learn the hash itself (e.g. after a download)
+        if not hash_checked and job.content_hash and await self._reuse_chunk_set(job):
+            return
+
+        job.chunks = await loop.run_in_executor(
+            self._executor,
+            lambda: process_pages_and_store(
+                pages,
+                user_id=job.user_id,
+                document_id=job.document_id,
+                source=job.source,
+                progress=job.report,
+                checkpoint=job.checkpoint,
+                on_commit=self._checkpointer(job, loop),
+                on_span=self._span_saver(job, loop),
+            ),
+        )
+        if job.chunks == 0:
+            raise ValueError("No text could be extracted from the provided source")
+        await self._drop_stale_chunks(job, resuming)
+
+        if job.content_hash:
+            await register_chunk_set(
+                job.document_id, job.user_id, chunk_set_key(embedding_service.namespace, job.kind, job.content_hash),
+                job.content_hash, job.chunks
+            )
+
+    async def _drop_stale_chunks(self, job: IngestJob, resuming: bool):
+        """
+        A resumed run can chunk the source into fewer pieces than an earlier
+        attempt stored (a re-download, a changed chunker). Delete the ids past
+        the new end, up to the highest one ever sent (`vector_slots`), and trim
+        the checkpoint to match.
+        """
+        loop = asyncio.get_running_loop()
+        upload = await uploads_col().find_one({"_id": ObjectId(job.document_id)}, {"vector_slots": 1})
+        span = (upload or {}).get("vector_slots")
+        if span is None and not resuming:
+            span = job.chunks  # a first attempt has nothing beyond its own chunks
+        # Attempts from before vector_slots was recorded are found by listing
+        ids = await loop.run_in_executor(self._executor, stale_vector_ids,
+                                         job.user_id, job.document_id, job.chunks, span)
+        if ids:
+            print(f"Deleting {len(ids)} chunks of document {job.document_id} left by an earlier, longer attempt")
+            await loop.run_in_executor(self._executor, delete_vector_ids, ids, job.document_id)
+
+        await uploads_col().update_one({"_id": ObjectId(job.document_id)}, [{"$set": {
+            "vector_slots": job.chunks,
+            "checkpoint.committed": {"$min": ["$checkpoint.committed", job.chunks]},
+            "checkpoint.manifest": {"$slice": [{"$ifNull": ["$checkpoint.manifest", []]}, job.chunks]},
+        }}])
+
+    async def _reuse_chunk_set(self, job: IngestJob) -> bool:
+        chunk_set = await claim_chunk_set(
+            job.document_id, chunk_set_key(embedding_service.namespace, job.kind, job.content_hash), job.content_hash
+        )
+        if not chunk_set:
+            return False
+
+        job.deduplicated = True
+        job.chunks = chunk_set["chunk_count"]
+        for stage in STAGES:
+            job.report(stage, job.chunks, job.chunks)
+        return True
+
+    async def _refresh(self, job: IngestJob, extract: Callable[[IngestJob], Extracted]):
+        loop = asyncio.get_running_loop()
+        upload = await uploads_col().find_one({"_id": ObjectId(job.document_id)})
+        if upload is None:
+            raise ValueError("The document no longer exists")
+        old_vector_document_id = upload.get("vector_document_id") or job.document_id
+        vector_document_id = await self._refresh_target(upload)
+        forked = vector_document_id != old_vector_document_id
+        previous = stored_manifest({} if forked else upload)
+
+        job.report("extract", 0, 1)
+        extracted = await loop.run_in_executor(self._executor, extract, job)
+        if isinstance(extracted, str):
+            if not extracted.strip():
+                raise ValueError("No text could be extracted from the provided source")
+            if not job.content_hash:
+                job.content_hash = hash_text(extracted)
+            pages = [(None, extracted)]
+        else:
+            pages = extracted
+        job.report("extract", 1, 1)
+
+        result = await loop.run_in_executor(
+            self._executor,
+            lambda: refresh_document(
+                pages,
+                user_id=job.user_id,
+                source=job.source,
+                document_id=vector_document_id,
+                previous=previous,
+                progress=job.report,
+                # A fork is unreferenced until it is done; the orphan sweep covers it
+                on_span=None if forked else self._span_saver(job, loop),
+            ),
+        )
+        job.chunks = result["stats"]["chunks"]
+
+        # Switch to the new manifest before deleting what it no longer lists
+        await uploads_col().update_one({"_id": upload["_id"]}, {
+            "$set": {
+                "checkpoint": {"committed": job.chunks, "manifest": result["digests"], "slots": result["slots"],
+                               "pending_delete": result["removed"], "updated_at": datetime.utcnow()},
+                "vector_document_id": vector_document_id,
+                "vector_user_id": job.user_id,
+                "vector_slots": result["span"],
+                "content_hash": job.content_hash,
+                "refreshed_at": datetime.utcnow(),
+            },
+            "$unset": {"chunk_set": "", "deduplicated": ""},
+        })
+        if result["removed"]:
+            prefix = vector_id_prefix(job.user_id, vector_document_id)
+            await loop.run_in_executor(self._executor, delete_vector_ids,
+                                       [f"{prefix}{slot}" for slot in result["removed"]], vector_document_id)
+            await uploads_col().update_one({"_id": upload["_id"]}, {"$unset": {"checkpoint.pending_delete": ""}})
+
+        if forked:
+            release = await release_upload(upload)
+            if release:
+                await loop.run_in_executor(self._executor, lambda: delete_document_vectors(*release))
+        # Matches are cached under the vector document id, which differs for deduplicated uploads,
+        # and refreshed chunk ids may now hold different text
+        for doc_id in {vector_document_id, old_vector_document_id}:
+            invalidate_document(job.document_id, doc_id)
+            reranker.invalidate_document(doc_id)
+        job.refresh = result["stats"]
+        print(f"Refreshed document {job.document_id}: {job.refresh}")
+
+    async def _refresh_target(self, upload: dict) -> str:
+        """
+        vector_document_id to refresh. Vectors other uploads share (a chunk set
+        with other references, or another upload's) are left alone; the
+        refresh then builds a new copy under a fresh id.
+        """
+        document_id = str(upload["_id"])
+        vector_document_id = upload.get("vector_document_id") or document_id
+        key = upload.get("chunk_set")
+        if not key:
+            return vector_document_id
+        if vector_document_id == document_id:
+            # Unregistering the chunk set stops new uploads from sharing it; it only
+            # succeeds while this upload is the one reference
+            res = await chunk_sets_col().delete_one({"_id": key, "ref_count": {"$lte": 1}})
+            if res.deleted_count or await chunk_sets_col().find_one({"_id": key}, {"_id": 1}) is None:
+                await uploads_col().update_one({"_id": upload["_id"]}, {"$unset": {"chunk_set": ""}})
+                upload.pop("chunk_set")
+                return vector_document_id
+        return str(ObjectId())
+
+    def _span_saver(self, job: IngestJob, loop: asyncio.AbstractEventLoop) -> Callable[[int], None]:
+        def save_from_thread(span: int):
+            asyncio.run_coroutine_threadsafe(
+                uploads_col().update_one({"_id": ObjectId(job.document_id)}, {"$max": {"vector_slots": span}}), loop
+            ).result()
+
+        return save_from_thread
+
+    def _checkpointer(self, job: IngestJob, loop: asyncio.AbstractEventLoop) -> Callable[[int, int, List[str]], None]:
+        def commit_from_thread(start: int, end: int, digests: List[str]):
+            # Wait for the write: the next batch only counts once this one is recorded
+            asyncio.run_coroutine_threadsafe(self._save_checkpoint(job, start, end, digests), loop).result()
+
+        return commit_from_thread
+
+    async def _save_checkpoint(self, job: IngestJob, start: int, end: int, digests: List[str]):
+        """Record chunks [start, end) as stored, extending the manifest kept so far."""
+        query = {"_id": ObjectId(job.document_id)}
+        manifest = {"$literal": digests}
+        if start:
+            # Only extend a manifest that covers everything before `start`
+            query["checkpoint.committed"] = {"$gte": start}
+            manifest = {"$concatArrays": [{"$slice": ["$checkpoint.manifest", start]}, {"$literal": digests}]}
+        try:
+            await uploads_col().update_one(query, [{"$set": {
+                "checkpoint.committed": end,
+                "checkpoint.manifest": manifest,
+                "checkpoint.updated_at": datetime.utcnow(),
+            }}])
+        except Exception as e:
+            # Resuming then just redoes more batches
+            print(f"[WARN] Could not checkpoint job {job.id} at chunk {end}: {e}")
+
+    def _progress_persister(self, loop: asyncio.AbstractEventLoop) -> Callable[[IngestJob], None]:
+        last = {"at": 0.0, "stage": None}
+
+        def persist_from_thread(job: IngestJob):
+            now = time.monotonic()
+            if job.stage == last["stage"] and now - last["at"] < PERSIST_INTERVAL:
+                return
+            last["at"], last["stage"] = now, job.stage
+            asyncio.run_coroutine_threadsafe(self._persist(job), loop)
+
+        return persist_from_thread
+
+    async def _persist(self, job: IngestJob):
+        if not job.document_id:
+            return
+        update = {"job": job.to_record()}
+        if job.status == "succeeded":
+            update["chunks_upserted"] = job.chunks
+        try:
+            await uploads_col().update_one({"_id": ObjectId(job.document_id)}, {"$set": update})
+        except Exception as e:
+            print(f"[WARN] Could not persist state of job {job.id}: {e}")
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.status not in ACTIVE_STATES]
+        overflow = len(self._jobs) - self.history_limit
+        if overflow <= 0:
+            return
+        finished.sort(key=lambda j: j.finished_at or j.created_at)
+        for job in finished[:overflow]:
+            self._jobs.pop(job.id, None)
+        self._resumed_as = {old: new for old, new in self._resumed_as.items() if new in self._jobs}
+
+
+job_manager = IngestJobManager(
+    max_workers=settings.INGEST_WORKERS,
+    max_pending=settings.INGEST_MAX_PENDING,
+)
+
+
+async def enqueue_ingest(
+    current_user: dict,
+    filename: str,
+    stored_as: str,
+    kind: str,
+    extract: Callable[[IngestJob], Extracted],
+    content_hash: Optional[str] = None,
+    options: Optional[dict] = None,
+) -> IngestJob:
+    """
+    Record the upload in MongoDB and queue it on the ingestion pool.
+    `extract(job)` runs in a worker thread and returns the document text or a
+    lazy stream of (page, text); the job then chunks, embeds and upserts it
+    unless the content is a duplicate. `options` are kept on the upload for
+    the extractor factory when the job is resumed.
+    """
+    job_manager.ensure_capacity()
+
+    job = IngestJob(user_id=str(current_user["_id"]), source=filename, kind=kind, content_hash=content_hash)
+    result = await uploads_col().insert_one({
+        "user_id": ObjectId(current_user["_id"]),
+        "email": current_user["email"],
+        "filename": filename,
+        "stored_as": stored_as,
+        "content_hash": content_hash,
+        "options": options or {},
+        "chunks_upserted": 0,
+        "job": job.to_record(),
+        "created_at": datetime.utcnow()
+    })
+    job.document_id = str(result.inserted_id)
+
+    try:
+        return job_manager.submit(job, extract)
+    except JobQueueFull:
+        await uploads_col().delete_one({"_id": result.inserted_id})
+        raise
+
+
+async def enqueue_refresh(
+    upload: dict,
+    extract: Callable[[IngestJob], Extracted],
+    content_hash: Optional[str] = None,
+    update: Optional[dict] = None,
+) -> IngestJob:
+    """
+    Queue a refresh of an ingested upload: `extract(job)` fetches the new
+    version, and only chunks that are not stored yet get embedded (see
+    reindex.py). `update` is set on the upload together with the claim, e.g.
+    the path of a newly uploaded file.
+    """
+    record = upload.get("job") or {}
+    if record.get("status") in ACTIVE_STATES and \
+            (record.get("heartbeat_at") or record.get("updated_at") or datetime.min) >= job_manager.stale_before():
+        raise JobConflict("The document is still being ingested")
+    if record.get("status") != "succeeded" and record.get("refresh") is None:
+        raise JobConflict("The document was never fully ingested; retry its job instead")
+    job_manager.ensure_capacity()
+
+    job = IngestJob(user_id=str(upload["user_id"]), source=upload.get("filename"), kind=record.get("kind"),
+                    content_hash=content_hash)
+    job.document_id = str(upload["_id"])
+    job.refresh = {}
+    # Same claim as resume(): only one request replaces the current job id
+    claimed = await uploads_col().find_one_and_update(
+        {"_id": upload["_id"], "job.id": record.get("id")},
+        {"$set": {"job": job.to_record(), **(update or {})}, "$unset": {"resumed_jobs": ""}},
+    )
+    if claimed is None:
+        raise JobConflict("The document is already being refreshed")
+    return job_manager.submit(job, extract)
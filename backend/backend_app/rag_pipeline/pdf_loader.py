@@ -2,13 +2,22 @@ import os
 import fitz
 import requests
 from bs4 import BeautifulSoup
-from typing import Tuple
+from typing import Iterator, Tuple
 
-def extract_text_from_pdf(file_path: str) -> str:
+def iter_pdf_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) one page at a time, so large PDFs are never fully in memory."""
     doc = fitz.open(file_path)
-    pages = [page.get_text("text") for page in doc]
-    doc.close()
-    return "\n\n".join(pages).strip()
+    try:
+        for page in doc:
+            yield page.number + 1, page.get_text("text")
+    finally:
+        doc.close()
+
+def extract_text_from_pdf(file_path: str) -> str:
+    return "\n\n".join(text for _, text in iter_pdf_pages(file_path)).strip()
+
+def is_pdf(file_path: str, content_type: str) -> bool:
+    return "application/pdf" in content_type.lower() or file_path.lower().endswith(".pdf")
 
 def download_file_from_url(url: str, dest_path: str, timeout: int = 15) -> Tuple[str, str]:
     resp = requests.get(url, timeout=timeout)
@@ -21,7 +30,7 @@ def download_file_from_url(url: str, dest_path: str, timeout: int = 15) -> Tuple
 
 def extract_text_from_url_maybe_html(file_path: str, content_type: str) -> str:
     # Determine if PDF
-    if "application/pdf" in content_type.lower() or file_path.lower().endswith(".pdf"):
+    if is_pdf(file_path, content_type):
         text = extract_text_from_pdf(file_path)
         print("\n=== Final Extracted Text ===\n")
         print(text)
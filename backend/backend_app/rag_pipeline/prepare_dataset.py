@@ -1,65 +1,360 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
 from ..core.config import settings
-from typing import List, Dict
-import torch
+from .bm25 import BM25Builder
+from .embedding_service import embedding_service
+from .vector_store import vector_store
+from collections import deque
+from collections.abc import Sized
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import bisect
+import hashlib
+import re
+import time
+import zlib
 
-device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
 
-EMBEDDER_MODEL = "intfloat/e5-large-v2"
-embedder = SentenceTransformer(EMBEDDER_MODEL, device=device)
-EMBEDDINGS_DIM = embedder.get_sentence_embedding_dimension()
+# Content-defined chunking: a chunk may end after a word whose hash over the
+# last CDC_WINDOW words is divisible by CDC_DIVISOR (on average every 32 words)
+CDC_WINDOW = 4
+CDC_DIVISOR = 32
+_WORD_RE = re.compile(r"\S+\s*")
 
-pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-if settings.PINECONE_INDEX not in pc.list_indexes().names():
-    pc.create_index(
-        name=settings.PINECONE_INDEX,
-        dimension=EMBEDDINGS_DIM,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-index = pc.Index(settings.PINECONE_INDEX)
+# (page number, page text); page number is None for sources without pages
+Page = Tuple[Optional[int], str]
 
 
-def chunk_text_to_chunks(text: str, source: str, user_id: str, document_id: str) -> List[Dict]:
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150, separators=["\n\n", "\n", " ", ""])
-    chunks = splitter.split_text(text)
-    out = []
-    for i, chunk in enumerate(chunks):
-        out.append({
+def _make_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                          separators=["\n\n", "\n", " ", ""])
+
+
+def iter_text_chunks(pages: Iterable[Page], chunk_size: int = CHUNK_SIZE,
+                     chunk_overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    """
+    Incrementally split a stream of pages into (chunk, page_start, page_end).
+
+    Pages are joined with blank lines as before, but only a small window of text
+    is held at a time: once the buffer is a few chunks long it is split, every
+    chunk but the last is emitted, and splitting resumes from the start of the
+    last chunk. That chunk already begins with the overlap of its predecessor,
+    so every chunk keeps the size/overlap limits.
+
+    The cuts are not identical to splitting the whole document at once: each
+    window re-splits from the carried chunk, which moves later boundaries
+    (276 vs 273 chunks on a 3-page sample). Chunk ids and digests are therefore
+    not comparable with documents split in one piece; such uploads refresh
+    with more chunks re-embedded, not wrong ones.
+    """
+    splitter = _make_splitter(chunk_size, chunk_overlap)
+    flush_at = chunk_size * 4
+    buffer = ""
+    # Start offset of each page within the buffer, and its page number
+    page_offsets: List[int] = []
+    page_numbers: List[Optional[int]] = []
+
+    def page_at(offset: int) -> Optional[int]:
+        i = bisect.bisect_right(page_offsets, offset) - 1
+        return page_numbers[max(i, 0)] if page_numbers else None
+
+    def split(final: bool):
+        nonlocal buffer, page_offsets, page_numbers
+        chunks = splitter.split_text(buffer)
+        if not final and len(chunks) < 2:
+            return
+
+        keep = chunks if final else chunks[:-1]
+        cursor = 0
+        for chunk in keep:
+            pos = buffer.find(chunk, cursor)
+            if pos < 0:
+                pos = cursor
+            yield chunk, page_at(pos), page_at(pos + len(chunk) - 1)
+            cursor = pos + 1
+
+        if final:
+            buffer, page_offsets, page_numbers = "", [], []
+            return
+
+        # Carry the last (possibly incomplete) chunk over into the next window
+        tail = buffer.find(chunks[-1], cursor)
+        tail = tail if tail >= 0 else cursor
+        first_page = page_at(tail)
+        buffer = buffer[tail:]
+        kept = [(o - tail, n) for o, n in zip(page_offsets, page_numbers) if o > tail]
+        page_offsets = [0] + [o for o, _ in kept]
+        page_numbers = [first_page] + [n for _, n in kept]
+
+    for page_no, page_text in pages:
+        if buffer:
+            buffer += "\n\n"
+        page_offsets.append(len(buffer))
+        page_numbers.append(page_no)
+        buffer += page_text
+
+        if len(buffer) >= flush_at:
+            yield from split(final=False)
+
+    if buffer.strip():
+        yield from split(final=True)
+
+
+# (word with its trailing whitespace, size, page number); sizes are characters or model tokens
+Unit = Tuple[str, int, Optional[int]]
+
+
+def _cut_content_defined(units: Iterable[Unit], chunk_size: int,
+                         chunk_overlap: int) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    """
+    Group words into (chunk, page_start, page_end) at content-defined boundaries.
+
+    Words are collected until a cut point. Once the chunk is half full, a cut
+    follows a paragraph end or a word whose rolling hash hits (see CDC_DIVISOR);
+    a full chunk is always cut. Cut points depend only on the nearby text, so
+    an edit changes the chunks around it and the chunking falls back into step
+    right after, instead of shifting every later boundary. Each chunk starts
+    with up to `chunk_overlap` (whole words) of the previous one; overlap plus
+    body never exceed `chunk_size`. No unit may be larger than the body.
+    """
+    body_max = max(1, chunk_size - chunk_overlap)
+    body_min = body_max // 2
+    words: List[str] = []
+    sizes: List[int] = []
+    pages_of: List[Optional[int]] = []
+    size = 0
+    window: deque = deque(maxlen=CDC_WINDOW)
+    overlap, overlap_page = "", None
+
+    def cut() -> Tuple[str, Optional[int], Optional[int]]:
+        nonlocal words, sizes, pages_of, size, overlap, overlap_page
+        chunk = (overlap + "".join(words)).strip()
+        page_start = overlap_page if overlap else pages_of[0]
+        page_end = pages_of[-1]
+
+        # The trailing whole words that fit become the next chunk's overlap
+        keep, kept = 0, 0
+        for n in reversed(sizes):
+            if kept + n > chunk_overlap:
+                break
+            kept += n
+            keep += 1
+        overlap = "".join(words[len(words) - keep:])
+        overlap_page = pages_of[len(words) - keep] if keep else None
+        words, sizes, pages_of, size = [], [], [], 0
+        return chunk, page_start, page_end
+
+    for word, n, page_no in units:
+        if words and size + n > body_max:
+            yield cut()
+        words.append(word)
+        sizes.append(n)
+        pages_of.append(page_no)
+        size += n
+        window.append(word.strip())
+        if size >= body_min and (word.count("\n") >= 2 or
+                                 zlib.crc32(" ".join(window).encode("utf-8")) % CDC_DIVISOR == 0):
+            yield cut()
+
+    if words:
+        yield cut()
+
+
+def _char_units(pages: Iterable[Page], max_size: int) -> Iterator[Unit]:
+    for page_no, page_text in pages:
+        # Pages are separated like paragraphs
+        for match in _WORD_RE.finditer(page_text + "\n\n"):
+            word = match.group()
+            stem = word.rstrip()
+            # Anything longer than a chunk (e.g. inline base64) is split up
+            pieces = [stem[i:i + max_size] for i in range(0, len(stem), max_size)]
+            pieces[-1] += word[len(stem):]
+            for piece in pieces:
+                yield piece, len(piece), page_no
+
+
+def _token_units(pages: Iterable[Page], tokenizer, max_size: int) -> Iterator[Unit]:
+    for page_no, page_text in pages:
+        text = page_text + "\n\n"
+        # One tokenizer pass per page; words are sized by the tokens starting inside them
+        offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                            verbose=False)["offset_mapping"]
+        t = 0
+        for match in _WORD_RE.finditer(text):
+            first = t
+            while t < len(offsets) and offsets[t][0] < match.end():
+                t += 1
+            n = t - first
+            if n <= max_size:
+                yield match.group(), n, page_no
+                continue
+            # Longer than a chunk: split at token boundaries
+            bounds = [match.start()] + [offsets[k][0] for k in range(first + max_size, t, max_size)] + [match.end()]
+            for k, (a, b) in enumerate(zip(bounds, bounds[1:])):
+                yield text[a:b], min(max_size, n - k * max_size), page_no
+
+
+def iter_content_chunks(pages: Iterable[Page], chunk_size: int = CHUNK_SIZE,
+                        chunk_overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    """Content-defined chunks of at most `chunk_size` characters."""
+    return _cut_content_defined(_char_units(pages, max(1, chunk_size - chunk_overlap)), chunk_size, chunk_overlap)
+
+
+def iter_token_chunks(pages: Iterable[Page], tokenizer, chunk_tokens: int,
+                      chunk_overlap: int) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    """
+    Content-defined chunks of at most `chunk_tokens` tokens of `tokenizer` (a
+    fast Hugging Face tokenizer). Each page is tokenized once and words are
+    sized from the token offsets, so chunking stays linear in the text length.
+    """
+    units = _token_units(pages, tokenizer, max(1, chunk_tokens - chunk_overlap))
+    return _cut_content_defined(units, chunk_tokens, chunk_overlap)
+
+
+def iter_chunks(pages: Iterable[Page]) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    """Chunks of `pages` from the configured splitter (see CHUNKER)."""
+    if settings.CHUNKER == "recursive":
+        return iter_text_chunks(pages)
+    if settings.CHUNKER == "tokens":
+        tokenizer, window = embedding_service.passage_tokenizer()
+        if tokenizer is not None:
+            chunk_tokens = min(settings.CHUNK_TOKENS or window, window)
+            overlap = min(settings.CHUNK_OVERLAP_TOKENS, chunk_tokens // 2)
+            return iter_token_chunks(pages, tokenizer, chunk_tokens, overlap)
+    return iter_content_chunks(pages)
+
+
+def iter_chunk_records(pages: Iterable[Page], source: str, user_id: str, document_id: str) -> Iterator[Dict]:
+    for i, (chunk, page_start, page_end) in enumerate(iter_chunks(pages)):
+        metadata = {"user_id": user_id, "document_id": document_id, "source": source, "chunk_id": i,
+                    "content": chunk}
+        if page_start is not None:
+            metadata["page_start"] = page_start
+            metadata["page_end"] = page_end
+        yield {
             "id": f"{user_id}-{document_id}-{i}",
             "text": chunk,
-            "metadata": {"user_id": user_id, "document_id": document_id, "source": source, "chunk_id": i,
-                         "content": chunk}
-        })
-    return out
+            "metadata": metadata
+        }
+
+
+def chunk_text_to_chunks(text: str, source: str, user_id: str, document_id: str) -> List[Dict]:
+    return list(iter_chunk_records([(None, text)], source=source, user_id=user_id, document_id=document_id))
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+# progress(stage, done, total) -- used by background ingestion jobs
+ProgressCallback = Callable[[str, int, Optional[int]], None]
+
+# on_commit(start, end, digests) -- chunks [start, end) are confirmed stored;
+# digests are their chunk_digest()s. Called in chunk order.
+CommitCallback = Callable[[int, int, List[str]], None]
+
+
+def chunk_digest(text: str) -> str:
+    """Short content hash recorded per chunk in an upload's checkpoint manifest."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _timed_upsert(items: List[tuple]) -> float:
+    started = time.perf_counter()
+    vector_store.upsert(items)
+    return time.perf_counter() - started
 
 
-def embed_and_upsert(chunks: List[Dict], batch_size: int = 64):
+def embed_and_upsert(chunks: Iterable[Dict], batch_size: int = 64, progress: Optional[ProgressCallback] = None,
+                     pipelined: Optional[bool] = None, on_batch_stored: Optional[Callable[[List[Dict]], None]] = None,
+                     before_upsert: Optional[Callable[[List[Dict]], None]] = None) -> Dict:
+    """
+    Embed chunks in batches and upsert them to the vector store.
+
+    `chunks` may be a lazy iterator; only `batch_size` chunks (plus the batches
+    still being upserted) are held in memory at once.
+
+    In pipelined mode (default, see UPSERT_PIPELINED) upserts run on a small
+    thread pool while the next batch is encoded. At most UPSERT_CONCURRENCY
+    requests are in flight; encoding waits for the oldest one when the window
+    is full. Returns per-stage throughput.
+
+    `on_batch_stored(batch)` is called, in order, once each batch's upsert has
+    succeeded, and `before_upsert(batch)` right before it is sent.
+    """
+    pipelined = settings.UPSERT_PIPELINED if pipelined is None else pipelined
+    max_in_flight = max(1, settings.UPSERT_CONCURRENCY) if pipelined else 1
+    total = len(chunks) if isinstance(chunks, Sized) else None
+    n_batches = (total + batch_size - 1) // batch_size if total is not None else "?"
+    stats = {"chunks": 0, "encode_seconds": 0.0, "upsert_seconds": 0.0, "wall_seconds": 0.0}
+    started = time.perf_counter()
+
     try:
-        print(f"Starting embed_and_upsert with {len(chunks)} chunks, batch_size={batch_size}")
+        print(f"Starting embed_and_upsert with {total if total is not None else 'streamed'} chunks, batch_size={batch_size}, "
+              f"pipelined={pipelined}, max_in_flight={max_in_flight}")
+
+        upserted = 0
+        in_flight = deque()
+
+        def finish_oldest():
+            nonlocal upserted
+            future, batch = in_flight.popleft()
+            stats["upsert_seconds"] += future.result()
+            upserted += len(batch)
+            if on_batch_stored:
+                on_batch_stored(batch)
+            if progress:
+                progress("upsert", upserted, total)
+
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="upsert") as pool:
+            for batch_no, batch in enumerate(_batched(chunks, batch_size), start=1):
+                print(f"Processing batch {batch_no}/{n_batches} with {len(batch)} chunks")
+
+                # Generate embeddings (overlaps with upserts still in flight)
+                t0 = time.perf_counter()
+                vectors = embedding_service.encode_passages([c["text"] for c in batch])
+                stats["encode_seconds"] += time.perf_counter() - t0
+                stats["chunks"] += len(batch)
+                if progress:
+                    progress("embed", stats["chunks"], total)
 
-        for start in range(0, len(chunks), batch_size):
-            batch = chunks[start:start + batch_size]
-            print(
-                f"rocessing batch {start // batch_size + 1}/{(len(chunks) + batch_size - 1) // batch_size} with {len(batch)} chunks")
+                # Prepare upsert items; one tolist() for the whole batch
+                upsert_items = list(zip([c["id"] for c in batch], vectors.tolist(), [c["metadata"] for c in batch]))
 
-            # Generate embeddings
-            print(f"Generating embeddings for batch...")
-            vectors = embedder.encode([c["text"] for c in batch], convert_to_numpy=True, show_progress_bar=False)
-            print(f"Generated {len(vectors)} embeddings")
+                # Back-pressure: never more than max_in_flight requests outstanding
+                while len(in_flight) >= max_in_flight:
+                    finish_oldest()
+                if before_upsert:
+                    before_upsert(batch)
+                in_flight.append((pool.submit(_timed_upsert, upsert_items), batch))
+                if not pipelined:
+                    finish_oldest()
 
-            # Prepare upsert items
-            upsert_items = [(c["id"], v.tolist(), c["metadata"]) for c, v in zip(batch, vectors)]
-            print(f"Prepared {len(upsert_items)} upsert items")
+                # Surface finished upserts (and their errors) early
+                while in_flight and in_flight[0][0].done():
+                    finish_oldest()
 
-            # Upsert to Pinecone
-            print(f"Upserting to Pinecone...")
-            index.upsert(vectors=upsert_items)
-            print(f"Successfully upserted batch to Pinecone")
+            while in_flight:
+                finish_oldest()
 
-        print(f"Completed embed_and_upsert for all {len(chunks)} chunks")
+        stats["wall_seconds"] = time.perf_counter() - started
+        for stage in ("encode", "upsert", "wall"):
+            seconds = stats[f"{stage}_seconds"]
+            stats[f"{stage}_chunks_per_second"] = round(stats["chunks"] / seconds, 2) if seconds else None
+
+        print(f"Completed embed_and_upsert for all {stats['chunks']} chunks: "
+              f"encode {stats['encode_chunks_per_second']} chunks/s, "
+              f"upsert {stats['upsert_chunks_per_second']} chunks/s per request, "
+              f"overall {stats['wall_chunks_per_second']} chunks/s")
+        print(f"Embedding service: {embedding_service.stats()}")
+        return stats
 
     except Exception as e:
         print(f"Error in embed_and_upsert: {str(e)}")
@@ -69,25 +364,75 @@ def embed_and_upsert(chunks: List[Dict], batch_size: int = 64):
         raise
 
 
-def process_and_store(text: str, user_id: str, source: str, document_id: str) -> int:
+def process_pages_and_store(pages: Iterable[Page], user_id: str, source: str, document_id: str,
+                            progress: Optional[ProgressCallback] = None, checkpoint: Optional[Dict] = None,
+                            on_commit: Optional[CommitCallback] = None,
+                            on_span: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Streaming ingest: pages -> incremental chunks -> fixed-size embed/upsert batches.
+    Peak memory is bounded by the batch size, not the document size. The same
+    chunks feed the document's BM25 index when hybrid search is enabled.
+
+    Resuming: `checkpoint` is a previous run's {"committed", "manifest"}. The
+    first `committed` chunks are re-chunked but not embedded again, as long as
+    their digests still match the manifest; from the first mismatch on, chunks
+    are redone. Ids are deterministic, so redone chunks overwrite in place.
+    Each stored batch is reported through `on_commit`, and `on_span(end)`
+    records that ids below `end` may exist before a batch is sent, so a resumed
+    run that ends up shorter knows which ids to delete.
+    """
     try:
-        print(f"Processing text for user {user_id}, document {document_id}")
-        print(f"Text length: {len(text)} characters")
+        print(f"Processing pages for user {user_id}, document {document_id}")
+        bm25 = BM25Builder(id_prefix=f"{user_id}-{document_id}-") if settings.HYBRID_SEARCH else None
+        manifest = (checkpoint or {}).get("manifest") or []
+        resume_from = min((checkpoint or {}).get("committed", 0), len(manifest))
+        skipped = 0
+
+        def counted(records: Iterator[Dict]) -> Iterator[Dict]:
+            nonlocal resume_from, skipped
+            for n, record in enumerate(records, start=1):
+                if progress:
+                    progress("chunk", n, None)
+                if bm25:
+                    bm25.add(record["metadata"]["chunk_id"], record["text"])
+                if n - 1 < resume_from:
+                    if chunk_digest(record["text"]) == manifest[n - 1]:
+                        skipped += 1
+                        continue
+                    print(f"Chunk {n - 1} differs from the checkpoint; re-embedding from there")
+                    resume_from = n - 1
+                yield record
+
+        def resumed_progress(stage: str, done: int, total: Optional[int]):
+            # Chunks kept from the checkpoint count as done; none once it is discarded
+            progress(stage, done + skipped if stage in ("embed", "upsert") else done, total)
 
-        # Step 1: Chunk the text
-        print(f"Chunking text...")
-        chunks = chunk_text_to_chunks(text, source=source, user_id=user_id, document_id=document_id)
-        print(f"Created {len(chunks)} chunks")
+        def batch_stored(batch: List[Dict]):
+            if on_commit:
+                start = batch[0]["metadata"]["chunk_id"]
+                on_commit(start, start + len(batch), [chunk_digest(c["text"]) for c in batch])
 
-        # Step 2: Embed and upsert
-        print(f"Starting embedding and upsert process...")
-        embed_and_upsert(chunks)
-        print(f"Successfully embedded and upserted {len(chunks)} chunks")
+        if resume_from:
+            print(f"Resuming document {document_id} after {resume_from} committed chunks")
+        chunks = counted(iter_chunk_records(pages, source=source, user_id=user_id, document_id=document_id))
+        before_upsert = (lambda batch: on_span(batch[-1]["metadata"]["chunk_id"] + 1)) if on_span else None
+        stats = embed_and_upsert(chunks, progress=resumed_progress if progress else None,
+                                 on_batch_stored=batch_stored, before_upsert=before_upsert)
+        if bm25:
+            bm25.save(document_id)
+        print(f"Successfully embedded and upserted {stats['chunks']} chunks ({skipped} already stored)")
 
-        return len(chunks)
+        return skipped + stats["chunks"]
     except Exception as e:
-        print(f"Error in process_and_store: {str(e)}")
+        print(f"Error in process_pages_and_store: {str(e)}")
         print(f"Exception type: {type(e).__name__}")
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
-        raise
\ No newline at end of file
+        raise
+
+
+def process_and_store(text: str, user_id: str, source: str, document_id: str,
+                      progress: Optional[ProgressCallback] = None) -> int:
+    print(f"Text length: {len(text)} characters")
+    return process_pages_and_store([(None, text)], user_id=user_id, source=source, document_id=document_id,
+                                   progress=progress)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .embedding_service import embedding_service
+
+
+class QueryEncodeBatcher:
+    """
+    Coalesces concurrent single-question encodes into one batched forward pass.
+
+    A request waits at most `max_wait_ms` for company; a batch is dispatched as
+    soon as it holds `max_batch` questions. Batches run one at a time on a
+    dedicated thread, so requests arriving during a forward pass simply pile up
+    into the next batch instead of competing for the CPU.
+    """
+
+    def __init__(self, encode_fn: Callable[[Sequence[str]], np.ndarray], max_batch: int, max_wait_ms: float):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks; hold running batches until they finish
+        self._tasks: Set[asyncio.Task] = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-encode")
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.encode_seconds = 0.0
+
+    async def encode(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _timed_encode(self, texts: List[str]) -> np.ndarray:
+        started = time.perf_counter()
+        vectors = self.encode_fn(texts)
+        self.encode_seconds += time.perf_counter() - started
+        return vectors
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._timed_encode, [text for text, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), vector in zip(batch, vectors):
+            # The awaiting request may have been cancelled meanwhile
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "encode_seconds": round(self.encode_seconds, 3),
+        }
+
+
+query_batcher = QueryEncodeBatcher(
+    embedding_service.encode_queries,
+    max_batch=settings.QUERY_BATCH_MAX_SIZE,
+    max_wait_ms=settings.QUERY_BATCH_MAX_WAIT_MS,
+)
+
+
+async def encode_query(question: str) -> np.ndarray:
+    """E5 query embedding of one question, micro-batched unless QUERY_BATCHING is off."""
+    if settings.QUERY_BATCHING:
+        return await query_batcher.encode(question)
+    return (await asyncio.to_thread(embedding_service.encode_queries, [question]))[0]
@@ -0,0 +1,40 @@
+import re
+from typing import Optional
+
+from ..core.cache import TTLCache
+from ..core.config import settings
+
+# normalized question -> query embedding
+query_embedding_cache = TTLCache(
+    settings.QUERY_EMBED_CACHE_SIZE, settings.QUERY_EMBED_CACHE_TTL, name="query_embeddings"
+)
+
+# (vector_document_id, normalized question, top_k) -> list of matches
+match_cache = TTLCache(settings.MATCH_CACHE_SIZE, settings.MATCH_CACHE_TTL, name="matches")
+
+# upload document_id -> vector_document_id (differs for deduplicated uploads)
+vector_document_cache = TTLCache(settings.MATCH_CACHE_SIZE, settings.MATCH_CACHE_TTL, name="vector_documents")
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+def match_key(vector_document_id: str, question: str, top_k: int) -> tuple:
+    return vector_document_id, normalize_question(question), top_k
+
+
+def invalidate_document(document_id: Optional[str], vector_document_id: Optional[str] = None) -> int:
+    """Forget cached matches of a deleted or re-ingested document."""
+    doc_ids = {d for d in (document_id, vector_document_id) if d}
+    if document_id:
+        vector_document_cache.pop(document_id)
+    return match_cache.invalidate_where(lambda key: key[0] in doc_ids)
+
+
+def stats() -> dict:
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "matches": match_cache.stats(),
+        "vector_documents": vector_document_cache.stats(),
+    }
@@ -0,0 +1,152 @@
+"""
+Refreshing an ingested document in place from a new version of its source.
+
+The new text is chunked again and each chunk's digest is looked up in the
+manifest kept on the upload (`checkpoint.manifest`, written while ingesting).
+Chunks already stored keep their vectors. Only new chunks are embedded and
+upserted, and the vectors of chunks that disappeared are deleted. With
+content-defined chunking (CHUNKER=content) an edit changes only the chunks
+around it, so a refresh re-embeds roughly the share of the text that changed.
+
+Vector ids stay `{user_id}-{document_id}-{slot}`. A fresh ingest stores chunk i
+in slot i. After a refresh unchanged chunks keep their slot, so the manifest
+records each chunk's slot (`checkpoint.slots`), and `vector_slots` on the
+upload bounds the slots in use. The `chunk_id` / page metadata of chunks that
+merely moved is rewritten without touching their vectors.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ..core.config import settings
+from .bm25 import BM25Builder
+from .prepare_dataset import Page, ProgressCallback, chunk_digest, embed_and_upsert, iter_chunk_records
+from .vector_cleanup import delete_vector_ids, vector_id_prefix
+from .vector_store import vector_store
+
+FETCH_BATCH_SIZE = 100
+UPDATE_BATCH_SIZE = 100
+
+
+def stored_manifest(upload: dict) -> Dict:
+    """
+    {"digests", "slots", "span", "pending_delete"} of what the upload has stored.
+    Uploads ingested before manifests existed list their chunks with unknown
+    digests, so all of them are replaced.
+    """
+    checkpoint = upload.get("checkpoint") or {}
+    manifest = checkpoint.get("manifest")
+    if manifest:
+        digests = list(manifest[:checkpoint.get("committed", len(manifest))])
+    else:
+        digests = [None] * (upload.get("chunks_upserted") or 0)
+    slots = list(checkpoint.get("slots") or range(len(digests)))
+    return {
+        "digests": digests,
+        "slots": slots,
+        "span": max(upload.get("vector_slots") or 0, max(slots, default=-1) + 1),
+        "pending_delete": list(checkpoint.get("pending_delete") or []),
+    }
+
+
+def _stored_metadata(ids: List[str], document_id: str) -> Dict[str, Dict]:
+    found = {}
+    for i in range(0, len(ids), FETCH_BATCH_SIZE):
+        for match in vector_store.fetch(ids[i:i + FETCH_BATCH_SIZE], filter={"document_id": document_id}):
+            found[match["id"]] = match["metadata"]
+    return found
+
+
+def update_metadata(items: List[tuple]):
+    batches = [items[i:i + UPDATE_BATCH_SIZE] for i in range(0, len(items), UPDATE_BATCH_SIZE)]
+    if len(batches) == 1:
+        vector_store.update_metadata(batches[0])
+    elif batches:
+        workers = min(max(1, settings.UPSERT_CONCURRENCY), len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metadata-update") as pool:
+            list(pool.map(vector_store.update_metadata, batches))
+
+
+def refresh_document(pages: Iterable[Page], user_id: str, source: str, document_id: str, previous: Dict,
+                     progress: Optional[ProgressCallback] = None,
+                     on_span: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Bring the vectors of `document_id` in line with `pages`. `previous` is the
+    stored_manifest() of the upload. Blocking; runs in an ingest worker.
+
+    Nothing the old manifest refers to is overwritten or deleted here: new
+    chunks go to slots it doesn't use, and the slots of removed chunks are
+    returned as "removed" for the caller to delete once the new manifest is
+    saved. `on_span(span)` is called before the first write, so a crash never
+    leaves vectors beyond the recorded `vector_slots`.
+    """
+    prefix = vector_id_prefix(user_id, document_id)
+    records = []
+    for record in iter_chunk_records(pages, source=source, user_id=user_id, document_id=document_id):
+        records.append(record)
+        if progress:
+            progress("chunk", len(records), None)
+    if not records:
+        raise ValueError("No text could be extracted from the provided source")
+    digests = [chunk_digest(r["text"]) for r in records]
+
+    # Leftovers of a refresh interrupted before its deletes; their slots become free
+    if previous["pending_delete"]:
+        delete_vector_ids([f"{prefix}{slot}" for slot in previous["pending_delete"]], document_id)
+
+    stored: Dict[str, List[int]] = {}
+    for digest, slot in zip(previous["digests"], previous["slots"]):
+        if digest is not None:
+            stored.setdefault(digest, []).append(slot)
+    slots: List[Optional[int]] = [stored[d].pop(0) if stored.get(d) else None for d in digests]
+
+    # Unchanged chunks may have moved (chunk_id, pages); a vector gone missing is embedded again
+    kept = {f"{prefix}{slot}": i for i, slot in enumerate(slots) if slot is not None}
+    current = _stored_metadata(list(kept), document_id)
+    moved = []
+    for vector_id, i in kept.items():
+        if vector_id not in current:
+            stored.setdefault(digests[i], []).append(slots[i])
+            slots[i] = None
+        elif current[vector_id] != records[i]["metadata"]:
+            moved.append((vector_id, records[i]["metadata"]))
+
+    in_use = set(previous["slots"])
+    free = (slot for slot in count() if slot not in in_use)
+    new = [i for i, slot in enumerate(slots) if slot is None]
+    for i in new:
+        slots[i] = next(free)
+    span = max(previous["span"], max(slots) + 1)
+    if on_span:
+        on_span(span)
+
+    reused = {slot for slot in slots if slot in in_use}
+    removed = [slot for slot in previous["slots"] if slot not in reused]
+
+    print(f"Refreshing document {document_id}: {len(records)} chunks, {len(new)} new, "
+          f"{len(moved)} moved, {len(removed)} removed")
+    for i in new:
+        records[i]["id"] = f"{prefix}{slots[i]}"
+    stats = embed_and_upsert([records[i] for i in new], progress=progress) if new else {"chunks": 0}
+    update_metadata(moved)
+
+    if settings.HYBRID_SEARCH:
+        bm25 = BM25Builder(id_prefix=prefix)
+        for record, slot in zip(records, slots):
+            bm25.add(slot, record["text"])
+        bm25.save(document_id)
+
+    return {
+        "digests": digests,
+        "slots": slots,
+        "span": span,
+        "removed": removed,
+        "stats": {
+            "chunks": len(records),
+            "reembedded": stats["chunks"],
+            "reused": len(records) - len(new),
+            "moved": len(moved),
+            "removed": len(removed),
+            "fraction_reembedded": round(len(new) / len(records), 4),
+        },
+    }
@@ -0,0 +1,114 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..core.cache import TTLCache
+from ..core.config import settings
+from .context_builder import count_tokens
+from .query_cache import normalize_question
+
+
+def _content(match: Dict) -> str:
+    return (match.get("metadata") or {}).get("content", "")
+
+
+class Reranker:
+    """
+    Optional cross-encoder stage between retrieval and the LLM.
+
+    Retrieval over-fetches candidates. All (question, chunk) pairs without a
+    cached score are scored in one batch. Only the best `top_n` chunks that fit
+    `token_budget` are forwarded to the prompt. The model loads on first use.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+        # (normalized question, vector id) -> cross-encoder score
+        self.scores = TTLCache(settings.RERANK_CACHE_SIZE, settings.RERANK_CACHE_TTL, name="rerank_scores")
+        self.calls = 0
+        self.rerank_seconds = 0.0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    started = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name)
+                    print(f"Loaded reranker {self.model_name} in {time.perf_counter() - started:.1f}s")
+        return self._model
+
+    def rerank(self, question: str, candidates: List[Dict], baseline_k: int,
+               top_n: Optional[int] = None, token_budget: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+        """
+        Returns the selected matches (best first) and per-call stats. The
+        baseline is what would have been sent without reranking: the first
+        `baseline_k` candidates in retrieval order.
+        """
+        top_n = top_n or settings.RERANK_TOP_N
+        token_budget = token_budget or settings.RERANK_TOKEN_BUDGET
+        started = time.perf_counter()
+
+        q = normalize_question(question)
+        scores = [self.scores.get((q, m["id"])) for m in candidates]
+        todo = [i for i, s in enumerate(scores) if s is None]
+        if todo:
+            predicted = self.model.predict(
+                [(question, _content(candidates[i])) for i in todo], batch_size=len(todo), show_progress_bar=False
+            )
+            for i, score in zip(todo, predicted):
+                scores[i] = float(score)
+                self.scores.set((q, candidates[i]["id"]), scores[i])
+
+        ranked = sorted(zip(scores, range(len(candidates))), reverse=True)
+        selected, used = [], 0
+        for score, i in ranked[:top_n]:
+            tokens = count_tokens(_content(candidates[i]))
+            # Always keep the best chunk, even if it alone exceeds the budget
+            if selected and used + tokens > token_budget:
+                break
+            selected.append({**candidates[i], "rerank_score": score})
+            used += tokens
+
+        elapsed = time.perf_counter() - started
+        baseline = sum(count_tokens(_content(m)) for m in candidates[:baseline_k])
+        self.calls += 1
+        self.rerank_seconds += elapsed
+        self.tokens_before += baseline
+        self.tokens_after += used
+        return selected, {
+            "candidates": len(candidates),
+            "scored": len(todo),
+            "kept": len(selected),
+            "rerank_ms": round(elapsed * 1000, 1),
+            "prompt_tokens_baseline": baseline,
+            "prompt_tokens": used,
+            "prompt_tokens_saved": baseline - used,
+        }
+
+    def invalidate_document(self, vector_document_id: str) -> int:
+        """Forget the scores of a document's chunks; a refresh reuses chunk ids for new text."""
+        marker = f"-{vector_document_id}-"
+        return self.scores.invalidate_where(lambda key: marker in key[1])
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.RERANK_ENABLED,
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "calls": self.calls,
+            "mean_rerank_ms": round(self.rerank_seconds * 1000 / self.calls, 1) if self.calls else None,
+            "prompt_tokens_saved": self.tokens_before - self.tokens_after,
+            "mean_prompt_tokens_saved": round((self.tokens_before - self.tokens_after) / self.calls, 1)
+            if self.calls else None,
+            "score_cache": self.scores.stats(),
+        }
+
+
+reranker = Reranker(settings.RERANK_MODEL)
@@ -0,0 +1,186 @@
+"""
+Deleting an upload's vectors, and sweeping up the ones that were left behind.
+
+Chunk ids are deterministic: `{user_id}-{document_id}-{i}` for i below the
+chunk count recorded on the upload (or its chunk set), or below its
+`vector_slots` once it has been refreshed (see reindex.py). Deletes therefore
+name ids and never use a metadata filter, which serverless Pinecone indexes
+don't support and which scans on pod indexes. They go out in DELETE_BATCH_SIZE
+batches, DELETE_CONCURRENCY at a time, each retried with backoff. When the count
+isn't known (an ingest that failed part-way), the ids are listed by prefix.
+
+A delete that still fails leaves orphans: vectors no upload or chunk set
+refers to. `sweep_orphans` finds them by listing the index and deletes them
+once they are older than ORPHAN_GRACE_HOURS. Run it periodically
+(ORPHAN_SWEEP_INTERVAL_HOURS) or by hand:
+
+    python -m backend_app.rag_pipeline.vector_cleanup --dry-run
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from ..core.config import settings
+from ..db.mongodb import chunk_sets_col, uploads_col
+from . import bm25
+from .vector_store import vector_store
+
+last_sweep: Optional[Dict] = None
+
+
+def vector_id_prefix(user_id: str, document_id: str) -> str:
+    return f"{user_id}-{document_id}-"
+
+
+def parse_vector_id(vector_id: str) -> Optional[Tuple[str, str]]:
+    """(user_id, document_id) of a chunk id, or None if it isn't one of ours."""
+    parts = vector_id.rsplit("-", 2)
+    if len(parts) != 3 or not parts[2].isdigit():
+        return None
+    return parts[0], parts[1]
+
+
+def document_vector_ids(user_id: str, document_id: str, chunk_count: Optional[int] = None) -> List[str]:
+    prefix = vector_id_prefix(user_id, document_id)
+    if chunk_count:
+        return [f"{prefix}{i}" for i in range(chunk_count)]
+    return list(vector_store.list_ids(prefix))
+
+
+def stale_vector_ids(user_id: str, document_id: str, chunk_count: int, span: Optional[int]) -> List[str]:
+    """
+    Ids at or past `chunk_count` that an earlier, longer attempt may have
+    stored: those below `span` (the upload's `vector_slots`), or every listed
+    one when no span was recorded.
+    """
+    prefix = vector_id_prefix(user_id, document_id)
+    if span is not None:
+        return [f"{prefix}{i}" for i in range(chunk_count, span)]
+    return [i for i in vector_store.list_ids(prefix)
+            if i[len(prefix):].isdigit() and int(i[len(prefix):]) >= chunk_count]
+
+
+def _delete_batch(ids: List[str], document_id: str):
+    for attempt in range(settings.DELETE_RETRIES):
+        try:
+            # The filter only narrows the local store's search; Pinecone deletes by id
+            vector_store.delete(ids=ids, filter={"document_id": document_id})
+            return
+        except Exception as e:
+            if attempt == settings.DELETE_RETRIES - 1:
+                raise
+            print(f"Vector delete batch failed ({e}); retrying")
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def delete_vector_ids(ids: List[str], document_id: str) -> int:
+    size = settings.DELETE_BATCH_SIZE
+    batches = [ids[i:i + size] for i in range(0, len(ids), size)]
+    if len(batches) == 1:
+        _delete_batch(batches[0], document_id)
+    elif batches:
+        workers = min(settings.DELETE_CONCURRENCY, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vector-delete") as pool:
+            # list() surfaces the first failed batch
+            list(pool.map(lambda batch: _delete_batch(batch, document_id), batches))
+    return len(ids)
+
+
+def delete_document_vectors(vector_user_id: str, vector_document_id: str, chunk_count: Optional[int] = None) -> int:
+    """Delete a document's vectors and keyword index. Blocking; run it in a thread."""
+    ids = document_vector_ids(vector_user_id, vector_document_id, chunk_count)
+    deleted = delete_vector_ids(ids, vector_document_id)
+    bm25.delete_index(vector_document_id)
+    return deleted
+
+
+def _group_vector_ids() -> Dict[Tuple[str, str], List[str]]:
+    groups: Dict[Tuple[str, str], List[str]] = {}
+    for vector_id in vector_store.list_ids():
+        owner = parse_vector_id(vector_id)
+        if owner:
+            groups.setdefault(owner, []).append(vector_id)
+    return groups
+
+
+async def _is_referenced(document_id: str) -> bool:
+    clauses = [{"vector_document_id": document_id}]
+    if ObjectId.is_valid(document_id):
+        clauses.append({"_id": ObjectId(document_id)})
+    if await uploads_col().find_one({"$or": clauses}, {"_id": 1}):
+        return True
+    return await chunk_sets_col().find_one({"vector_document_id": document_id}, {"_id": 1}) is not None
+
+
+def _is_recent(document_id: str, cutoff: datetime) -> bool:
+    # document ids are upload ObjectIds, which carry their creation time
+    return ObjectId.is_valid(document_id) and ObjectId(document_id).generation_time > cutoff
+
+
+async def sweep_orphans(dry_run: bool = False) -> Dict:
+    """Delete vectors and keyword indexes whose document no upload or chunk set refers to."""
+    global last_sweep
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.ORPHAN_GRACE_HOURS)
+    groups = await asyncio.to_thread(_group_vector_ids)
+
+    orphans, vectors, failed = [], 0, 0
+    for (user_id, document_id), ids in groups.items():
+        if _is_recent(document_id, cutoff) or await _is_referenced(document_id):
+            continue
+        orphans.append(document_id)
+        vectors += len(ids)
+        if dry_run:
+            continue
+        try:
+            await asyncio.to_thread(delete_vector_ids, ids, document_id)
+            await asyncio.to_thread(bm25.delete_index, document_id)
+        except Exception as e:
+            failed += 1
+            print(f"Orphan sweep: could not delete vectors of {document_id}: {e}")
+
+    # Keyword indexes whose vectors are already gone
+    with_vectors = {d for _, d in groups}
+    for document_id in await asyncio.to_thread(bm25.list_indexes):
+        if document_id in with_vectors or _is_recent(document_id, cutoff):
+            continue
+        if not await _is_referenced(document_id):
+            orphans.append(document_id)
+            if not dry_run:
+                await asyncio.to_thread(bm25.delete_index, document_id)
+
+    last_sweep = {
+        "finished_at": datetime.utcnow().isoformat(),
+        "dry_run": dry_run,
+        "documents_scanned": len(groups),
+        "orphaned_documents": len(orphans),
+        "orphaned_vectors": vectors,
+        "failed_documents": failed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    print(f"Orphan sweep: {last_sweep}")
+    return {**last_sweep, "document_ids": orphans}
+
+
+async def run_orphan_sweeps():
+    """Background loop started at app startup when ORPHAN_SWEEP_INTERVAL_HOURS > 0."""
+    while True:
+        await asyncio.sleep(settings.ORPHAN_SWEEP_INTERVAL_HOURS * 3600)
+        try:
+            await sweep_orphans()
+        except Exception as e:
+            print(f"Orphan sweep failed: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find and delete orphaned vectors.")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    args = parser.parse_args()
+    result = asyncio.run(sweep_orphans(dry_run=args.dry_run))
+    for document_id in result["document_ids"]:
+        print(document_id)
@@ -0,0 +1,598 @@
+"""
+Vector storage behind one small interface, selected by VECTOR_STORE:
+
+- "pinecone": the hosted Pinecone index (default).
+- "local": on-disk store for air-gapped deployments. Vectors are partitioned per
+  document_id, because every query filters on it. Each document directory holds
+  a memory-mapped float32 matrix plus an append-only JSON log of ids and
+  metadata. Search is exact (flat) by default. Large documents switch to an
+  in-memory HNSW graph when hnswlib is installed.
+
+Vectors are expected to be L2-normalized; scores are cosine similarities.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+try:
+    import hnswlib
+except ImportError:  # optional: the local store falls back to exact search
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; keep to one worker process there
+    fcntl = None
+
+# (id, vector, metadata) -- the tuple shape Pinecone's upsert accepts
+VectorItem = Tuple[str, Sequence[float], Dict]
+
+
+class VectorStore(ABC):
+    @abstractmethod
+    def upsert(self, items: List[VectorItem]):
+        ...
+
+    @abstractmethod
+    def query(self, vector: Sequence[float], top_k: int, filter: Optional[Dict] = None) -> List[Dict]:
+        """Best matches as plain dicts: {"id", "score", "metadata"}."""
+
+    @abstractmethod
+    def fetch(self, ids: List[str], filter: Optional[Dict] = None) -> List[Dict]:
+        """Stored vectors by id as {"id", "metadata"}; `filter` narrows where to look."""
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict] = None):
+        ...
+
+    @abstractmethod
+    def list_ids(self, prefix: str = "") -> Iterator[str]:
+        """Ids of all stored vectors starting with `prefix`."""
+
+    @abstractmethod
+    def update_metadata(self, items: List[Tuple[str, Dict]]):
+        """Replace the metadata of stored vectors by id, leaving the vectors as they are."""
+
+
+# Pinecone
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, api_key: str, index_name: str, dimension: Callable[[], int]):
+        from pinecone import Pinecone
+
+        self.pc = Pinecone(api_key=api_key)
+        self.index_name = index_name
+        self._dimension = dimension
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        # Created on first use: the dimension comes from the (lazily loaded) embedder
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    if self.index_name not in self.pc.list_indexes().names():
+                        from pinecone import ServerlessSpec
+
+                        self.pc.create_index(
+                            name=self.index_name,
+                            dimension=self._dimension(),
+                            metric="cosine",
+                            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+                        )
+                    self._index = self.pc.Index(self.index_name)
+        return self._index
+
+    def upsert(self, items: List[VectorItem]):
+        self.index.upsert(vectors=items)
+
+    def query(self, vector, top_k, filter=None):
+        vector = vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+        resp = self.index.query(vector=vector, top_k=top_k, include_metadata=True, filter=filter)
+        return [
+            {"id": m["id"], "score": m["score"], "metadata": dict(m.get("metadata") or {})}
+            for m in resp.get("matches", [])
+        ]
+
+    def fetch(self, ids, filter=None):
+        vectors = self.index.fetch(ids=ids).vectors
+        return [{"id": i, "metadata": dict(vectors[i].metadata or {})} for i in ids if i in vectors]
+
+    def delete(self, ids=None, filter=None):
+        if ids:
+            self.index.delete(ids=ids)
+        elif filter:
+            self.index.delete(delete_all=False, filter=filter)
+
+    def list_ids(self, prefix=""):
+        # Paginated id listing (serverless indexes)
+        for page in self.index.list(prefix=prefix or None):
+            yield from page
+
+    def update_metadata(self, items):
+        # One request per vector; callers spread them over threads
+        for vector_id, metadata in items:
+            self.index.update(id=vector_id, set_metadata=metadata)
+
+
+# Local on-disk store
+
+def _matches_filter(metadata: Dict, filter: Optional[Dict]) -> bool:
+    """The subset of Pinecone's filter language the app uses: $eq, $ne, $in, $nin."""
+    for field, cond in (filter or {}).items():
+        value = metadata.get(field)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, arg in cond.items():
+            if op == "$eq" and value != arg:
+                return False
+            if op == "$ne" and value == arg:
+                return False
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"Unsupported filter operator {op}")
+    return True
+
+
+def _filter_document_ids(filter: Optional[Dict]) -> Optional[List[str]]:
+    """Document ids a filter is restricted to, or None if it spans all documents."""
+    cond = (filter or {}).get("document_id")
+    if cond is None:
+        return None
+    if not isinstance(cond, dict):
+        return [cond]
+    if "$eq" in cond:
+        return [cond["$eq"]]
+    if "$in" in cond:
+        return list(cond["$in"])
+    return None
+
+
+def _fsync_dir(path: str):
+    """Make renames inside `path` durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _DocumentIndex:
+    """
+    Vectors of one document: `vectors.f32` (rows x dim, memory-mapped, grown in
+    steps) and `log.jsonl` (one line per add/overwrite/delete, replayed on
+    load). Deleted rows are tombstoned and reclaimed by compaction.
+
+    Compaction writes a new pair of files. The log header records the
+    generation it belongs to, and generation g > 0 keeps its vectors in
+    `vectors.{g}.f32`. The old vectors file is removed only once the new log is
+    in place, so a crash at any point leaves a log whose vectors exist.
+
+    Several worker processes can share a document. Writes and compaction hold
+    an exclusive lock on `<document>.lock` next to the directory, reads a
+    shared one, and each first catches up on the log: the lines appended since
+    it last looked, or a full reload when compaction replaced the file.
+    """
+
+    GROW_ROWS = 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self._log_file = None
+        self._reset()
+        with self._file_lock(exclusive=True):
+            self._sync()
+            self._remove_leftovers()
+
+    def _reset(self):
+        self.dim: Optional[int] = None
+        self.generation = 0
+        self.ids: List[Optional[str]] = []
+        self.metadata: List[Optional[Dict]] = []
+        self.rows: Dict[str, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._hnsw = None
+        self._live_rows: Optional[np.ndarray] = None
+        # (inode, bytes replayed) of the log; a new inode means it was rewritten.
+        # The replayed log stays open so its inode can't be reused meanwhile.
+        self._log_state: Optional[Tuple[int, int]] = None
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    @property
+    def _vectors_path(self) -> str:
+        return self._generation_path(self.generation)
+
+    def _generation_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors.{generation}.f32" if generation else "vectors.f32")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "log.jsonl")
+
+    @property
+    def live(self) -> int:
+        return len(self.rows)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Catch up with the log as other processes (or a crash) left it."""
+        try:
+            st = os.stat(self._log_path)
+        except FileNotFoundError:
+            if self._log_state is not None:
+                self._reset()  # dropped by another process
+            return
+        if self._log_state is None or st.st_ino != self._log_state[0] or st.st_size < self._log_state[1]:
+            self._reset()
+            self._replay(0)
+        elif st.st_size > self._log_state[1]:
+            self._hnsw = None  # rebuilt on the next query
+            self._replay(self._log_state[1])
+
+    def _replay(self, offset: int):
+        if self._log_file is None:
+            self._log_file = open(self._log_path, "rb")
+        f = self._log_file
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # torn final line after a crash
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            offset += len(line)
+            if "dim" in entry:
+                self.dim = entry["dim"]
+                self.generation = entry.get("generation", 0)
+            elif "add" in entry:
+                self._set_row(entry["row"], entry["add"], entry["metadata"])
+            elif "delete" in entry:
+                for row in entry["delete"]:
+                    self._clear_row(row)
+        self._log_state = (os.fstat(f.fileno()).st_ino, offset)
+
+        rows = os.path.getsize(self._vectors_path) // (4 * self.dim) \
+            if self.dim and os.path.exists(self._vectors_path) else 0
+        if rows != self._capacity:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                      shape=(rows, self.dim)) if rows else None
+            self._capacity = rows
+        if self.ids and self._capacity < len(self.ids):
+            raise RuntimeError(f"Local vector store {self.path}: log generation {self.generation} refers to "
+                               f"{len(self.ids)} rows but {self._vectors_path} holds {self._capacity}")
+
+    def _remove_leftovers(self):
+        """Files of a compaction that crashed before or after its swap. Needs the exclusive lock."""
+        if not os.path.isdir(self.path):
+            return
+        current = os.path.basename(self._vectors_path)
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp") or (name.startswith("vectors.") and name != current):
+                os.remove(os.path.join(self.path, name))
+
+    def _append_log(self, lines: List[str]):
+        with open(self._log_path, "ab") as f:
+            # Everything past what _sync replayed is a line torn by a crashed writer
+            f.truncate(self._log_state[1] if self._log_state else 0)
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            self._log_state = (os.fstat(f.fileno()).st_ino, f.tell())
+        if self._log_file is None:
+            self._log_file = open(self._log_path, "rb")
+
+    def _live(self) -> np.ndarray:
+        if self._live_rows is None:
+            self._live_rows = np.fromiter(self.rows.values(), dtype=np.int64, count=len(self.rows))
+        return self._live_rows
+
+    def _set_row(self, row: int, vector_id: str, metadata: Dict):
+        self._live_rows = None
+        while len(self.ids) <= row:
+            self.ids.append(None)
+            self.metadata.append(None)
+        self.ids[row] = vector_id
+        self.metadata[row] = metadata
+        self.rows[vector_id] = row
+
+    def _clear_row(self, row: int):
+        self._live_rows = None
+        if row < len(self.ids) and self.ids[row] is not None:
+            self.rows.pop(self.ids[row], None)
+            self.ids[row] = None
+            self.metadata[row] = None
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, self._capacity + self.GROW_ROWS)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+        if self._hnsw is not None:
+            self._hnsw.resize_index(capacity)
+
+    def upsert(self, items: List[VectorItem]):
+        with self.lock, self._file_lock(exclusive=True):
+            os.makedirs(self.path, exist_ok=True)
+            self._sync()
+            log_lines = []
+            if self.dim is None:
+                self.dim = len(items[0][1])
+                log_lines.append(json.dumps({"dim": self.dim, "generation": self.generation}))
+
+            rows = []
+            for vector_id, _, metadata in items:
+                row = self.rows.get(vector_id)
+                if row is None:
+                    row = len(self.ids)
+                    self._set_row(row, vector_id, metadata)
+                else:
+                    self.metadata[row] = metadata
+                rows.append(row)
+                log_lines.append(json.dumps({"add": vector_id, "row": row, "metadata": metadata}))
+
+            vectors = np.asarray([v for _, v, _ in items], dtype=np.float32)
+            self._ensure_capacity(len(self.ids))
+            self._vectors[rows] = vectors
+            self._vectors.flush()
+            # Log after the vectors are on disk: a replayed row always has its vector
+            self._append_log(log_lines)
+
+            if self._hnsw is not None:
+                self._hnsw.add_items(vectors, rows)
+
+    def update_metadata(self, items: List[Tuple[str, Dict]]):
+        with self.lock, self._file_lock(exclusive=True):
+            self._sync()
+            log_lines = []
+            for vector_id, metadata in items:
+                row = self.rows.get(vector_id)
+                if row is not None:
+                    self.metadata[row] = metadata
+                    log_lines.append(json.dumps({"add": vector_id, "row": row, "metadata": metadata}))
+            if log_lines:
+                self._append_log(log_lines)
+
+    def fetch(self, ids: Iterable[str]) -> List[Dict]:
+        with self.lock, self._file_lock(exclusive=False):
+            self._sync()
+            return [{"id": i, "metadata": dict(self.metadata[self.rows[i]])} for i in ids if i in self.rows]
+
+    def list_ids(self, prefix: str = "") -> List[str]:
+        with self.lock, self._file_lock(exclusive=False):
+            self._sync()
+            return [i for i in self.rows if i.startswith(prefix)]
+
+    def delete(self, ids: Optional[Iterable[str]] = None, filter: Optional[Dict] = None) -> int:
+        with self.lock, self._file_lock(exclusive=True):
+            self._sync()
+            if ids is not None:
+                rows = [self.rows[i] for i in ids if i in self.rows]
+            else:
+                rows = [r for r in self.rows.values() if _matches_filter(self.metadata[r], filter)]
+            if not rows:
+                return 0
+            for row in rows:
+                self._clear_row(row)
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(row)
+            self._append_log([json.dumps({"delete": rows})])
+            if self.rows and len(self.ids) - self.live > max(self.live, self.GROW_ROWS):
+                self._compact()
+            return len(rows)
+
+    def drop_if_empty(self) -> bool:
+        """Remove the document's files once its last vector is gone."""
+        with self.lock, self._file_lock(exclusive=True):
+            self._sync()
+            if self.rows:
+                return False
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._reset()
+            return True
+
+    def _compact(self):
+        """
+        Rewrite both files without tombstoned rows, as the next generation.
+        Each file is written to a .tmp, fsynced and renamed into place: first
+        the vectors (a new name, the live file is untouched), then the log that
+        points at them. Only then is the old vectors file removed.
+        """
+        live_rows = [r for r, i in enumerate(self.ids) if i is not None]
+        vectors = np.ascontiguousarray(self._vectors[live_rows], dtype=np.float32)
+        entries = [(self.ids[r], self.metadata[r]) for r in live_rows]
+        old_vectors_path = self._vectors_path
+        generation = self.generation + 1
+        vectors_path = self._generation_path(generation)
+
+        with open(vectors_path + ".tmp", "wb") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(vectors_path + ".tmp", vectors_path)
+
+        tmp_log = self._log_path + ".tmp"
+        with open(tmp_log, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"dim": self.dim, "generation": generation}) + "\n")
+            for row, (vector_id, metadata) in enumerate(entries):
+                f.write(json.dumps({"add": vector_id, "row": row, "metadata": metadata}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            log_state = (os.fstat(f.fileno()).st_ino, f.tell())
+        os.replace(tmp_log, self._log_path)
+        _fsync_dir(self.path)
+
+        dim = self.dim
+        self._reset()
+        self.dim, self.generation, self._log_state = dim, generation, log_state
+        self._log_file = open(self._log_path, "rb")
+        for row, (vector_id, metadata) in enumerate(entries):
+            self._set_row(row, vector_id, metadata)
+        self._capacity = len(entries)
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+        os.remove(old_vectors_path)
+
+    def _build_hnsw(self):
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=self._capacity, M=settings.VECTOR_STORE_HNSW_M,
+                         ef_construction=settings.VECTOR_STORE_HNSW_EF_CONSTRUCTION)
+        index.add_items(self._vectors[self._live()], self._live())
+        self._hnsw = index
+
+    def query(self, vector: np.ndarray, top_k: int, filter: Optional[Dict], exact: bool = False) -> List[Dict]:
+        with self.lock, self._file_lock(exclusive=False):
+            self._sync()
+            if not self.rows:
+                return []
+            if self._hnsw is None and not exact and hnswlib is not None \
+                    and 0 < settings.VECTOR_STORE_HNSW_MIN_VECTORS <= self.live:
+                self._build_hnsw()
+
+            hits = None
+            if self._hnsw is not None and not exact:
+                k = min(top_k, self.live)
+                self._hnsw.set_ef(max(settings.VECTOR_STORE_HNSW_EF_SEARCH, k))
+                try:
+                    labels, distances = self._hnsw.knn_query(
+                        vector, k=k,
+                        filter=(lambda row: _matches_filter(self.metadata[row], filter)) if filter else None,
+                    )
+                    # "ip" distance is 1 - inner product
+                    hits = [(int(row), 1.0 - float(d)) for row, d in zip(labels[0], distances[0])]
+                except RuntimeError:
+                    pass  # fewer than k vectors pass the filter: search exactly
+
+            if hits is None:
+                live_rows = self._live()
+                if filter:
+                    live_rows = live_rows[[_matches_filter(self.metadata[r], filter) for r in live_rows]]
+                if not len(live_rows):
+                    return []
+                scores = self._vectors[live_rows] @ vector
+                k = min(top_k, len(live_rows))
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                hits = [(int(live_rows[i]), float(scores[i])) for i in top]
+
+            return [{"id": self.ids[row], "score": score, "metadata": dict(self.metadata[row])} for row, score in hits]
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, root: str):
+        self.root = root
+        self._documents: Dict[str, _DocumentIndex] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, document_id: str) -> str:
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9_.-]", "_", str(document_id)))
+
+    def _document(self, document_id: str, create: bool = False) -> Optional[_DocumentIndex]:
+        with self._lock:
+            doc = self._documents.get(document_id)
+            if doc is None:
+                path = self._path(document_id)
+                if not create and not os.path.isdir(path):
+                    return None
+                doc = self._documents[document_id] = _DocumentIndex(path)
+            return doc
+
+    def _candidates(self, filter: Optional[Dict]) -> List[Tuple[str, _DocumentIndex]]:
+        document_ids = _filter_document_ids(filter)
+        if document_ids is None:
+            with self._lock:
+                document_ids = list(set(self._documents) | set(os.listdir(self.root)))
+        docs = [(d, self._document(d)) for d in document_ids]
+        return [(d, doc) for d, doc in docs if doc is not None]
+
+    def upsert(self, items: List[VectorItem]):
+        by_document: Dict[str, List[VectorItem]] = {}
+        for item in items:
+            by_document.setdefault(item[2]["document_id"], []).append(item)
+        for document_id, doc_items in by_document.items():
+            self._document(document_id, create=True).upsert(doc_items)
+
+    def query(self, vector, top_k, filter=None, exact: bool = False):
+        vector = np.asarray(vector, dtype=np.float32)
+        # Partitioning already applies the document_id condition
+        rest = {k: v for k, v in (filter or {}).items() if k != "document_id"}
+        if _filter_document_ids(filter) is None:
+            rest = filter
+        matches = []
+        for _, doc in self._candidates(filter):
+            matches.extend(doc.query(vector, top_k, rest, exact=exact))
+        matches.sort(key=lambda m: m["score"], reverse=True)
+        return matches[:top_k]
+
+    def list_ids(self, prefix=""):
+        for _, doc in self._candidates(None):
+            yield from doc.list_ids(prefix)
+
+    def update_metadata(self, items):
+        by_document: Dict[str, List[Tuple[str, Dict]]] = {}
+        for item in items:
+            by_document.setdefault(item[1]["document_id"], []).append(item)
+        for document_id, doc_items in by_document.items():
+            doc = self._document(document_id)
+            if doc is not None:
+                doc.update_metadata(doc_items)
+
+    def fetch(self, ids, filter=None):
+        found = {}
+        for _, doc in self._candidates(filter):
+            found.update((m["id"], m) for m in doc.fetch(ids))
+        return [found[i] for i in ids if i in found]
+
+    def delete(self, ids=None, filter=None):
+        for document_id, doc in self._candidates(filter):
+            # Last vector gone: drop the document's files
+            if doc.delete(ids=ids, filter=filter) and doc.drop_if_empty():
+                with self._lock:
+                    self._documents.pop(document_id, None)
+
+
+def make_vector_store(backend: Optional[str] = None) -> VectorStore:
+    backend = (backend or settings.VECTOR_STORE).lower()
+    if backend == "local":
+        return LocalVectorStore(settings.VECTOR_STORE_DIR)
+    if backend == "pinecone":
+        from .embedding_service import embedding_service
+
+        return PineconeVectorStore(settings.PINECONE_API_KEY, settings.PINECONE_INDEX,
+                                   dimension=lambda: embedding_service.dimension)
+    raise ValueError(f"Unknown VECTOR_STORE {backend!r} (expected 'pinecone' or 'local')")
+
+
+vector_store = make_vector_store()
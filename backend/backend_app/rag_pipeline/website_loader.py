@@ -1,89 +1,65 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 import re
-import time
+from typing import List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin
+
+from bs4 import BeautifulSoup
+
+from ..core.config import settings
 
 
-def extract_text_from_website(url: str) -> str:
+def parse_page(html: str, base_url: str) -> Tuple[str, List[str]]:
     """
-    Fetch a website and extract visible text content using BeautifulSoup.
+    Visible text of an HTML page, plus the absolute URLs it links to.
     Filters out scripts, styles, and irrelevant tags.
     """
-    # More realistic headers to avoid being blocked
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
-
-    max_retries = 3
-    timeout = 30  # Increased timeout to 30 seconds
-
-    for attempt in range(max_retries):
-        try:
-            print(f"Attempting to fetch {url} (attempt {attempt + 1}/{max_retries})")
-
-            # Create session for better connection handling
-            session = requests.Session()
-            session.headers.update(headers)
-
-            response = session.get(url, timeout=timeout, allow_redirects=True)
-            response.raise_for_status()
+    soup = BeautifulSoup(html, "html.parser")
 
-            soup = BeautifulSoup(response.text, "html.parser")
+    # Links first: navigation is dropped from the text but is where most links are
+    links = []
+    for a in soup.find_all("a", href=True):
+        href = a["href"].strip()
+        if href and not href.startswith(("mailto:", "javascript:", "tel:")):
+            links.append(urldefrag(urljoin(base_url, href))[0])
 
-            # Remove noise
-            for tag in soup(["script", "style", "noscript", "header", "footer", "svg", "nav", "aside"]):
-                tag.decompose()
+    # Remove noise
+    for tag in soup(["script", "style", "noscript", "header", "footer", "svg", "nav", "aside"]):
+        tag.decompose()
 
-            text = soup.get_text(separator="\n")
+    text = soup.get_text(separator="\n")
 
-            # Normalize whitespace
-            text = re.sub(r'\n\s*\n+', '\n\n', text)
-            text = re.sub(r'[ \t]+', ' ', text)
+    # Normalize whitespace
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    return text.strip(), links
 
-            if not text.strip():
-                raise ValueError("No text content found on the page")
 
-            print(f"Successfully extracted {len(text)} characters from {url}")
-            print("\n=== Final Extracted Text ===\n")
-            print(text)
-            return text.strip()
-
-        except requests.exceptions.Timeout:
-            print(f"Timeout error on attempt {attempt + 1} for {url}")
-            if attempt < max_retries - 1:
-                time.sleep(2)  # Wait 2 seconds before retry
-                continue
-            else:
-                raise RuntimeError(f"Failed to extract website text: Request timed out after {max_retries} attempts")
-
-        except requests.exceptions.ConnectionError as e:
-            print(f"Connection error on attempt {attempt + 1} for {url}: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                continue
-            else:
-                raise RuntimeError(f"Failed to extract website text: Connection error - {e}")
-
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403:
-                raise RuntimeError(
-                    f"Failed to extract website text: Access denied (403) - The website may be blocking automated requests")
-            elif e.response.status_code == 404:
-                raise RuntimeError(f"Failed to extract website text: Page not found (404)")
-            else:
-                raise RuntimeError(f"Failed to extract website text: HTTP {e.response.status_code} - {e}")
-
-        except Exception as e:
-            print(f"Unexpected error on attempt {attempt + 1} for {url}: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-                continue
-            else:
-                raise RuntimeError(f"Failed to extract website text: {e}")
-
-    raise RuntimeError(f"Failed to extract website text after {max_retries} attempts")
\ No newline at end of file
+def extract_text_from_website(url: str, max_depth: int = 0, max_pages: int = 1, progress=None,
+                              loop: Optional[asyncio.AbstractEventLoop] = None) -> str:
+    """
+    Crawl `url` (and, with max_depth > 0, same-site pages it links to) and
+    return the pages' text, each headed by its URL. Blocking: called from an
+    ingest worker thread. With `loop` the crawl runs there and shares its
+    connection pool; otherwise it gets a private event loop.
+    """
+    from .crawler import crawler
+
+    crawl = crawler.crawl(url, max_depth=max_depth, max_pages=max_pages, progress=progress)
+    if loop is not None:
+        pages = asyncio.run_coroutine_threadsafe(crawl, loop).result()
+    else:
+        pages = asyncio.run(crawl)
+
+    text = "\n\n".join(f"Source: {page_url}\n\n{page_text}" if len(pages) > 1 else page_text
+                       for page_url, page_text in pages)
+    if not text.strip():
+        raise RuntimeError("Failed to extract website text: No text content found on the page")
+    print(f"Extracted {len(text)} characters from {len(pages)} page(s) of {url}")
+    return text
+
+
+def crawl_limits(max_depth: Optional[int], max_pages: Optional[int]) -> Tuple[int, int]:
+    """Requested crawl depth and page budget, defaulted and capped by the settings."""
+    depth = settings.CRAWL_MAX_DEPTH if max_depth is None else max(0, min(max_depth, settings.CRAWL_MAX_DEPTH))
+    pages = settings.CRAWL_MAX_PAGES if max_pages is None else max(1, min(max_pages, settings.CRAWL_MAX_PAGES))
+    return depth, pages
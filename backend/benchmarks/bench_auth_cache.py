@@ -0,0 +1,101 @@
+"""
+Load test for the user cache in get_current_user.
+
+Seeds --users users into the configured MongoDB. Then it drives GET /auth/me
+in-process through httpx's ASGI transport with their tokens, once with the
+cache disabled (TTL 0) and once enabled. A further --unknown-share of requests
+carry tokens for subjects that don't exist, to exercise the negative cache.
+For each run it reports request throughput, Mongo user lookups per second and
+the cache hit rate. The seeded users are removed afterwards.
+
+Usage (from backend/, with MONGO_URI pointing at a scratch database):
+    python -m benchmarks.bench_auth_cache --users 50 --requests 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import httpx
+from fastapi import FastAPI
+from pymongo import MongoClient
+
+from backend_app.api.auth import router as auth_router
+from backend_app.core import auth
+from backend_app.core.config import settings
+
+
+async def _drive(app: FastAPI, tokens, concurrency: int, total: int):
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(tokens[i % len(tokens)])
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                token = queue.get_nowait()
+                resp = await client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+                if resp.status_code not in (200, 401):
+                    resp.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--unknown-share", type=float, default=0.1,
+                        help="fraction of requests whose token subject has no user")
+    args = parser.parse_args()
+
+    app = FastAPI()
+    app.include_router(auth_router, prefix="/auth")
+
+    seed = MongoClient(settings.MONGO_URI)[settings.MONGO_DB_NAME]["users"]
+    emails = [f"bench-auth-{i}@example.com" for i in range(args.users)]
+    seed.insert_many([{
+        "name": f"Bench {i}",
+        "email": email,
+        "password_hash": "x",
+        "avatar_url": None,
+        "created_at": datetime.utcnow(),
+    } for i, email in enumerate(emails)])
+
+    unknown = max(1, int(len(emails) * args.unknown_share / max(1e-9, 1 - args.unknown_share)))
+    tokens = [auth.create_access_token(sub=e) for e in emails]
+    tokens += [auth.create_access_token(sub=f"bench-auth-missing-{i}@example.com") for i in range(unknown)]
+    random.Random(0).shuffle(tokens)
+
+    ttl, negative_ttl = settings.USER_CACHE_TTL, settings.USER_NEGATIVE_CACHE_TTL
+    try:
+        print(f"{args.users} users + {unknown} unknown subjects, {args.requests} requests, "
+              f"concurrency {args.concurrency}")
+        print(f"{'cache':>6} {'req/s':>9} {'db lookups/s':>13} {'db lookups':>11} {'hit rate':>9}")
+        for name, enabled in (("off", False), ("on", True)):
+            auth.user_cache.clear()
+            auth.user_cache.hits = auth.user_cache.misses = 0
+            auth.user_cache.ttl = ttl if enabled else 0
+            settings.USER_NEGATIVE_CACHE_TTL = negative_ttl if enabled else 0
+            auth.user_db_lookups = 0
+
+            elapsed = await _drive(app, tokens, args.concurrency, args.requests)
+            stats = auth.user_cache_stats()
+            print(f"{name:>6} {args.requests / elapsed:>9.1f} {stats['db_lookups'] / elapsed:>13.1f} "
+                  f"{stats['db_lookups']:>11} {stats['hit_rate']:>9.2%}")
+    finally:
+        auth.user_cache.ttl = ttl
+        settings.USER_NEGATIVE_CACHE_TTL = negative_ttl
+        seed.delete_many({"email": {"$in": emails}})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Chunkers on a corpus of PDFs: speed, chunk count and truncation by the embedder.
+
+Text is extracted from every PDF first and is not timed. Each chunker then
+splits the whole corpus:
+
+- recursive: the LangChain splitter, 1000 characters with 150 overlap
+- content: content-defined chunks, sized in characters
+- tokens: content-defined chunks, sized in the embedder's tokens (the default)
+
+Every chunk is then counted with the embedder's tokenizer, including the
+passage prefix and special tokens. A chunk over the model's window
+(max_seq_length) is silently truncated when embedded. The benchmark reports
+how many chunks that hits and the share of tokens lost.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chunker docs/*.pdf
+    python -m benchmarks.bench_chunker scans/ --chunkers tokens recursive
+"""
+import argparse
+import glob
+import os
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+from backend_app.core.config import settings
+from backend_app.rag_pipeline.embedding_service import embedding_service
+from backend_app.rag_pipeline.pdf_loader import iter_pdf_pages
+from backend_app.rag_pipeline.prepare_dataset import iter_content_chunks, iter_text_chunks, iter_token_chunks
+
+
+def _pdf_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True))
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+", help="PDF files or directories of PDFs")
+    parser.add_argument("--chunkers", nargs="+", default=["recursive", "content", "tokens"])
+    parser.add_argument("--chunk-tokens", type=int, default=settings.CHUNK_TOKENS,
+                        help="token budget per chunk (0: the embedder's window)")
+    args = parser.parse_args()
+
+    documents = [list(iter_pdf_pages(path)) for path in _pdf_paths(args.pdfs)]
+    chars = sum(len(text) for pages in documents for _, text in pages)
+    tokenizer, window = embedding_service.passage_tokenizer()
+    if tokenizer is None:
+        raise SystemExit(f"{embedding_service.model_name} has no fast tokenizer; the token chunker is unavailable")
+    limit = embedding_service.model.max_seq_length
+    chunk_tokens = min(args.chunk_tokens or window, window)
+    overlap = min(settings.CHUNK_OVERLAP_TOKENS, chunk_tokens // 2)
+
+    chunkers = {
+        "recursive": lambda pages: iter_text_chunks(pages),
+        "content": lambda pages: iter_content_chunks(pages),
+        "tokens": lambda pages: iter_token_chunks(pages, tokenizer, chunk_tokens, overlap),
+    }
+    print(f"{len(documents)} PDFs, {sum(len(p) for p in documents)} pages, {chars / 1e6:.1f}M characters; "
+          f"{embedding_service.model_name} reads {limit} tokens, the token chunker fills {chunk_tokens}")
+    print(f"{'chunker':>10} {'seconds':>8} {'MB/s':>6} {'chunks':>7} {'mean tok':>9} {'max tok':>8} "
+          f"{'truncated':>10} {'tokens lost':>12}")
+
+    for name in args.chunkers:
+        started = time.perf_counter()
+        chunks = [chunk for pages in documents for chunk, _, _ in chunkers[name](pages)]
+        seconds = time.perf_counter() - started
+
+        # What the embedder sees: prefix + chunk + special tokens
+        lengths = [len(ids) for ids in tokenizer([embedding_service.PASSAGE_PREFIX + c for c in chunks],
+                                                 verbose=False)["input_ids"]]
+        total = sum(lengths)
+        over = [n for n in lengths if n > limit]
+        lost = sum(n - limit for n in over)
+        print(f"{name:>10} {seconds:>8.2f} {chars / 1e6 / seconds:>6.1f} {len(chunks):>7} "
+              f"{total / max(1, len(chunks)):>9.0f} {max(lengths, default=0):>8} "
+              f"{len(over) / max(1, len(chunks)):>10.1%} {lost / max(1, total):>12.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Crawler throughput against a local fixture site.
+
+Serves a generated site of --pages HTML pages from a threaded HTTP server on
+localhost. Each page links to --fanout others, and each response is delayed by
+--latency-ms to stand in for a remote host. Pages carry an ETag and honour
+If-None-Match, and robots.txt disallows /private/. Reported runs:
+
+- sequential: the old approach, one blocking requests.get after another
+- crawler cold: the asyncio crawler with an empty conditional-GET cache
+- crawler warm: the same crawl again, now answered with 304s
+
+Usage (from backend/):
+    python -m benchmarks.bench_crawler --pages 200 --latency-ms 50
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("CRAWL_CACHE_DIR", tempfile.mkdtemp(prefix="bench-crawl-"))
+
+import requests
+
+from backend_app.core.config import settings
+from backend_app.rag_pipeline.crawler import crawler
+
+
+def _fixture_handler(pages: int, fanout: int, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes = b"", content_type: str = "text/html", etag: str = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path == "/robots.txt":
+                return self._send(200, b"User-agent: *\nDisallow: /private/\n", "text/plain")
+            if not self.path.startswith("/page/"):
+                return self._send(404)
+            try:
+                i = int(self.path.rsplit("/", 1)[1])
+            except ValueError:
+                return self._send(404)
+            if not 0 <= i < pages:
+                return self._send(404)
+
+            etag = '"%s"' % hashlib.sha1(str(i).encode()).hexdigest()[:12]
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, etag=etag)
+            links = "".join(f'<li><a href="/page/{(i * fanout + j + 1) % pages}">next {j}</a></li>'
+                            for j in range(fanout))
+            body = (f"<html><head><title>Page {i}</title></head><body><nav><ul>{links}"
+                    f'<li><a href="/private/{i}">private</a></li></ul></nav>'
+                    f"<main><h1>Page {i}</h1>" + "<p>Lorem ipsum dolor sit amet. </p>" * 40 +
+                    "</main></body></html>").encode()
+            self._send(200, body, etag=etag)
+
+    return Handler
+
+
+def _sequential(base: str, pages: int) -> float:
+    started = time.perf_counter()
+    with requests.Session() as session:
+        for i in range(pages):
+            session.get(f"{base}/page/{i}", timeout=30).raise_for_status()
+    return time.perf_counter() - started
+
+
+async def _crawl(base: str, pages: int):
+    started = time.perf_counter()
+    result = await crawler.crawl(f"{base}/page/0", max_depth=pages, max_pages=pages)
+    return len(result), time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _fixture_handler(args.pages, args.fanout, args.latency_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        print(f"{args.pages} pages, fanout {args.fanout}, {args.latency_ms:.0f} ms latency, "
+              f"concurrency {settings.CRAWL_CONCURRENCY} ({settings.CRAWL_PER_HOST} per host)")
+        print(f"{'run':>14} {'pages':>6} {'seconds':>8} {'pages/s':>8}")
+
+        seconds = await asyncio.to_thread(_sequential, base, args.pages)
+        print(f"{'sequential':>14} {args.pages:>6} {seconds:>8.2f} {args.pages / seconds:>8.1f}")
+
+        for name in ("crawler cold", "crawler warm"):
+            before = crawler.stats()
+            fetched, seconds = await _crawl(base, args.pages)
+            after = crawler.stats()
+            print(f"{name:>14} {fetched:>6} {seconds:>8.2f} {fetched / seconds:>8.1f}   "
+                  f"304s: {after['not_modified'] - before['not_modified']}, "
+                  f"robots-blocked: {after['robots_blocked'] - before['robots_blocked']}")
+    finally:
+        await crawler.aclose()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""
+Worker start time and resident memory: one shared embedding service versus the
+old layout with a separate SentenceTransformer in query.py and prepare_dataset.py.
+
+Usage (from backend/):
+    python -m benchmarks.bench_embedder_startup
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / 1024 if sys.platform != "darwin" else rss / (1024 * 1024)
+
+
+def _run(mode: str):
+    started = time.perf_counter()
+    if mode == "shared":
+        from backend_app.rag_pipeline.embedding_service import embedding_service
+
+        embedding_service.encode_queries(["warmup"])
+        embedding_service.encode_passages(["warmup"])
+    else:
+        from sentence_transformers import SentenceTransformer
+
+        from backend_app.core.config import settings
+
+        query_model = SentenceTransformer(settings.EMBEDDER_MODEL)
+        ingest_model = SentenceTransformer(settings.EMBEDDER_MODEL)
+        query_model.encode(["query: warmup"])
+        ingest_model.encode(["passage: warmup"])
+    print(json.dumps({"mode": mode, "seconds": time.perf_counter() - started, "peak_rss_mb": _peak_rss_mb()}))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        _run(sys.argv[2])
+        return
+
+    print(f"{'mode':>8} {'seconds':>9} {'peak RSS MB':>12}")
+    for mode in ("legacy", "shared"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_embedder_startup", "--child", mode],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(out)
+        print(f"{mode:>8} {result['seconds']:>9.2f} {result['peak_rss_mb']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Concurrency benchmark for the history endpoints: the shared async Motor client
+versus the previous per-router blocking pymongo client inside `async def`.
+
+Seeds one user with --chats chats (each --messages messages long) into the
+configured MongoDB, then drives GET /history/user/{id} and GET /history/{chat_id}
+in-process through httpx's ASGI transport at each concurrency level. The
+seeded documents are removed afterwards.
+
+Usage (from backend/, with MONGO_URI pointing at a scratch database):
+    python -m benchmarks.bench_history --concurrency 1 16 64 --requests 400
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import httpx
+import numpy as np
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException
+from pymongo import MongoClient
+
+from backend_app.api.history import router as history_router
+from backend_app.core.config import settings
+
+
+def _legacy_app() -> FastAPI:
+    """The old handlers: a blocking MongoClient called from async routes."""
+    app = FastAPI()
+    client = MongoClient(settings.MONGO_URI)
+    col = client[settings.MONGO_DB_NAME]["history"]
+
+    @app.get("/history/user/{user_id}")
+    async def get_user_chats(user_id: str, limit: int = 50):
+        docs = list(col.find({"user_id": ObjectId(user_id)}).sort("created_at", -1).limit(limit))
+        return [{"_id": str(d["_id"]), "messages": d.get("messages", [])} for d in docs]
+
+    @app.get("/history/{chat_id}")
+    async def get_chat(chat_id: str):
+        doc = col.find_one({"_id": ObjectId(chat_id)})
+        if not doc:
+            raise HTTPException(status_code=404)
+        return {"_id": str(doc["_id"]), "messages": doc.get("messages", [])}
+
+    return app
+
+
+def _motor_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(history_router)
+    return app
+
+
+async def _drive(app: FastAPI, paths, concurrency: int, total: int):
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                started = time.perf_counter()
+                resp = await client.get(path)
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000
+    return total / elapsed, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--chats", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+
+    seed = MongoClient(settings.MONGO_URI)[settings.MONGO_DB_NAME]["history"]
+    user_id = ObjectId()
+    docs = [{
+        "user_id": user_id,
+        "email": "bench@example.com",
+        "pdf_name": f"bench-{i}.pdf",
+        "document_id": ObjectId(),
+        "messages": [{"sender": "user" if m % 2 == 0 else "bot", "text": "lorem ipsum " * 20}
+                     for m in range(args.messages)],
+        "created_at": datetime.utcnow(),
+    } for i in range(args.chats)]
+    chat_ids = seed.insert_many(docs).inserted_ids
+    paths = [f"/history/user/{user_id}"] + [f"/history/{c}" for c in chat_ids]
+
+    try:
+        print(f"{args.chats} chats x {args.messages} messages, pool size {settings.MONGO_MAX_POOL_SIZE}")
+        print(f"{'conc':>5} {'client':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for concurrency in args.concurrency:
+            for name, app in (("pymongo", _legacy_app()), ("motor", _motor_app())):
+                rps, p50, p99 = await _drive(app, paths, concurrency, args.requests)
+                print(f"{concurrency:>5} {name:>8} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f}")
+    finally:
+        seed.delete_many({"user_id": user_id})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
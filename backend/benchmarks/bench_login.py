@@ -0,0 +1,140 @@
+"""
+Load benchmark for POST /auth/login: bcrypt inline in the handler versus the
+bounded password-hashing pool.
+
+Seeds --users users with real bcrypt hashes into the configured MongoDB. A
+burst of --requests logins at --concurrency then goes through httpx's ASGI
+transport. Meanwhile a probe requests a trivial endpoint every 10 ms. The probe
+latency shows how long the event loop stays blocked. Logins rejected with 503
+(hashing queue full) are counted separately. The seeded users are removed
+afterwards.
+
+Usage (from backend/, with MONGO_URI pointing at a scratch database):
+    python -m benchmarks.bench_login --users 20 --requests 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import httpx
+import numpy as np
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from pymongo import MongoClient
+
+from backend_app.api.auth import router as auth_router
+from backend_app.core.auth import create_access_token, hash_password, password_hasher, verify_password
+from backend_app.core.config import settings
+from backend_app.db.mongodb import users_col
+
+PASSWORD = "bench-password"
+
+
+def _with_probe(app: FastAPI) -> FastAPI:
+    @app.get("/ping")
+    async def ping():
+        return {}
+    return app
+
+
+def _legacy_app() -> FastAPI:
+    """The old handler: bcrypt verification inline on the event loop."""
+    app = FastAPI()
+
+    @app.post("/auth/login")
+    async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+        email = form_data.username.lower().strip()
+        user = await users_col().find_one({"email": email})
+        if not user or not verify_password(form_data.password, user["password_hash"]):
+            raise HTTPException(status_code=400, detail="Invalid email or password.")
+        return {"access_token": create_access_token(sub=email), "token_type": "bearer"}
+
+    return _with_probe(app)
+
+
+def _pooled_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(auth_router, prefix="/auth")
+    return _with_probe(app)
+
+
+async def _drive(app: FastAPI, emails, concurrency: int, total: int):
+    latencies, probes, statuses = [], [], {}
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(emails[i % len(emails)])
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        done = asyncio.Event()
+
+        async def worker():
+            while not queue.empty():
+                email = queue.get_nowait()
+                started = time.perf_counter()
+                resp = await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+                latencies.append(time.perf_counter() - started)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/ping")
+                probes.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    ms = np.array(latencies) * 1000
+    probe_ms = np.array(probes) * 1000
+    return {
+        "ok_per_s": statuses.get(200, 0) / elapsed,
+        "p50": np.percentile(ms, 50),
+        "p99": np.percentile(ms, 99),
+        "probe_p99": np.percentile(probe_ms, 99) if len(probe_ms) else float("nan"),
+        "rejected": statuses.get(503, 0),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    seed = MongoClient(settings.MONGO_URI)[settings.MONGO_DB_NAME]["users"]
+    emails = [f"bench-login-{i}@example.com" for i in range(args.users)]
+    password_hash = hash_password(PASSWORD)
+    seed.insert_many([{
+        "name": f"Bench {i}",
+        "email": email,
+        "password_hash": password_hash,
+        "avatar_url": None,
+        "created_at": datetime.utcnow(),
+    } for i, email in enumerate(emails)])
+
+    try:
+        print(f"{args.requests} logins at concurrency {args.concurrency}, "
+              f"{settings.PASSWORD_HASH_WORKERS} bcrypt workers, queue limit {settings.PASSWORD_HASH_MAX_QUEUE}")
+        print(f"{'handler':>8} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'probe p99':>10} {'503s':>5}")
+        for name, app in (("inline", _legacy_app()), ("pooled", _pooled_app())):
+            r = await _drive(app, emails, args.concurrency, args.requests)
+            print(f"{name:>8} {r['ok_per_s']:>9.1f} {r['p50']:>8.1f} {r['p99']:>8.1f} "
+                  f"{r['probe_p99']:>10.1f} {r['rejected']:>5}")
+        print("pool:", password_hasher.stats())
+    finally:
+        seed.delete_many({"email": {"$in": emails}})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
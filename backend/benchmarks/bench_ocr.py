@@ -0,0 +1,42 @@
+"""
+OCR throughput for scanned PDFs at different worker counts.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ocr scanned.pdf --workers 1 2 4 8 --dpi 200
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+from pdf2image import pdfinfo_from_bytes
+
+from backend_app.rag_pipeline.image_loader import extract_text_from_pdf_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--window", type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+    pages = pdfinfo_from_bytes(pdf_bytes)["Pages"]
+
+    print(f"{args.pdf}: {pages} pages @ {args.dpi} dpi, window={args.window}")
+    print(f"{'workers':>8} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        extract_text_from_pdf_bytes(pdf_bytes, workers=workers, dpi=args.dpi, window=args.window)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>9.2f} {pages / elapsed:>9.2f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
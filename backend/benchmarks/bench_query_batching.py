@@ -0,0 +1,77 @@
+"""
+Query-embedding latency and throughput under concurrent load, with and without
+micro-batching. Each client encodes questions back to back for --seconds.
+
+Usage (from backend/):
+    python -m benchmarks.bench_query_batching --clients 1 8 32 64 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import numpy as np
+
+from backend_app.rag_pipeline.embedding_service import embedding_service
+from backend_app.rag_pipeline.query_batcher import QueryEncodeBatcher
+
+QUESTIONS = [
+    "What is the termination notice period?",
+    "Summarize the main findings of the report.",
+    "Who are the parties to this agreement?",
+    "What were the total revenues in the last fiscal year?",
+    "Which safety precautions are listed for installation?",
+    "How is the warranty claim process described?",
+    "What are the key risks mentioned by the authors?",
+    "When does the contract come into effect?",
+]
+
+
+async def _load(encode, clients: int, seconds: float):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(n: int):
+        rng = random.Random(n)
+        while time.perf_counter() < deadline:
+            # Unique suffix so nothing could be served from a cache
+            question = f"{rng.choice(QUESTIONS)} #{rng.random()}"
+            started = time.perf_counter()
+            await encode(question)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+    ms = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    embedding_service.warmup()
+    batcher = QueryEncodeBatcher(embedding_service.encode_queries, args.max_batch, args.max_wait_ms)
+
+    async def unbatched(question: str):
+        return (await asyncio.to_thread(embedding_service.encode_queries, [question]))[0]
+
+    print(f"{embedding_service.model_name}, max_batch={args.max_batch}, max_wait={args.max_wait_ms} ms")
+    print(f"{'clients':>8} {'mode':>10} {'QPS':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for clients in args.clients:
+        for mode, encode in (("unbatched", unbatched), ("batched", batcher.encode)):
+            qps, p50, p99 = await _load(encode, clients, args.seconds)
+            print(f"{clients:>8} {mode:>10} {qps:>8.1f} {p50:>9.1f} {p99:>9.1f}")
+    print(f"Batcher: {batcher.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
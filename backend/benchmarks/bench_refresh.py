@@ -0,0 +1,142 @@
+"""
+Refreshing a changed document: chunks re-embedded vs a full re-ingest.
+
+Ingests a synthetic documentation site of --sections sections into the local
+vector store, then edits it: --edit-percent of the sections get a sentence
+changed, and one section in fifty is inserted or removed. The new version is
+refreshed in place (rag_pipeline/reindex.py). The benchmark reports the share
+of chunks embedded again, once per chunker, with the time of the refresh
+against a full ingest of the new version. It also checks that the refreshed
+document holds exactly the new chunks, in order.
+
+Usage (from backend/):
+    python -m benchmarks.bench_refresh --sections 400 --edit-percent 3
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("VECTOR_STORE_DIR", tempfile.mkdtemp(prefix="bench-refresh-"))
+os.environ.setdefault("HYBRID_SEARCH", "false")
+
+from backend_app.core.config import settings
+from backend_app.rag_pipeline import prepare_dataset
+from backend_app.rag_pipeline.embedding_service import embedding_service
+from backend_app.rag_pipeline.reindex import refresh_document, stored_manifest
+from backend_app.rag_pipeline.vector_cleanup import delete_vector_ids, vector_id_prefix
+from backend_app.rag_pipeline.vector_store import vector_store
+
+WORDS = ("the service reads configuration from environment variables and retries failed requests with "
+         "exponential backoff while the worker pool streams pages into chunks that are embedded and "
+         "stored so questions can be answered from the closest passages of each document").split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def _site(sections: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [f"Section {n}\n\n" + " ".join(_sentence(rng) for _ in range(rng.randint(4, 14)))
+            for n in range(sections)]
+
+
+def _edit(site, edit_percent: float, seed: int = 1):
+    rng = random.Random(seed)
+    site = list(site)
+    for i in rng.sample(range(len(site)), max(1, int(len(site) * edit_percent / 100))):
+        sentences = site[i].split(". ")
+        sentences[rng.randrange(len(sentences))] = _sentence(rng).rstrip(".")
+        site[i] = ". ".join(sentences)
+    for _ in range(max(1, len(site) // 50)):
+        site.insert(rng.randrange(len(site)), "New section\n\n" + " ".join(_sentence(rng) for _ in range(6)))
+        del site[rng.randrange(len(site))]
+    return site
+
+
+def _pages(site):
+    return [(None, "\n\n".join(site))]
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.chunks = 0
+        self._encode = embedding_service.encode_passages
+
+    def __enter__(self):
+        def counting(texts):
+            self.chunks += len(texts)
+            return self._encode(texts)
+
+        embedding_service.encode_passages = counting
+        return self
+
+    def __exit__(self, *exc):
+        embedding_service.encode_passages = self._encode
+
+
+def _ingest(site, document_id: str):
+    checkpoint = {"committed": 0, "manifest": []}
+
+    def on_commit(start, end, digests):
+        checkpoint["manifest"][start:] = digests
+        checkpoint["committed"] = end
+
+    started = time.perf_counter()
+    chunks = prepare_dataset.process_pages_and_store(_pages(site), user_id="bench", source="docs",
+                                                     document_id=document_id, on_commit=on_commit)
+    return {"chunks_upserted": chunks, "checkpoint": checkpoint}, time.perf_counter() - started
+
+
+def _run(chunker: str, v1, v2):
+    settings.CHUNKER = chunker
+    document_id = f"bench-{chunker}"
+    upload, _ = _ingest(v1, document_id)
+
+    with CountingEncoder() as counter:
+        _, full_seconds = _ingest(v2, f"bench-{chunker}-full")
+        full_chunks = counter.chunks
+
+    with CountingEncoder() as counter:
+        started = time.perf_counter()
+        result = refresh_document(_pages(v2), user_id="bench", source="docs", document_id=document_id,
+                                  previous=stored_manifest(upload))
+        prefix = vector_id_prefix("bench", document_id)
+        delete_vector_ids([f"{prefix}{slot}" for slot in result["removed"]], document_id)
+        refresh_seconds = time.perf_counter() - started
+
+    stats = result["stats"]
+    stored = {m["id"]: m["metadata"] for m in vector_store.fetch(list(vector_store.list_ids(prefix)),
+                                                                   filter={"document_id": document_id})}
+    assert counter.chunks == stats["reembedded"]
+    assert len(stored) == stats["chunks"] == full_chunks, (len(stored), stats["chunks"], full_chunks)
+    for position, slot in enumerate(result["slots"]):
+        assert stored[f"{prefix}{slot}"]["chunk_id"] == position
+    print(f"{chunker:>10} {stats['chunks']:>7} {stats['reembedded']:>11} {stats['fraction_reembedded']:>9.1%} "
+          f"{stats['moved']:>6} {stats['removed']:>8} {refresh_seconds:>9.2f} {full_seconds:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=400)
+    parser.add_argument("--edit-percent", type=float, default=3)
+    parser.add_argument("--chunkers", default="tokens,content,recursive")
+    args = parser.parse_args()
+
+    embedding_service.warmup()
+    v1 = _site(args.sections)
+    v2 = _edit(v1, args.edit_percent)
+    print(f"{args.sections} sections, {args.edit_percent}% edited, {max(1, args.sections // 50)} inserted/removed")
+    print(f"{'chunker':>10} {'chunks':>7} {'re-embedded':>11} {'fraction':>9} {'moved':>6} {'removed':>8} "
+          f"{'refresh s':>9} {'full s':>7}")
+    for chunker in args.chunkers.split(","):
+        _run(chunker, v1, v2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Checkpointed ingestion: how much work a worker killed mid-document costs.
+
+Ingests a synthetic document of --pages pages into the local vector store. The
+--kill-at-batch'th upsert fails, which stands in for the worker dying, and
+upserts still in flight at that point are lost with it. The checkpoint the run
+reached is then used to resume. The benchmark reports the chunks embedded by
+each run, compared with restarting from scratch. It also checks that the
+resumed document ends up with every chunk stored exactly once.
+
+A second killed run is then resumed from a truncated copy of the source, which
+chunks into fewer pieces than the first attempt stored. After the cleanup
+IngestJobManager applies (delete ids from the new count up to the highest id
+sent), no id at or past the new chunk count may be left.
+
+Checkpoints are kept in memory with the same rules IngestJobManager applies on
+the uploads document, so no MongoDB is needed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_resume_ingest --pages 200 --kill-at-batch 6
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("VECTOR_STORE", "local")
+os.environ.setdefault("VECTOR_STORE_DIR", tempfile.mkdtemp(prefix="bench-resume-"))
+os.environ.setdefault("HYBRID_SEARCH", "false")
+
+from backend_app.rag_pipeline import prepare_dataset
+from backend_app.rag_pipeline.embedding_service import embedding_service
+from backend_app.rag_pipeline.vector_cleanup import delete_vector_ids, stale_vector_ids
+from backend_app.rag_pipeline.vector_store import vector_store
+
+WORDS = ("retrieval augmented generation splits documents into overlapping chunks that are embedded "
+         "and stored so that questions can be answered from the most similar passages").split()
+
+
+class WorkerKilled(Exception):
+    pass
+
+
+def _pages(n: int):
+    for p in range(n):
+        words = [WORDS[(p * 7 + i) % len(WORDS)] for i in range(450)]
+        yield p + 1, f"Page {p + 1}. " + " ".join(words)
+
+
+class CheckpointSink:
+    """In-memory stand-in for IngestJobManager._save_checkpoint."""
+
+    def __init__(self):
+        self.checkpoint = {"committed": 0, "manifest": []}
+
+    def __call__(self, start, end, digests):
+        if start and self.checkpoint["committed"] < start:
+            return  # not contiguous: the manager's conditional update would match nothing
+        self.checkpoint = {"committed": end, "manifest": self.checkpoint["manifest"][:start] + digests}
+
+
+def _stored(document_id: str):
+    return sorted(vector_store.list_ids(f"bench-{document_id}-"), key=lambda i: int(i.rsplit("-", 1)[1]))
+
+
+def _run(document_id: str, pages: int, checkpoint=None, kill_at=None, on_span=None):
+    encoded = {"chunks": 0}
+    sink = CheckpointSink()
+    if checkpoint:
+        sink.checkpoint = {"committed": checkpoint["committed"], "manifest": list(checkpoint["manifest"])}
+
+    encode, upsert = embedding_service.encode_passages, prepare_dataset._timed_upsert
+    calls = {"upserts": 0}
+
+    def counting_encode(texts):
+        encoded["chunks"] += len(texts)
+        return encode(texts)
+
+    def dying_upsert(items):
+        calls["upserts"] += 1
+        if kill_at and calls["upserts"] >= kill_at:
+            raise WorkerKilled(f"worker killed at upsert {calls['upserts']}")
+        return upsert(items)
+
+    embedding_service.encode_passages, prepare_dataset._timed_upsert = counting_encode, dying_upsert
+    started = time.perf_counter()
+    try:
+        prepare_dataset.process_pages_and_store(_pages(pages), user_id="bench", source="bench.pdf",
+                                                document_id=document_id, checkpoint=checkpoint, on_commit=sink,
+                                                on_span=on_span)
+        killed = False
+    except WorkerKilled:
+        killed = True
+    finally:
+        embedding_service.encode_passages, prepare_dataset._timed_upsert = encode, upsert
+    return encoded["chunks"], sink.checkpoint, killed, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--kill-at-batch", type=int, default=6)
+    args = parser.parse_args()
+
+    embedding_service.warmup()
+    total, _, _, full_seconds = _run("bench-full", args.pages)
+    print(f"{total} chunks; full ingest embeds {total} in {full_seconds:.1f}s")
+
+    first, checkpoint, killed, first_seconds = _run("bench-resume", args.pages, kill_at=args.kill_at_batch)
+    assert killed, "document finished before the kill point; lower --kill-at-batch"
+    print(f"killed run: embedded {first} chunks, checkpoint committed {checkpoint['committed']} "
+          f"({first - checkpoint['committed']} embedded but unconfirmed) in {first_seconds:.1f}s")
+
+    second, final, _, second_seconds = _run("bench-resume", args.pages, checkpoint=checkpoint)
+    print(f"resumed run: embedded {second} chunks in {second_seconds:.1f}s")
+    print(f"total embedded with checkpoints: {first + second} (restart from scratch: {first + total}); "
+          f"wasted {first + second - total} chunks = the unconfirmed batches")
+
+    stored = _stored("bench-resume")
+    assert len(stored) == total and final["committed"] == total, (len(stored), final["committed"], total)
+    print(f"resumed document holds all {len(stored)} chunks once; manifest length {len(final['manifest'])}")
+
+    # Resume from a source that now chunks shorter than what the killed run stored
+    span = {"end": 0}
+
+    def record_span(end):
+        span["end"] = max(span["end"], end)
+
+    _, checkpoint, _, _ = _run("bench-shrink", args.pages, kill_at=args.kill_at_batch, on_span=record_span)
+    left = len(_stored("bench-shrink"))
+    short_pages = max(1, args.pages // 10)
+    _, final, _, _ = _run("bench-shrink", short_pages, checkpoint=checkpoint, on_span=record_span)
+    short_total = final["committed"]
+    assert short_total < left, "the truncated source is not shorter; raise --pages or --kill-at-batch"
+    delete_vector_ids(stale_vector_ids("bench", "bench-shrink", short_total, span["end"]), "bench-shrink")
+    stored = _stored("bench-shrink")
+    assert stored == [f"bench-bench-shrink-{i}" for i in range(short_total)], (len(stored), short_total)
+    print(f"shorter resume ({short_pages} pages): {left} ids before, {short_total} chunks after, "
+          f"none left at or past the new end")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Recall and latency of the local vector store against brute-force search.
+
+Synthetic clustered, L2-normalized vectors (shaped like e5-large-v2 output) are
+written to one document of a LocalVectorStore in a temporary directory. The
+benchmark then runs queries through exact (flat) search and, if hnswlib is
+installed, through HNSW.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_store --vectors 2000 20000 --dim 1024 --queries 200 --top-k 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("VECTOR_STORE", "local")
+
+import numpy as np
+
+from backend_app.core.config import settings
+from backend_app.rag_pipeline import vector_store as vs
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def _dataset(n: int, dim: int, queries: int, rng: np.random.Generator):
+    centers = rng.normal(size=(max(8, n // 100), dim))
+    vectors = _normalize(centers[rng.integers(0, len(centers), n)] + 0.5 * rng.normal(size=(n, dim)))
+    probes = _normalize(centers[rng.integers(0, len(centers), queries)] + 0.5 * rng.normal(size=(queries, dim)))
+    return vectors, probes
+
+
+def _run(store, probes, top_k, truth, **kwargs):
+    latencies, hits = [], 0
+    flt = {"document_id": {"$eq": "bench"}}
+    for probe, expected in zip(probes, truth):
+        started = time.perf_counter()
+        matches = store.query(probe, top_k, flt, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        hits += len({int(m["id"]) for m in matches} & set(expected))
+    ms = np.array(latencies) * 1000
+    return hits / (len(probes) * top_k), np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"dim={args.dim}, top_k={args.top_k}, hnswlib={'yes' if vs.hnswlib else 'no'}")
+    print(f"{'vectors':>8} {'method':>12} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for n in args.vectors:
+        vectors, probes = _dataset(n, args.dim, args.queries, rng)
+
+        # Ground truth and the in-memory brute-force baseline
+        started = time.perf_counter()
+        scores = probes @ vectors.T
+        truth = np.argsort(-scores, axis=1)[:, :args.top_k]
+        brute_ms = (time.perf_counter() - started) * 1000 / len(probes)
+        print(f"{n:>8} {'brute-force':>12} {1.0:>7.3f} {brute_ms:>8.2f} {'':>8}")
+
+        with tempfile.TemporaryDirectory() as root:
+            store = vs.LocalVectorStore(root)
+            for start in range(0, n, 1000):
+                store.upsert([
+                    (str(i), vectors[i], {"document_id": "bench", "chunk_id": i})
+                    for i in range(start, min(start + 1000, n))
+                ])
+
+            recall, p50, p99 = _run(store, probes, args.top_k, truth, exact=True)
+            print(f"{n:>8} {'local flat':>12} {recall:>7.3f} {p50:>8.2f} {p99:>8.2f}")
+
+            if vs.hnswlib is not None:
+                settings.VECTOR_STORE_HNSW_MIN_VECTORS = 1
+                started = time.perf_counter()
+                store.query(probes[0], args.top_k, {"document_id": "bench"})  # builds the graph
+                build_s = time.perf_counter() - started
+                recall, p50, p99 = _run(store, probes, args.top_k, truth)
+                print(f"{n:>8} {'local hnsw':>12} {recall:>7.3f} {p50:>8.2f} {p99:>8.2f}  (build {build_s:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
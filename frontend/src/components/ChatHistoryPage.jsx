@@ -10,6 +10,8 @@ export default function ChatHistoryPage() {
   const [messages, setMessages] = useState([]);
   const [pdfName, setPdfName] = useState("your PDF");
   const [loading, setLoading] = useState(true);
+  // Position of the first loaded message; older ones are fetched on demand
+  const [offset, setOffset] = useState(0);
   const chatEndRef = useRef(null);
 
   useEffect(() => {
@@ -28,6 +30,7 @@ export default function ChatHistoryPage() {
 
         console.log("[DEBUG] Chat response:", response.data);
         setMessages(response.data.messages || []);
+        setOffset(response.data.offset || 0);
         setPdfName(response.data.pdf_name || "your PDF");
         setLoading(false);
       } catch (err) {
@@ -40,9 +43,23 @@ export default function ChatHistoryPage() {
     fetchChat();
   }, [chatId]);
 
+  const loadEarlier = async () => {
+    try {
+      const token = localStorage.getItem("token");
+      const response = await axios.get(
+        `http://127.0.0.1:5000/history/${chatId}`,
+        { headers: { Authorization: `Bearer ${token}` }, params: { before: offset } }
+      );
+      setMessages((prev) => [...(response.data.messages || []), ...prev]);
+      setOffset(response.data.offset || 0);
+    } catch (err) {
+      console.error("[ERROR] Failed to fetch earlier messages:", err);
+    }
+  };
+
   useEffect(() => {
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [messages]);
+  }, [messages.length && messages[messages.length - 1]]);
 
   if (loading) return <div className="p-6">Loading chat...</div>;
 
@@ -65,6 +82,14 @@ export default function ChatHistoryPage() {
       {/* Chat Box */}
       <div className="flex-1 bg-black/75 rounded-xl shadow flex flex-col p-4 overflow-y-auto max-h-[70vh]">
         <h2 className="font-bold text-white text-xl mb-4">{pdfName}</h2>
+        {offset > 0 && (
+          <button
+            onClick={loadEarlier}
+            className="self-center text-sm text-blue-400 hover:text-blue-300 mb-4 cursor-pointer"
+          >
+            Load earlier messages
+          </button>
+        )}
         {messages.map((m, idx) => (
           <ChatMessage key={idx} sender={m.sender} text={m.text} />
         ))}
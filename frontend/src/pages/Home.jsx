@@ -10,19 +10,28 @@ export default function Home({ user }) {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [openMenu, setOpenMenu] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const api = axios.create({ baseURL: "http://127.0.0.1:5000" });
 
+  // Fetch one page of chat summaries; the next page's cursor comes back in a header
+  const fetchChatPage = async (cursor) => {
+    const token = localStorage.getItem("token");
+    const response = await api.get(`/history/user/${user._id}`, {
+      headers: { Authorization: `Bearer ${token}` },
+      params: cursor ? { cursor } : {},
+    });
+    setNextCursor(response.headers["x-next-cursor"] || null);
+    return response.data;
+  };
+
   // Fetch chat history
   useEffect(() => {
     if (!user?._id) return;
     const fetchChatHistory = async () => {
       try {
-        const token = localStorage.getItem("token");
-        const response = await api.get(`/history/user/${user._id}`, {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        setChatHistory(response.data);
+        setChatHistory(await fetchChatPage());
       } catch (err) {
         console.error("Error fetching chat history:", err);
         setError("Failed to fetch chat history");
@@ -33,6 +42,18 @@ export default function Home({ user }) {
     fetchChatHistory();
   }, [user]);
 
+  const loadMoreChats = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await fetchChatPage(nextCursor);
+      setChatHistory((prev) => [...prev, ...page]);
+    } catch (err) {
+      console.error("Error fetching more chat history:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Close dropdown on outside click
   useEffect(() => {
     const handleClickOutside = () => setOpenMenu(null);
@@ -139,6 +160,15 @@ export default function Home({ user }) {
                 </div>
               ))
             )}
+            {nextCursor && !loading && (
+              <button
+                onClick={loadMoreChats}
+                disabled={loadingMore}
+                className="text-sm text-blue-400 hover:text-blue-300 py-2 cursor-pointer"
+              >
+                {loadingMore ? "Loading..." : "Load more"}
+              </button>
+            )}
           </div>
         </div>
 
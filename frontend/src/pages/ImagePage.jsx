@@ -2,6 +2,7 @@ import { Image, FileText } from "lucide-react";
 import { useState } from "react";
 import { useNavigate } from "react-router-dom";
 import axios from "axios";
+import { waitForJob } from "../services/api";
 import Prism from "../Prism";
 
 export default function ImagePage() {
@@ -31,6 +32,7 @@ export default function ImagePage() {
           Authorization: `Bearer ${token}`,
         },
       });
+      await waitForJob(response.data.job_id);
 
       setLoading(false);
       setMessage("Image file processed successfully!");
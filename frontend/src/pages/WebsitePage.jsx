@@ -3,6 +3,7 @@ import { useState } from "react";
 import { useNavigate } from "react-router-dom";
 import Prism from "../Prism";
 import axios from "axios";
+import { waitForJob } from "../services/api";
 
 export default function WebsitePage() {
   const navigate = useNavigate();
@@ -38,6 +39,7 @@ export default function WebsitePage() {
           Authorization: `Bearer ${token}`,
         },
       });
+      await waitForJob(response.data.job_id);
 
       setLoading(false);
       setMessage("URL processed successfully!");
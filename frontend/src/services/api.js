@@ -67,6 +67,20 @@ export const uploadPDF = async (file, url, userId) => {
   return res.data;
 };
 
+// ---------- Ingestion Jobs ----------
+// Uploads are processed in the background; poll until the job settles.
+export const waitForJob = async (jobId, intervalMs = 1500) => {
+  for (;;) {
+    const res = await API.get(`/jobs/${jobId}`);
+    const job = res.data;
+    if (job.status === "succeeded") return job;
+    if (["failed", "cancelled", "interrupted"].includes(job.status)) {
+      throw new Error(job.error || `Processing ${job.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
 // ---------- Query PDF ----------
 export const queryPDF = async (question, topK = 5) => {
   const res = await API.post("/query/", { question, top_k: topK });